@@ -0,0 +1,538 @@
+# Description: End-to-end benchmark of the crawl, parse and ingest pipeline
+# of main.py against a synthetic Discovery API and a scratch SQLite database.
+# Reports requests/sec, rows/sec, peak RSS and the latency of every stage,
+# and stores the results as JSON to compare runs between commits.
+#
+# Usage: python -m benchmarks.run --scale 10k 100k
+#        python -m benchmarks.run --scale 10k --compare benchmarks/results/10k-abc1234.json
+
+import argparse
+import datetime
+import json
+import logging
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from config.constants import DEFAULT_CONCURRENCY
+from config.db.migrations import migrate
+from config.db.models import Event
+from utils.clf_dict import process_json_data
+from utils.helpers import (
+    get_all_attractions,
+    get_all_events,
+    get_all_events_from_db,
+    ingest_all_events,
+    process_data,
+    process_new_data,
+    read_staging,
+)
+from utils.http_client import configure_client
+from utils.mock_server import FIRST_EVENT, MockDiscoveryServer
+from utils.profiling import StageProfiler
+from utils.query_cache import configure_query_cache, get_upcoming_events
+from utils.search import search
+from utils.spatial import find_events_near
+from utils.writers import has_parquet
+
+logger = logging.getLogger(__name__)
+
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+# Records per synthetic subgenre; below the paging depth, so every
+# subgenre is one partition of a few pages.
+RECORDS_PER_SUBGENRE = 500
+# Covers every synthetic event: event i starts i hours after FIRST_EVENT.
+WINDOW = (FIRST_EVENT, FIRST_EVENT + datetime.timedelta(days=30))
+
+STAGES = [
+    "classifications",
+    "crawl_attractions",
+    "crawl_events",
+    "load_attractions",
+    "load_events",
+    "read_events",
+    "merge_events",
+    "ingest_events",
+    "query_nearby",
+    "query_search",
+    "query_upcoming",
+]
+
+# Nearby events lookups per query_nearby run: around the synthetic venues,
+# within a week of the first event.
+NEARBY_QUERIES = 100
+# Typeahead searches per query_search run: the prefixes of synthetic event
+# names, as typed.
+SEARCH_QUERIES = 100
+# Cached upcoming events queries per query_upcoming run, over a day each of
+# the first UPCOMING_DAYS days, so all but the first of every day are hits.
+UPCOMING_QUERIES = 100
+UPCOMING_DAYS = 10
+
+RESULTS_DIR = "./benchmarks/results"
+
+
+def parse_scale(value: str) -> int:
+    """
+    Parse a scale given as a name ("10k", "100k", "1m") or a number of events.
+
+    Args:
+        value (str): The scale.
+
+    Returns:
+        int: The number of events (and of attractions) the API serves.
+
+    Raises:
+        ValueError: If the scale is neither a known name nor a positive number.
+    """
+    if value.lower() in SCALES:
+        return SCALES[value.lower()]
+    if value.isdigit() and int(value) > 0:
+        return int(value)
+    raise ValueError(f"Unknown scale {value}; use one of {list(SCALES)} or a number.")
+
+
+def synthetic_classifications(records: int) -> Dict[str, Dict]:
+    """
+    Build classifications with enough subgenres to hold ``records`` records.
+
+    Args:
+        records (int): The number of records per resource.
+
+    Returns:
+        Dict[str, Dict]: The classifications, in the format of process_json_data,
+        and the number of records of every subgenre.
+    """
+    subgenres = math.ceil(records / RECORDS_PER_SUBGENRE)
+    per_genre = 50
+    genres = []
+    counts = {}
+    for start in range(0, subgenres, per_genre):
+        genre = {"id": f"G{start // per_genre}", "name": "Genre", "subgenres": []}
+        for index in range(start, min(start + per_genre, subgenres)):
+            subgenre_id = f"SG{index}"
+            genre["subgenres"].append({"id": subgenre_id, "name": "Subgenre"})
+            counts[subgenre_id] = min(
+                RECORDS_PER_SUBGENRE, records - index * RECORDS_PER_SUBGENRE
+            )
+        genres.append(genre)
+    return {"segment_json": {"Music-S1": {"genres": genres}}, "counts": counts}
+
+
+def _serve(options: Dict, ports: multiprocessing.Queue, stop) -> None:
+    # Runs in a child process, so serving does not compete with the
+    # pipeline for the GIL.
+    server = MockDiscoveryServer(**options)
+    ports.put(server.server_address[1])
+    server.start()
+    stop.wait()
+    server.stop()
+
+
+@contextmanager
+def mock_api(options: Dict) -> Iterator[str]:
+    """
+    Run a mock Discovery API server in a child process.
+
+    Args:
+        options (Dict): Keyword arguments for MockDiscoveryServer.
+
+    Yields:
+        str: The base URL of the server.
+    """
+    context = multiprocessing.get_context("spawn")
+    ports = context.Queue()
+    stop = context.Event()
+    process = context.Process(target=_serve, args=(options, ports, stop), daemon=True)
+    process.start()
+    try:
+        port = ports.get(timeout=30)
+        yield f"http://127.0.0.1:{port}/discovery/v2"
+    finally:
+        stop.set()
+        process.join(timeout=10)
+
+
+def reset_peak_rss() -> None:
+    """
+    Reset the peak RSS of this process, where the kernel allows it (Linux).
+
+    Returns:
+        None
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb() -> float:
+    """
+    Get the peak RSS of this process since the last reset_peak_rss().
+
+    Falls back to the peak over the process lifetime where /proc is missing.
+
+    Returns:
+        float: The peak RSS in MiB.
+    """
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere.
+    return peak / 1024 / (1024 if platform.system() == "Darwin" else 1)
+
+
+def git_commit() -> Optional[str]:
+    """
+    Get the commit of the working tree, to label the results.
+
+    Returns:
+        str or None: The short commit hash, None outside a git checkout.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class StageTimer:
+    """
+    Measures the stages of one benchmark run.
+
+    Every stage records its wall time, the rows it handled, the HTTP
+    requests sent during it and its peak RSS, and is profiled when a
+    ``profiler`` is given.
+    """
+
+    def __init__(self, profiler: Optional[StageProfiler] = None) -> None:
+        self.profiler = profiler
+        self.requests = 0
+        self.stages: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+
+    def count_request(self, response, *args, **kwargs) -> None:
+        # A requests response hook: counts every response, retries included.
+        with self.lock:
+            self.requests += 1
+
+    def run(self, name: str, stage: Callable[[], int]) -> None:
+        """
+        Run and measure a stage.
+
+        Args:
+            name (str): The stage name.
+            stage (Callable[[], int]): Runs the stage and returns
+                the number of rows it handled.
+
+        Returns:
+            None
+        """
+        reset_peak_rss()
+        requests = self.requests
+        start = time.perf_counter()
+        if self.profiler is None:
+            rows = stage()
+        else:
+            with self.profiler.profile(name):
+                rows = stage()
+        seconds = time.perf_counter() - start
+        requests = self.requests - requests
+
+        self.stages[name] = {
+            "seconds": round(seconds, 4),
+            "rows": rows,
+            "rows_per_second": round(rows / seconds, 1) if rows else None,
+            "requests": requests,
+            "requests_per_second": round(requests / seconds, 1) if requests else None,
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
+        logger.info("%s: %s", name, self.stages[name])
+
+
+def run_benchmark(
+    records: int,
+    work_dir: str,
+    stages: List[str] = STAGES,
+    staging: str = "parquet",
+    concurrency: int = DEFAULT_CONCURRENCY,
+    parse_workers: int = 0,
+    latency: float = 0.0,
+    error_rate: float = 0.0,
+    throttle_rate: float = 0.0,
+    profile_dir: Optional[str] = None,
+) -> Dict:
+    """
+    Run the pipeline of main.py once against a synthetic API.
+
+    Args:
+        records (int): The number of events, and of attractions, the API serves.
+        work_dir (str): A scratch directory for the databases and staging files.
+        stages (List[str]): The stages to measure, in pipeline order.
+        staging (str): The staging format, "parquet" or "csv".
+        concurrency (int): The maximum number of requests in flight at once.
+        parse_workers (int): The number of processes parsing pages.
+        latency (float): The latency the mock API adds to every request.
+        error_rate (float): The share of requests the mock API fails with a 500.
+        throttle_rate (float): The share of requests the mock API throttles.
+        profile_dir (str, optional): Profile every stage into this directory.
+
+    Returns:
+        Dict: The results: the configuration, and the measures per stage.
+    """
+    synthetic = synthetic_classifications(records)
+    extension = ".parquet" if staging == "parquet" else ".csv"
+    attractions_file = os.path.join(work_dir, "attractions" + extension)
+    events_file = os.path.join(work_dir, "events" + extension)
+    engine = create_engine(f"sqlite:///{os.path.join(work_dir, 'database.db')}")
+    migrate(engine)
+    Session = sessionmaker(bind=engine)
+    direct_engine = create_engine(f"sqlite:///{os.path.join(work_dir, 'direct.db')}")
+    migrate(direct_engine)
+
+    timer = StageTimer(StageProfiler(profile_dir) if profile_dir else None)
+    client = configure_client(rate_per_second=None, daily_quota=None, backoff_max=0.1)
+    client.session.hooks["response"].append(timer.count_request)
+    server = {
+        "segment_json": synthetic["segment_json"],
+        "records_per_subgenre": synthetic["counts"],
+        "latency": latency,
+        "error_rate": error_rate,
+        "throttle_rate": throttle_rate,
+        "retry_after": 0.01,
+    }
+    crawl = {"concurrency": concurrency, "client": client}
+    events = {"start_date": WINDOW[0], "end_date": WINDOW[1]}
+    info = synthetic["segment_json"]
+    db_events = None
+
+    def classifications() -> int:
+        return len(process_json_data("key", crawl["base_url"]))
+
+    def crawl_attractions() -> int:
+        get_all_attractions(
+            "key",
+            info,
+            file_path=attractions_file,
+            parse_workers=parse_workers,
+            **crawl,
+        )
+        return len(read_staging(attractions_file, "attractions", columns=["name"]))
+
+    def crawl_events() -> int:
+        get_all_events(
+            "key",
+            info,
+            file_path=events_file,
+            parse_workers=parse_workers,
+            **crawl,
+            **events,
+        )
+        return len(read_staging(events_file, "events", columns=["name"]))
+
+    def load_attractions() -> int:
+        return process_new_data(
+            engine, attractions_file, "attraction_id", "attractions"
+        )
+
+    def load_events() -> int:
+        return process_new_data(engine, events_file, "event_id", "events")
+
+    def read_events() -> int:
+        nonlocal db_events
+        db_events = get_all_events_from_db(Session)
+        return len(db_events)
+
+    def merge_events() -> int:
+        if db_events is None:
+            read_events()
+        process_data(db_events, engine, events_file, "event_id", "events")
+        return len(db_events)
+
+    def ingest_events() -> int:
+        ingest_all_events(
+            "key", info, direct_engine, parse_workers=parse_workers, **crawl, **events
+        )
+        # The rows stored, so dropped or duplicated records show.
+        with direct_engine.connect() as connection:
+            return connection.scalar(select(func.count()).select_from(Event))
+
+    def query_nearby() -> int:
+        DirectSession = sessionmaker(bind=direct_engine)
+        week = (FIRST_EVENT.date(), FIRST_EVENT.date() + datetime.timedelta(days=6))
+        for i in range(NEARBY_QUERIES):
+            find_events_near(
+                DirectSession, 40.75, -73.99 + 0.01 * (i % 70), 10, week, limit=50
+            )
+        return NEARBY_QUERIES
+
+    def query_search() -> int:
+        DirectSession = sessionmaker(bind=direct_engine)
+        for i in range(SEARCH_QUERIES):
+            name = f"Event SG{i % 20}-{i * 7 % RECORDS_PER_SUBGENRE}"
+            search(DirectSession, name[: 9 + i % (len(name) - 8)])
+        return SEARCH_QUERIES
+
+    def query_upcoming() -> int:
+        DirectSession = sessionmaker(bind=direct_engine)
+        configure_query_cache()
+        for i in range(UPCOMING_QUERIES):
+            day = FIRST_EVENT.date() + datetime.timedelta(days=i % UPCOMING_DAYS)
+            get_upcoming_events(DirectSession, "Music", start_date=day, limit=50)
+        return UPCOMING_QUERIES
+
+    pipeline = {
+        "classifications": classifications,
+        "crawl_attractions": crawl_attractions,
+        "crawl_events": crawl_events,
+        "load_attractions": load_attractions,
+        "load_events": load_events,
+        "read_events": read_events,
+        "merge_events": merge_events,
+        "ingest_events": ingest_events,
+        "query_nearby": query_nearby,
+        "query_search": query_search,
+        "query_upcoming": query_upcoming,
+    }
+
+    with mock_api(server) as base_url:
+        crawl["base_url"] = base_url
+        start = time.perf_counter()
+        for name in STAGES:
+            if name in stages:
+                timer.run(name, pipeline[name])
+        total = time.perf_counter() - start
+
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.utcnow().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "records": records,
+        "config": {
+            "staging": staging,
+            "concurrency": concurrency,
+            "parse_workers": parse_workers,
+            "latency": latency,
+            "error_rate": error_rate,
+            "throttle_rate": throttle_rate,
+        },
+        "total_seconds": round(total, 4),
+        "requests": timer.requests,
+        "stages": timer.stages,
+    }
+
+
+def compare(results: Dict, baseline: Dict) -> List[str]:
+    """
+    Compare the stage latencies of two runs.
+
+    Args:
+        results (Dict): The results of this run.
+        baseline (Dict): The results of the run to compare against.
+
+    Returns:
+        List[str]: One line per stage both runs measured.
+    """
+    lines = [f"{'stage':<20}{'baseline s':>12}{'this run s':>12}{'change':>10}"]
+    for name, stage in results["stages"].items():
+        before = baseline["stages"].get(name)
+        if before is None:
+            continue
+        change = (stage["seconds"] - before["seconds"]) / max(before["seconds"], 1e-9)
+        lines.append(
+            f"{name:<20}{before['seconds']:>12.3f}{stage['seconds']:>12.3f}{change:>+10.1%}"
+        )
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the crawl pipeline")
+    parser.add_argument(
+        "--scale",
+        nargs="+",
+        default=["10k"],
+        help="Events (and attractions) to crawl: 10k, 100k, 1m or a number.",
+    )
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument(
+        "--staging",
+        choices=["parquet", "csv"],
+        default="parquet" if has_parquet() else "csv",
+    )
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--parse-workers", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--profile",
+        default=None,
+        metavar="DIR",
+        help="Profile every stage into DIR/<scale>, as python main.py --profile does.",
+    )
+    parser.add_argument(
+        "--output",
+        default=RESULTS_DIR,
+        help="Directory the results are written to, as <scale>-<commit>.json.",
+    )
+    parser.add_argument(
+        "--compare", default=None, help="Results file of a run to compare against."
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+
+    os.makedirs(args.output, exist_ok=True)
+    for scale in args.scale:
+        records = parse_scale(scale)
+        with tempfile.TemporaryDirectory() as work_dir:
+            results = run_benchmark(
+                records,
+                work_dir,
+                stages=args.stages,
+                staging=args.staging,
+                concurrency=args.concurrency,
+                parse_workers=args.parse_workers,
+                latency=args.latency,
+                error_rate=args.error_rate,
+                throttle_rate=args.throttle_rate,
+                profile_dir=(
+                    os.path.join(args.profile, scale.lower()) if args.profile else None
+                ),
+            )
+        path = os.path.join(
+            args.output, f"{scale.lower()}-{results['commit'] or 'local'}.json"
+        )
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+        print(f"{scale}: {results['total_seconds']:.2f}s, results in {path}")
+
+        if args.compare:
+            with open(args.compare, encoding="utf-8") as file:
+                print("\n".join(compare(results, json.load(file))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# Description: Constants shared by the crawler, the fetchers and the entry point.
+
+import datetime
+
+# Ticketmaster Discovery API
+BASE_URL = "https://app.ticketmaster.com/discovery/v2"
+PAGE_SIZE = 200
+REQUEST_TIMEOUT = 360
+
+# The Discovery API refuses to page past size * page >= 1000.
+MAX_PAGING_DEPTH = 1000
+
+# Events are crawled from today until the end of the day this many days
+# ahead. Date windows holding more events than the paging limit are split
+# in half down to MIN_DATE_WINDOW.
+EVENT_WINDOW_DAYS = 14
+MIN_DATE_WINDOW = datetime.timedelta(hours=1)
+
+# Number of requests the crawler keeps in flight at once.
+DEFAULT_CONCURRENCY = 8
+
+# Shared HTTP client. Ticketmaster allows 5 requests per second and 5000
+# requests per day for every API key.
+RATE_LIMIT_PER_SECOND = 5
+DAILY_QUOTA = 5000
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 60.0
+# Longer Retry-After waits, e.g. for an exhausted daily quota, fail instead.
+RETRY_AFTER_MAX = 300.0
+POOL_SIZE = 32
+
+# On-disk response cache. TTLs are in seconds per Discovery API endpoint;
+# endpoints without a TTL are never cached.
+CACHE_PATH = "./data/cache/responses.sqlite"
+CACHE_MAX_BYTES = 2 * 1024**3
+CACHE_TTLS = {
+    "classifications": 24 * 3600,
+    "attractions": 6 * 3600,
+    "events": 3600,
+}
+
+# Work queue leases: a claimed partition is reclaimed by another worker when
+# its lease is not renewed for WORK_LEASE_SECONDS, and marked failed after
+# WORK_MAX_ATTEMPTS claims.
+WORK_LEASE_SECONDS = 300
+WORK_MAX_ATTEMPTS = 3
+
+# Rows per INSERT ... ON CONFLICT batch when ingesting straight into the database.
+INGEST_BATCH_SIZE = 5000
+
+# Pages of records queued between a crawl and its database writer thread.
+INGEST_QUEUE_SIZE = 8
+
+# Rows read at a time when loading a staging file into the database.
+STAGING_CHUNK_SIZE = 50_000
+
+# Bloom filter used for crawl-time dedup with --dedup bloom: the number of
+# IDs it is sized for and the false-positive rate at that size.
+DEDUP_CAPACITY = 10_000_000
+DEDUP_ERROR_RATE = 0.001
+
+# Raw staging files
+ATTRACTIONS_CSV = "./data/raw_data/attraction.csv"
+EVENTS_CSV = "./data/raw_data/events.csv"
+ATTRACTIONS_PARQUET = "./data/raw_data/attractions.parquet"
+EVENTS_PARQUET = "./data/raw_data/events.parquet"
+
+# Rows per Parquet row group, and the compression codec of the files.
+PARQUET_ROW_GROUP_SIZE = 50_000
+PARQUET_COMPRESSION = "zstd"
+# Row groups per Parquet part file. A part is published, and the crawl
+# progress it holds checkpointed, once it is full.
+PARQUET_ROW_GROUPS_PER_PART = 4
+
+# Profiling mode (--profile): seconds between stack samples of all threads,
+# the number of functions and allocators listed per stage, and the frames
+# tracemalloc keeps per allocation. Every extra frame slows tracing down a
+# lot; 1 attributes allocations to the line that made them.
+PROFILE_SAMPLE_INTERVAL = 0.005
+PROFILE_TOP = 25
+PROFILE_TRACE_FRAMES = 1
+
+# Read-side query cache: the results kept, least recently used evicted
+# first, and the seconds a result is served before it is read again even
+# if no ingest invalidated it.
+QUERY_CACHE_MAX_ENTRIES = 1024
+QUERY_CACHE_TTL = 300.0
@@ -0,0 +1,352 @@
+# Description: In-place schema migrations for existing SQLite databases.
+# The schema version is kept in SQLite's PRAGMA user_version.
+
+import logging
+from typing import Callable, List, Tuple
+
+from sqlalchemy import (
+    Column,
+    Date,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    Time,
+    inspect,
+    text,
+)
+from sqlalchemy.engine import Connection, Engine
+
+from config.db.models import (
+    SEARCH_INDEX_DDL,
+    Base,
+    Event,
+    EventAttraction,
+    EventDma,
+    Venue,
+)
+from utils.links import store_event_links
+from utils.search import index_rows
+
+logger = logging.getLogger(__name__)
+
+# The events table as of version 1, which migration 1 converts to; the
+# venue columns moved to the venues table in version 3.
+EVENTS_V1 = Table(
+    "events",
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("name", String),
+    Column("type", String),
+    Column("event_id", String, index=True, unique=True),
+    Column("event_url", String),
+    Column("event_image", String),
+    Column("event_date", Date, index=True),
+    Column("event_time", Time),
+    Column("timezone", String),
+    Column("segment", String),
+    Column("genre", String),
+    Column("sub_genre", String),
+    Column("currency", String),
+    Column("price_range_min", Float),
+    Column("price_range_max", Float),
+    Column("age_restriction", String),
+    Column("venue_name", String),
+    Column("venue_city", String, index=True),
+    Column("venue_state", String),
+    Column("venue_country", String),
+    Column("venue_address", String),
+    Column("longitude", Float),
+    Column("latitude", Float),
+    Column("dmas", String),
+    Column("attractions", String),
+    Index("ix_events_segment_genre", "segment", "genre"),
+)
+
+# The attractions table as of version 1, whose indexes migration 1 adds.
+ATTRACTIONS_V1 = Table(
+    "attractions",
+    MetaData(),
+    Column("name", String),
+    Column("attraction_id", String, primary_key=True),
+    Column("attraction_type", String),
+    Column("attraction_url", String),
+    Column("attraction_image", String),
+    Column("segment", String),
+    Column("genre", String),
+    Column("sub_genre", String),
+    Index("ix_attractions_segment_genre", "segment", "genre"),
+)
+
+# The venues table as of version 3, before it got an integer id for the
+# venue_locations R*Tree in version 4.
+VENUES_V3 = Table(
+    "venues",
+    MetaData(),
+    Column("venue_id", String, primary_key=True),
+    Column("venue_name", String),
+    Column("venue_city", String, index=True),
+    Column("venue_state", String),
+    Column("venue_country", String),
+    Column("venue_address", String),
+    Column("longitude", Float),
+    Column("latitude", Float),
+)
+
+# The events table as of version 3, referencing the venues table; version
+# 4 replaced the venue_id index with one on (venue_id, event_date).
+EVENTS_V3 = Table(
+    "events",
+    VENUES_V3.metadata,
+    Column("id", Integer, primary_key=True),
+    Column("name", String),
+    Column("type", String),
+    Column("event_id", String, index=True, unique=True),
+    Column("event_url", String),
+    Column("event_image", String),
+    Column("event_date", Date, index=True),
+    Column("event_time", Time),
+    Column("timezone", String),
+    Column("segment", String),
+    Column("genre", String),
+    Column("sub_genre", String),
+    Column("currency", String),
+    Column("price_range_min", Float),
+    Column("price_range_max", Float),
+    Column("age_restriction", String),
+    Column("venue_id", String, ForeignKey("venues.venue_id"), index=True),
+    Column("dmas", String),
+    Column("attractions", String),
+    Index("ix_events_segment_genre", "segment", "genre"),
+)
+
+
+def _nullable_text(column: str) -> str:
+    return f"NULLIF(NULLIF(TRIM({column}), ''), 'None')"
+
+
+def _rename_events(connection: Connection) -> None:
+    connection.execute(text("ALTER TABLE events RENAME TO events_old"))
+    for index in inspect(connection).get_indexes("events_old"):
+        connection.execute(text(f'DROP INDEX IF EXISTS "{index["name"]}"'))
+
+
+def _typed_columns_and_indexes(connection: Connection) -> None:
+    """
+    Rebuild the events table with typed columns and a unique event_id, and
+    add the secondary indexes.
+
+    Duplicate event_ids keep their most recently inserted row. Values that do
+    not convert (e.g. "None") become NULL.
+    """
+    _rename_events(connection)
+    EVENTS_V1.create(connection)
+
+    columns = [column.name for column in EVENTS_V1.columns]
+    casts = {
+        "price_range_min": "REAL",
+        "price_range_max": "REAL",
+        "longitude": "REAL",
+        "latitude": "REAL",
+    }
+    select = []
+    for column in columns:
+        if column in casts:
+            select.append(f"CAST({_nullable_text(column)} AS {casts[column]})")
+        elif column in ("event_date", "event_time"):
+            select.append(_nullable_text(column))
+        else:
+            select.append(column)
+
+    connection.execute(
+        text(
+            f"INSERT INTO events ({', '.join(columns)}) "
+            f"SELECT {', '.join(select)} FROM events_old "
+            "WHERE id IN (SELECT MAX(id) FROM events_old "
+            "WHERE event_id IS NOT NULL GROUP BY event_id)"
+        )
+    )
+    dropped = connection.execute(
+        text("SELECT (SELECT COUNT(*) FROM events_old) - (SELECT COUNT(*) FROM events)")
+    ).scalar()
+    connection.execute(text("DROP TABLE events_old"))
+
+    for index in ATTRACTIONS_V1.indexes:
+        index.create(connection, checkfirst=True)
+
+    logger.info("Converted the events table; %s duplicate rows dropped.", dropped)
+
+
+def _event_links(connection: Connection) -> None:
+    """
+    Create the event_attractions and event_dmas link tables and fill them
+    from the joined attractions and dmas columns of the stored events.
+    """
+    for model in (EventAttraction, EventDma):
+        model.__table__.create(connection, checkfirst=True)
+
+    result = connection.execute(text("SELECT event_id, attractions, dmas FROM events"))
+    linked = 0
+    while True:
+        rows = result.mappings().fetchmany(5000)
+        if not rows:
+            break
+        store_event_links(connection, [dict(row) for row in rows])
+        linked += len(rows)
+    logger.info("Linked the attractions and DMAs of %s events.", linked)
+
+
+def _venues(connection: Connection) -> None:
+    """
+    Move the venue columns of the events table into the venues table, which
+    the events reference by venue_id.
+
+    The stored events carry no Ticketmaster venue ID, so every distinct
+    venue gets the ID "legacy-<n>"; the next crawl of an event points it at
+    its real venue.
+    """
+    venue = ", ".join(
+        column.name for column in VENUES_V3.columns if column.name != "venue_id"
+    )
+    VENUES_V3.create(connection, checkfirst=True)
+    _rename_events(connection)
+    EVENTS_V3.create(connection)
+
+    connection.execute(
+        text(
+            f"INSERT INTO venues (venue_id, {venue}) "
+            f"SELECT 'legacy-' || MIN(id), {venue} FROM events_old "
+            f"WHERE COALESCE({venue}) IS NOT NULL GROUP BY {venue}"
+        )
+    )
+    columns = ", ".join(
+        column.name for column in EVENTS_V3.columns if column.name != "venue_id"
+    )
+    connection.execute(
+        text(
+            f"INSERT INTO events ({columns}, venue_id) "
+            f"SELECT {columns}, CASE WHEN COALESCE({venue}) IS NULL THEN NULL "
+            f"ELSE 'legacy-' || MIN(id) OVER (PARTITION BY {venue}) END "
+            "FROM events_old"
+        )
+    )
+    connection.execute(text("DROP TABLE events_old"))
+    venues = connection.execute(text("SELECT COUNT(*) FROM venues")).scalar()
+    logger.info("Moved %s venues out of the events table.", venues)
+
+
+def _venue_locations(connection: Connection) -> None:
+    """
+    Rebuild the venues table with an integer id, index the venue
+    coordinates in the venue_locations R*Tree and index the events by venue
+    and date.
+    """
+    # Keep the foreign key of the events pointing at "venues".
+    connection.execute(text("PRAGMA legacy_alter_table = ON"))
+    connection.execute(text("ALTER TABLE venues RENAME TO venues_old"))
+    connection.execute(text("PRAGMA legacy_alter_table = OFF"))
+    for index in inspect(connection).get_indexes("venues_old"):
+        connection.execute(text(f'DROP INDEX IF EXISTS "{index["name"]}"'))
+    # Creates the R*Tree, and the triggers filling it as the rows are copied.
+    Venue.__table__.create(connection)
+
+    columns = ", ".join(column.name for column in VENUES_V3.columns)
+    connection.execute(
+        text(f"INSERT INTO venues ({columns}) SELECT {columns} FROM venues_old")
+    )
+    connection.execute(text("DROP TABLE venues_old"))
+    connection.execute(text("DROP INDEX IF EXISTS ix_events_venue_id"))
+    for index in Event.__table__.indexes:
+        index.create(connection, checkfirst=True)
+    located = connection.execute(text("SELECT COUNT(*) FROM venue_locations")).scalar()
+    logger.info("Indexed the locations of %s venues.", located)
+
+
+def _search_index(connection: Connection) -> None:
+    """
+    Create the search_index full-text table and index the names and genres
+    of the stored events, attractions and venues.
+    """
+    connection.exec_driver_sql(SEARCH_INDEX_DDL)
+    sources = (
+        ("event", "events", "event_id, name, segment, genre, sub_genre"),
+        ("attraction", "attractions", "attraction_id, name, segment, genre, sub_genre"),
+        ("venue", "venues", "venue_id, venue_name"),
+    )
+    for kind, table, columns in sources:
+        if not inspect(connection).has_table(table):
+            continue
+        result = connection.execute(text(f"SELECT {columns} FROM {table}"))
+        indexed = 0
+        while True:
+            rows = result.mappings().fetchmany(5000)
+            if not rows:
+                break
+            indexed += index_rows(connection, kind, [dict(row) for row in rows])
+        logger.info("Indexed %s %ss for search.", indexed, kind)
+
+
+# Ordered (version, migration) pairs. A database at version N runs every
+# migration with a higher version.
+MIGRATIONS: List[Tuple[int, Callable[[Connection], None]]] = [
+    (1, _typed_columns_and_indexes),
+    (2, _event_links),
+    (3, _venues),
+    (4, _venue_locations),
+    (5, _search_index),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(connection: Connection) -> int:
+    """
+    Get the schema version stored in the database.
+
+    Args:
+        connection (Connection): A connection to the database.
+
+    Returns:
+        int: The schema version, 0 for databases never migrated.
+    """
+    return connection.execute(text("PRAGMA user_version")).scalar()
+
+
+def migrate(engine: Engine) -> None:
+    """
+    Bring the database schema up to date.
+
+    Pending migrations of an existing database run in one transaction, then
+    tables that do not exist yet are created. New databases are created
+    directly at the latest version.
+
+    Args:
+        engine (Engine): The SQLAlchemy engine object.
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: If the database is not SQLite.
+    """
+    if engine.dialect.name != "sqlite":
+        raise ValueError(f"Migrations are not supported for {engine.dialect.name}.")
+
+    with engine.connect() as connection:
+        # pysqlite does not open transactions for DDL on its own.
+        connection.exec_driver_sql("BEGIN")
+        try:
+            version = get_schema_version(connection)
+            if inspect(connection).has_table("events"):
+                for target, migration in MIGRATIONS:
+                    if target > version:
+                        logger.info("Migrating the database to version %s...", target)
+                        migration(connection)
+            Base.metadata.create_all(connection)
+            connection.execute(text(f"PRAGMA user_version = {SCHEMA_VERSION}"))
+        except Exception:
+            connection.rollback()
+            raise
+        connection.commit()
@@ -1,6 +1,19 @@
+import datetime
 from typing import List
 
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import (
+    DDL,
+    Column,
+    Date,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Time,
+    event,
+)
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -8,36 +21,115 @@ Base = declarative_base()
 
 class Event(Base):
     """
-    Represents an event in the database.
+    Represents an event in the database. Its venue is stored once in the
+    venues table.
     """
 
     __tablename__ = "events"
+    __table_args__ = (
+        Index("ix_events_segment_genre", "segment", "genre"),
+        # Serves the events of a venue, also within a date range.
+        Index("ix_events_venue_date", "venue_id", "event_date"),
+    )
 
     id: int = Column(Integer, primary_key=True)
     name: str = Column(String)
     type: str = Column(String)
-    event_id: str = Column(String)
+    event_id: str = Column(String, index=True, unique=True)
     event_url: str = Column(String)
     event_image: str = Column(String)
-    event_date: str = Column(String)
-    event_time: str = Column(String)
+    event_date: datetime.date = Column(Date, index=True)
+    event_time: datetime.time = Column(Time)
     timezone: str = Column(String)
     segment: str = Column(String)
     genre: str = Column(String)
     sub_genre: str = Column(String)
     currency: str = Column(String)
-    price_range_min: str = Column(String)
-    price_range_max: str = Column(String)
+    price_range_min: float = Column(Float)
+    price_range_max: float = Column(Float)
     age_restriction: str = Column(String)
+    venue_id: str = Column(String, ForeignKey("venues.venue_id"))
+    dmas: str = Column(String)
+    attractions: str = Column(String)
+
+
+class EventAttraction(Base):
+    """
+    Links an event to one of its attractions.
+
+    The primary key serves event -> attraction lookups and the index
+    attraction -> event lookups.
+    """
+
+    __tablename__ = "event_attractions"
+    __table_args__ = (
+        Index("ix_event_attractions_attraction", "attraction_id", "event_id"),
+    )
+
+    event_id: str = Column(String, primary_key=True)
+    attraction_id: str = Column(String, primary_key=True)
+
+
+class EventDma(Base):
+    """
+    Links an event to one of the DMAs (designated market areas) of its venue.
+    """
+
+    __tablename__ = "event_dmas"
+    __table_args__ = (Index("ix_event_dmas_dma", "dma_id", "event_id"),)
+
+    event_id: str = Column(String, primary_key=True)
+    dma_id: int = Column(Integer, primary_key=True)
+
+
+class Venue(Base):
+    """
+    Represents a venue in the database, shared by all of its events.
+
+    On SQLite its coordinates are indexed in the venue_locations R*Tree,
+    keyed by the integer id.
+    """
+
+    __tablename__ = "venues"
+
+    id: int = Column(Integer, primary_key=True)
+    venue_id: str = Column(String, index=True, unique=True)
     venue_name: str = Column(String)
-    venue_city: str = Column(String)
+    venue_city: str = Column(String, index=True)
     venue_state: str = Column(String)
     venue_country: str = Column(String)
     venue_address: str = Column(String)
-    longitude: str = Column(String)
-    latitude: str = Column(String)
-    dmas: str = Column(String)
-    attractions: str = Column(String)
+    longitude: float = Column(Float)
+    latitude: float = Column(Float)
+
+
+# The R*Tree holds a point per venue with coordinates, as a box of zero
+# size; the triggers keep it in step with every write to the venues table.
+VENUE_LOCATIONS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS venue_locations USING rtree("
+    "id, min_latitude, max_latitude, min_longitude, max_longitude)",
+    "CREATE TRIGGER IF NOT EXISTS venue_locations_insert AFTER INSERT ON venues "
+    "WHEN NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL BEGIN "
+    "INSERT INTO venue_locations VALUES "
+    "(NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude); END",
+    "CREATE TRIGGER IF NOT EXISTS venue_locations_update "
+    "AFTER UPDATE OF latitude, longitude ON venues BEGIN "
+    "DELETE FROM venue_locations WHERE id = OLD.id; "
+    "INSERT INTO venue_locations SELECT "
+    "NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude "
+    "WHERE NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL; END",
+    "CREATE TRIGGER IF NOT EXISTS venue_locations_delete AFTER DELETE ON venues "
+    "BEGIN DELETE FROM venue_locations WHERE id = OLD.id; END",
+]
+for statement in VENUE_LOCATIONS_DDL:
+    event.listen(
+        Venue.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite")
+    )
+event.listen(
+    Venue.__table__,
+    "after_drop",
+    DDL("DROP TABLE IF EXISTS venue_locations").execute_if(dialect="sqlite"),
+)
 
 
 class Attraction(Base):
@@ -46,6 +138,7 @@ class Attraction(Base):
     """
 
     __tablename__ = "attractions"
+    __table_args__ = (Index("ix_attractions_segment_genre", "segment", "genre"),)
 
     name: str = Column(String)
     attraction_id: str = Column(String, primary_key=True)
@@ -55,3 +148,77 @@ class Attraction(Base):
     segment: str = Column(String)
     genre: str = Column(String)
     sub_genre: str = Column(String)
+
+
+# The full-text index over the names of events, attractions and venues and
+# the genres of events and attractions, filled by the ingest paths (see
+# utils/search.py). Prefix indexes of 2 and 3 characters serve typeahead.
+SEARCH_INDEX_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+    "name, genre, kind UNINDEXED, key UNINDEXED, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+for model in (Event, Attraction, Venue):
+    event.listen(
+        model.__table__,
+        "after_create",
+        DDL(SEARCH_INDEX_DDL).execute_if(dialect="sqlite"),
+    )
+
+
+class CrawlState(Base):
+    """
+    Represents the progress of one crawl partition, so an interrupted crawl
+    can resume where it stopped.
+    """
+
+    __tablename__ = "crawl_state"
+
+    id: int = Column(Integer, primary_key=True)
+    partition_key: str = Column(String, nullable=False, unique=True)
+    resource: str = Column(String, nullable=False, index=True)
+    segment_id: str = Column(String)
+    genre_id: str = Column(String)
+    subgenre_id: str = Column(String)
+    last_page: int = Column(Integer, nullable=False, default=-1)
+    records: int = Column(Integer, nullable=False, default=0)
+    status: str = Column(String, nullable=False, default="pending")
+    updated_at: datetime.datetime = Column(DateTime, default=datetime.datetime.utcnow)
+
+
+class WorkItem(Base):
+    """
+    Represents a crawl partition published to the work queue, claimed by
+    one worker at a time under a lease.
+    """
+
+    __tablename__ = "work_queue"
+    __table_args__ = (Index("ix_work_queue_claim", "queue", "status", "id"),)
+
+    id: int = Column(Integer, primary_key=True)
+    queue: str = Column(String, nullable=False)
+    partition_key: str = Column(String, nullable=False, unique=True)
+    payload: str = Column(String, nullable=False)
+    status: str = Column(String, nullable=False, default="pending")
+    attempts: int = Column(Integer, nullable=False, default=0)
+    lease_owner: str = Column(String)
+    # Seconds since the epoch, so leases compare the same on every node.
+    lease_expires_at: float = Column(Float)
+    last_error: str = Column(String)
+    updated_at: datetime.datetime = Column(DateTime, default=datetime.datetime.utcnow)
+
+
+class CacheGeneration(Base):
+    """
+    Counts the writes to one partition of a table, the events or
+    attractions of a segment in a month, so cached query results know when
+    they are stale.
+    """
+
+    __tablename__ = "cache_generations"
+
+    table_name: str = Column(String, primary_key=True)
+    segment: str = Column(String, primary_key=True)
+    # "YYYY-MM" of the event date; "" for attractions and undated events.
+    month: str = Column(String, primary_key=True)
+    generation: int = Column(Integer, nullable=False, default=0)
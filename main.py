@@ -1,28 +1,47 @@
+import argparse
 import datetime
 import logging
+from contextlib import contextmanager
+from functools import partial
+from typing import Iterator, Optional, Tuple
 
 from sqlalchemy import create_engine
 from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
 
-from config.db.models import Base
+from config.constants import (
+    ATTRACTIONS_CSV,
+    ATTRACTIONS_PARQUET,
+    BASE_URL,
+    CACHE_PATH,
+    EVENT_WINDOW_DAYS,
+    EVENTS_CSV,
+    EVENTS_PARQUET,
+)
+from config.db.migrations import migrate
 from config.environments import load_environment_variables
+from utils.cache import ResponseCache
 from utils.clf_dict import process_json_data
 from utils.helpers import (
-    process_data,
     check_tables_exist,
-    get_all_attractions,
-    get_all_attractions_from_db,
-    get_all_events,
-    get_all_events_from_db,
+    publish_crawl,
+    refresh_stages,
+    run_workers,
 )
+from utils.http_client import configure_client
+from utils.metrics import configure_metrics, get_metrics
+from utils.mock_server import FixtureStore
+from utils.orchestrator import run_stages
+from utils.profiling import StageProfiler
+from utils.writers import has_parquet
 
 logger = logging.getLogger(__name__)
 
 
 def create_tables(engine_: Engine) -> None:
     """
-    Create tables in the database if they do not already exist.
+    Create tables in the database if they do not already exist, and migrate
+    existing databases to the current schema.
 
     Args:
         engine (Engine): The SQLAlchemy engine object.
@@ -30,16 +49,148 @@ def create_tables(engine_: Engine) -> None:
     Returns:
         None
     """
-    if not check_tables_exist(engine_):
-        Base.metadata.create_all(engine_)
+    tables_exist = check_tables_exist(engine_)
+    migrate(engine_)
+    if not tables_exist:
         logger.info("Tables created successfully.")
     else:
         logger.info("Tables already exist.")
 
 
+@contextmanager
+def stage(name: str, profiler: Optional[StageProfiler] = None) -> Iterator[None]:
+    """
+    Time a pipeline stage, and profile it in profiling mode.
+
+    Args:
+        name (str): The stage name.
+        profiler (StageProfiler, optional): The profiler, None unless profiling.
+
+    Yields:
+        None
+    """
+    with get_metrics().stage(name):
+        if profiler is None:
+            yield
+        else:
+            with profiler.profile(name):
+                yield
+
+
+def event_window(
+    now: Optional[datetime.datetime] = None,
+) -> Tuple[datetime.datetime, datetime.datetime]:
+    """
+    Get the window of events to crawl: from the start of today (UTC) to the
+    end of the day EVENT_WINDOW_DAYS later.
+
+    Args:
+        now (datetime.datetime, optional): The current time (UTC), now by default.
+
+    Returns:
+        Tuple[datetime.datetime, datetime.datetime]: The start and end dates.
+    """
+    now = now or datetime.datetime.utcnow()
+    start = datetime.datetime.combine(now.date(), datetime.time())
+    end = start + datetime.timedelta(
+        days=EVENT_WINDOW_DAYS, hours=23, minutes=59, seconds=59
+    )
+    return start, end
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parse the command line arguments.
+
+    Returns:
+        argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Ticketmaster API crawler")
+    parser.add_argument(
+        "--ingest",
+        choices=["direct", "csv"],
+        default="direct",
+        help="Upsert crawled records straight into the database (direct) or "
+        "stage them in CSV files and load those afterwards (csv).",
+    )
+    parser.add_argument(
+        "--staging",
+        choices=["parquet", "csv"],
+        default="parquet" if has_parquet() else "csv",
+        help="Format of the staging files written with --ingest csv: typed, "
+        "compressed Parquet datasets (needs pyarrow) or CSV files.",
+    )
+    parser.add_argument(
+        "--parse-workers",
+        type=int,
+        default=0,
+        help="Number of processes decoding and extracting API pages; "
+        "0 parses on the crawling thread.",
+    )
+    parser.add_argument(
+        "--dedup",
+        choices=["set", "bloom"],
+        default="set",
+        help="Drop records already crawled from another partition with an "
+        "exact set (set) or a fixed-size Bloom filter for very large crawls (bloom).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Publish the crawl to the work queue in the database and crawl it "
+        "with this many worker processes, sharing the rate limit.",
+    )
+    parser.add_argument(
+        "--join",
+        action="store_true",
+        help="Only run workers on the queues another machine published.",
+    )
+    parser.add_argument(
+        "--base-url",
+        default=BASE_URL,
+        help="Discovery API base URL, e.g. a mock server started with "
+        "python -m utils.mock_server.",
+    )
+    parser.add_argument(
+        "--record",
+        default=None,
+        metavar="DIR",
+        help="Record every API response fetched into this directory, for "
+        "replay by python -m utils.mock_server --replay DIR.",
+    )
+    parser.add_argument(
+        "--metrics",
+        default=None,
+        metavar="PATH",
+        help="Write the run's metrics to PATH: a Prometheus textfile, or JSON "
+        "(with the spans of --trace) if PATH ends in .json. Each worker of "
+        "--workers and --join writes its own file, PATH.<worker_id>.",
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="Record a span per stage and per crawled partition.",
+    )
+    parser.add_argument(
+        "--profile",
+        default=None,
+        metavar="DIR",
+        help="Profile every stage into DIR: cProfile pstats, collapsed stacks "
+        "for flame graphs, top allocators and a summary report.",
+    )
+    return parser.parse_args()
+
+
+DATABASE_URL = "sqlite:///database.db"
+
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
     logger = logging.getLogger(__name__)
+    args = parse_args()
+    metrics = configure_metrics(trace=args.trace)
+    profiler = StageProfiler(args.profile) if args.profile else None
 
     logger.info("Starting the process...")
     logger.info("Loading environment variables...")
@@ -48,40 +199,82 @@ if __name__ == "__main__":
 
     # Create the engine and session
     logger.info("Creating the engine and session...")
-    engine = create_engine("sqlite:///database.db")
+    engine = create_engine(DATABASE_URL)
     Session = sessionmaker(bind=engine)
 
-    # Create tables if they do not exist
-    logger.info("Creating tables if they do not exist...")
-    create_tables(engine)
-
-    # Get today's date
-    current_date = datetime.datetime.now().strftime("%Y-%m-%d")
+    # Serve repeated API requests from the on-disk response cache
+    logger.info("Opening the response cache...")
+    cache = ResponseCache(CACHE_PATH)
+    recorder = FixtureStore(args.record) if args.record else None
+    configure_client(cache=cache, recorder=recorder)
 
-    # Get the date 14 days from now
-    next_date = datetime.datetime.now() + datetime.timedelta(days=14)
-    next_date = next_date.strftime("%Y-%m-%d") + "T23:59:59Z"
+    try:
+        # Create tables if they do not exist
+        logger.info("Creating tables if they do not exist...")
+        with stage("create_tables", profiler):
+            create_tables(engine)
 
-    logger.info("Processing classificaions data...")
-    info = process_json_data(API_KEY)
-    logger.info("Data processed successfully.")
+        # From the start of today (UTC) to the end of the day 14 days from now
+        current_date, next_date = event_window()
 
-    logger.info("Getting all attractions and events...")
-    # Get all attractions available
-    get_all_attractions(API_KEY, info)
-    logger.info("All attractions retrieved successfully.")
+        if args.workers or args.join:
+            logger.info("Processing classificaions data...")
+            with stage("classifications", profiler):
+                info = process_json_data(API_KEY, base_url=args.base_url)
+            logger.info("Data processed successfully.")
 
-    logger.info("Getting all events...")
-    # Get all events available
-    get_all_events(API_KEY, info)
-    logger.info("All events retrieved successfully.")
-
-    logger.info("Processing attraction data...")
-    db_df = get_all_attractions_from_db(Session)
-    process_data(
-        db_df, engine, "./data/raw_data/attraction.csv", "attraction_id", "attractions"
-    )
+            for resource in ("attractions", "events"):
+                if not args.join:
+                    logger.info(f"Publishing the {resource} crawl...")
+                    with stage(f"publish_{resource}", profiler):
+                        publish_crawl(
+                            API_KEY,
+                            info,
+                            engine,
+                            resource,
+                            base_url=args.base_url,
+                            start_date=current_date,
+                            end_date=next_date,
+                        )
+                workers = max(args.workers, 1)
+                logger.info(f"Crawling {resource} with {workers} workers...")
+                with stage(f"crawl_{resource}", profiler):
+                    run_workers(
+                        workers,
+                        API_KEY,
+                        DATABASE_URL,
+                        resource,
+                        base_url=args.base_url,
+                        metrics_path=args.metrics,
+                        trace=args.trace,
+                    )
+        else:
+            if args.staging == "parquet":
+                attractions_file, events_file = ATTRACTIONS_PARQUET, EVENTS_PARQUET
+            else:
+                attractions_file, events_file = ATTRACTIONS_CSV, EVENTS_CSV
 
-    logger.info("Processing event data...")
-    db_df = get_all_events_from_db(Session)
-    process_data(db_df, engine, "./data/raw_data/event.csv", "event_id", "events")
+            # The attraction and event pipelines run side by side
+            logger.info("Refreshing all attractions and events...")
+            run_stages(
+                refresh_stages(
+                    API_KEY,
+                    engine,
+                    ingest=args.ingest,
+                    attractions_file=attractions_file,
+                    events_file=events_file,
+                    start_date=current_date,
+                    end_date=next_date,
+                    base_url=args.base_url,
+                    Session=Session,
+                    dedup=args.dedup,
+                    parse_workers=args.parse_workers,
+                ),
+                wrap=partial(stage, profiler=profiler),
+            )
+            logger.info("All attractions and events refreshed successfully.")
+    finally:
+        metrics.set("cache_hit_rate", cache.hit_rate())
+        cache.close()
+        if args.metrics:
+            metrics.write(args.metrics)
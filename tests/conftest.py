@@ -0,0 +1,42 @@
+# This file contains shared fixtures for the test suite.
+import datetime
+from typing import Iterator
+
+import pytest
+
+from utils.http_client import HttpClient
+from utils.mock_server import (  # noqa: F401 - re-exported for the tests
+    DEFAULT_SEGMENT_JSON as SEGMENT_JSON,
+    MockDiscoveryServer,
+    make_attraction,
+    make_event,
+)
+
+# Synthetic event i of every subgenre starts i hours after 2024-06-01;
+# WINDOW covers all of them.
+WINDOW = (datetime.datetime(2024, 6, 1), datetime.datetime(2024, 6, 30, 23, 59, 59))
+
+
+@pytest.fixture
+def mock_api() -> Iterator[MockDiscoveryServer]:
+    """
+    Start a local mock Discovery API server.
+
+    Yields:
+        MockDiscoveryServer: The running server. Set ``latency`` to slow it
+        down and ``max_depth`` to lower the paging limit; ``requests`` counts
+        the requests served.
+    """
+    with MockDiscoveryServer(seed=0) as server:
+        yield server
+
+
+@pytest.fixture
+def client() -> HttpClient:
+    """
+    An HTTP client without rate limiting, for talking to the mock API.
+
+    Returns:
+        HttpClient: The client.
+    """
+    return HttpClient(rate_per_second=None, daily_quota=None, backoff_max=0.01)
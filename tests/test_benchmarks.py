@@ -0,0 +1,35 @@
+# This file contains the test cases for the pipeline benchmark.
+import pytest
+
+from benchmarks.run import STAGES, compare, parse_scale, run_benchmark
+
+
+def test_benchmark_measures_every_stage(tmp_path) -> None:
+    """
+    Test a small benchmark run: every stage is measured, the crawls count
+    their requests and rows, and two runs can be compared.
+    """
+    results = run_benchmark(700, str(tmp_path), staging="csv")
+
+    assert list(results["stages"]) == STAGES
+    crawl = results["stages"]["crawl_events"]
+    # Subgenres of 500 and 200 events: a probe each, then 3 pages and 1 page.
+    assert (crawl["rows"], crawl["requests"]) == (700, 6)
+    assert results["stages"]["load_events"]["rows"] == 700
+    assert results["stages"]["ingest_events"]["rows"] == 700
+    assert results["stages"]["merge_events"]["requests"] == 0
+    assert all(stage["peak_rss_mb"] > 0 for stage in results["stages"].values())
+
+    lines = compare(results, results)
+    assert len(lines) == len(STAGES) + 1
+    assert lines[1].endswith("+0.0%")
+
+
+def test_parse_scale() -> None:
+    """
+    Test that scales are given by name or as a number of events.
+    """
+    assert parse_scale("100k") == 100_000
+    assert parse_scale("2500") == 2500
+    with pytest.raises(ValueError):
+        parse_scale("huge")
@@ -0,0 +1,77 @@
+# This file contains the test cases for the on-disk response cache.
+import time
+
+from utils.cache import ResponseCache, normalize_url
+from utils.http_client import HttpClient
+
+TTLS = {"classifications": 60, "events": 60}
+
+
+def test_normalize_url_drops_the_api_key_and_sorts_parameters() -> None:
+    """
+    Test that URLs differing only in apikey and parameter order share a key.
+    """
+    assert normalize_url("https://H/e.json?page=1&apikey=a&size=5") == normalize_url(
+        "https://h/e.json?apikey=b&size=5&page=1"
+    )
+    assert "apikey" not in normalize_url("https://h/e.json?apikey=a&page=1")
+
+
+def test_cache_expires_entries_and_counts_hits(tmp_path, mocker) -> None:
+    """
+    Test TTL expiry, uncached endpoints and the hit/miss counters.
+    """
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), ttls=TTLS)
+    url = "https://h/discovery/v2/events.json?apikey=k&page=0"
+
+    assert cache.get(url) is None
+    cache.put(url, b'{"a": 1}')
+    cache.put("https://h/discovery/v2/venues.json?page=0", b"{}")
+    assert cache.get(url) == b'{"a": 1}'
+    assert cache.get("https://h/discovery/v2/venues.json?page=0") is None
+
+    mocker.patch("utils.cache.time.time", return_value=time.time() + 120)
+    assert cache.get(url) is None
+    assert cache.stats["hits"] == 1
+    assert cache.stats["misses"] == 2
+    cache.close()
+
+
+def test_cache_evicts_least_recently_used_entries(tmp_path) -> None:
+    """
+    Test that the cache stays under max_bytes by dropping the coldest entries.
+    """
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_bytes=250, ttls=TTLS)
+    urls = [f"https://h/discovery/v2/events.json?page={page}" for page in range(3)]
+
+    cache.put(urls[0], b"x" * 100)
+    cache.put(urls[1], b"x" * 100)
+    time.sleep(0.01)
+    cache.get(urls[0])
+    cache.put(urls[2], b"x" * 100)
+
+    assert cache.get(urls[1]) is None
+    assert cache.get(urls[0]) is not None
+    assert cache.get(urls[2]) is not None
+    assert cache.stats["evictions"] == 1
+    assert cache.total_bytes == 200
+    cache.close()
+
+
+def test_client_serves_repeated_requests_from_the_cache(mock_api, tmp_path) -> None:
+    """
+    Test that a re-run with another client skips the network entirely.
+    """
+    url = f"{mock_api.base_url}/events.json?apikey=k&size=10&page=0&subGenreId=SG2"
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), ttls=TTLS)
+    first = HttpClient(rate_per_second=None, daily_quota=None, cache=cache)
+    data = first.get_json(url)
+    cache.close()
+
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), ttls=TTLS)
+    second = HttpClient(rate_per_second=None, daily_quota=None, cache=cache)
+    mock_api.shutdown()
+
+    assert second.get_json(url.replace("apikey=k", "apikey=other")) == data
+    assert cache.stats["hits"] == 1
+    cache.close()
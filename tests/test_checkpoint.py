@@ -0,0 +1,201 @@
+# This file contains the test cases for resumable, checkpointed crawls.
+from functools import partial
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from config.db.models import Base, CrawlState, Event
+from tests.conftest import SEGMENT_JSON, WINDOW
+from utils.crawler import Crawler
+from utils.helpers import get_all_events, ingest_all_events, read_staging
+from utils.http_client import FetchError, HttpClient
+from utils.writers import ParquetWriter
+
+
+class Killed(BaseException):
+    """
+    Stands in for the process being killed mid-crawl.
+    """
+
+
+class FlakyClient(HttpClient):
+    """
+    A client that records page requests, not planner probes, and fails the
+    ones matching ``fail``.
+    """
+
+    def __init__(self, fail: str = "") -> None:
+        super().__init__(rate_per_second=None, daily_quota=None)
+        self.fail = fail
+        self.urls = []
+
+    def get_json(self, url: str):
+        if "size=1&" not in url:
+            self.urls.append(url)
+        if self.fail and self.fail in url:
+            raise FetchError("Error: Unable to fetch data. Status code: 500", 500)
+        return super().get_json(url)
+
+
+def done_partitions(Session) -> int:
+    session = Session()
+    try:
+        return session.query(CrawlState).filter_by(status="done").count()
+    finally:
+        session.close()
+
+
+class KillingClient(FlakyClient):
+    """
+    A client killed at its ``kill_at``-th page request, noting how many
+    partitions were checkpointed as done, i.e. what a kill -9 would leave.
+    """
+
+    def __init__(self, Session, kill_at: int) -> None:
+        super().__init__()
+        self.Session = Session
+        self.kill_at = kill_at
+        self.done_when_killed = None
+
+    def get_json(self, url: str):
+        if "size=1&" not in url and len(self.urls) == self.kill_at:
+            self.done_when_killed = done_partitions(self.Session)
+            raise Killed()
+        return super().get_json(url)
+
+
+def test_interrupted_crawl_resumes_where_it_stopped(mock_api, tmp_path) -> None:
+    """
+    Test that a rerun fetches only the unfinished pages and appends to the CSV.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    file_path = str(tmp_path / "events.csv")
+
+    flaky = FlakyClient(fail="page=2&segmentId=S1&genreId=G1&subGenreId=SG1")
+    get_all_events(
+        "key", SEGMENT_JSON, 1, file_path, mock_api.base_url, flaky, Session, *WINDOW
+    )
+
+    session = Session()
+    states = {s.subgenre_id: s for s in session.query(CrawlState)}
+    assert (states["SG1"].status, states["SG1"].last_page) == ("in_progress", 1)
+    assert states["SG2"].status == "done"
+    assert "SG3" not in states
+    session.close()
+
+    resumed = FlakyClient()
+    get_all_events(
+        "key", SEGMENT_JSON, 1, file_path, mock_api.base_url, resumed, Session, *WINDOW
+    )
+
+    assert len(resumed.urls) == 1
+    assert "page=2&segmentId=S1&genreId=G1&subGenreId=SG1" in resumed.urls[0]
+    lines = open(file_path, encoding="utf-8").read().splitlines()
+    assert lines[0].startswith("name,type,event_id")
+    assert len(lines) == 1 + 450 + 30
+    assert len(set(lines)) == len(lines)
+
+
+def test_finished_crawl_starts_over(mock_api, tmp_path) -> None:
+    """
+    Test that once every partition is done the next run crawls from scratch.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    file_path = str(tmp_path / "events.csv")
+
+    for _ in range(2):
+        client = FlakyClient()
+        get_all_events(
+            "key",
+            SEGMENT_JSON,
+            2,
+            file_path,
+            mock_api.base_url,
+            client,
+            Session,
+            *WINDOW,
+        )
+
+    assert len(client.urls) == 4
+    assert len(open(file_path, encoding="utf-8").read().splitlines()) == 481
+
+
+def test_killed_queued_ingest_resumes_where_it_stopped(
+    mock_api, mocker, tmp_path
+) -> None:
+    """
+    Test that partitions are checkpointed during a direct ingest, as the
+    writer thread makes their pages durable, so a killed ingest resumes
+    after them.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    # Small pages and paging depth split the window into 21 partitions of
+    # one or two pages.
+    mocker.patch("utils.helpers.Crawler", partial(Crawler, page_size=20, max_depth=40))
+
+    def ingest(client: HttpClient) -> None:
+        ingest_all_events(
+            "key",
+            SEGMENT_JSON,
+            engine,
+            1,
+            mock_api.base_url,
+            client,
+            Session,
+            *WINDOW,
+            batch_size=10,
+            queue_size=4,
+        )
+
+    killed = KillingClient(Session, kill_at=30)
+    with pytest.raises(Killed):
+        ingest(killed)
+    assert killed.done_when_killed > 0
+
+    resumed = FlakyClient()
+    ingest(resumed)
+    assert len(resumed.urls) <= 42 - killed.done_when_killed
+    assert done_partitions(Session) == 21
+    with engine.connect() as connection:
+        assert connection.scalar(select(func.count()).select_from(Event)) == 480
+
+
+def test_killed_parquet_crawl_resumes_without_duplicates(
+    mock_api, mocker, tmp_path
+) -> None:
+    """
+    Test that Parquet parts are published, and their progress checkpointed,
+    during the crawl, and that a resumed crawl adds only the missing rows.
+    """
+    pytest.importorskip("pyarrow")
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    mocker.patch("utils.helpers.Crawler", partial(Crawler, page_size=20, max_depth=40))
+    # A row group per page and a part per two row groups.
+    mocker.patch(
+        "utils.helpers.ParquetWriter",
+        partial(ParquetWriter, row_group_size=1, row_groups_per_part=2),
+    )
+    staging = str(tmp_path / "events.parquet")
+
+    def crawl(client: HttpClient) -> None:
+        get_all_events(
+            "key", SEGMENT_JSON, 1, staging, mock_api.base_url, client, Session, *WINDOW
+        )
+
+    killed = KillingClient(Session, kill_at=30)
+    with pytest.raises(Killed):
+        crawl(killed)
+    assert killed.done_when_killed > 0
+
+    crawl(FlakyClient())
+    event_ids = read_staging(staging, "events", columns=["event_id"])["event_id"]
+    assert len(event_ids) == event_ids.nunique() == 480
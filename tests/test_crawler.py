@@ -0,0 +1,115 @@
+# This file contains the test cases for the concurrent crawler.
+import time
+from functools import partial
+
+import utils.crawler as crawler_module
+from tests.conftest import SEGMENT_JSON, WINDOW
+from utils.crawler import Crawler, iter_partitions
+from utils.helpers import extract_page, get_all_attractions, get_all_events
+
+
+def test_iter_partitions_flattens_the_classifications_tree() -> None:
+    """
+    Test that every subgenre becomes one partition carrying its ids.
+    """
+    partitions = iter_partitions("events", SEGMENT_JSON, (("endDateTime", "x"),))
+
+    assert [(p.segment_id, p.genre_id, p.subgenre_id) for p in partitions] == [
+        ("S1", "G1", "SG1"),
+        ("S1", "G1", "SG2"),
+        ("S1", "G2", "SG3"),
+    ]
+    assert (
+        partitions[0]
+        .url("key", 2, "http://h", 50)
+        .endswith("size=50&page=2&segmentId=S1&genreId=G1&subGenreId=SG1&endDateTime=x")
+    )
+
+
+def test_crawler_delivers_pages_in_order(mock_api, client) -> None:
+    """
+    Test that every page of every partition is delivered once, in page order.
+    """
+    seen = []
+    crawler = Crawler("key", concurrency=4, base_url=mock_api.base_url, client=client)
+    crawler.run(
+        iter_partitions("events", SEGMENT_JSON),
+        lambda partition, page, data: seen.append((partition.subgenre_id, page)),
+    )
+
+    assert sorted(seen) == [("SG1", 0), ("SG1", 1), ("SG1", 2), ("SG2", 0)]
+    assert [page for sub, page in seen if sub == "SG1"] == [0, 1, 2]
+
+
+def test_parse_workers_only_start_for_page_crawls(mock_api, client, mocker) -> None:
+    """
+    Test that counting partitions does not start the parse worker pool.
+    """
+    pool = mocker.patch(
+        "utils.crawler.ProcessPoolExecutor", wraps=crawler_module.ProcessPoolExecutor
+    )
+    crawler = Crawler(
+        "key",
+        base_url=mock_api.base_url,
+        client=client,
+        page_parser=partial(extract_page, "events"),
+        parse_workers=2,
+    )
+    partitions = iter_partitions("events", SEGMENT_JSON)
+
+    assert crawler.count(partitions)[partitions[1]] == 30
+    assert pool.call_count == 0
+    pages = []
+    crawler.run(partitions[1:2], lambda partition, page, data: pages.append(data))
+    assert pool.call_count == 1
+    assert len(pages[0]["_embedded"]["events"]) == 30
+
+
+def test_concurrent_crawl_writes_the_same_records_faster(
+    mock_api, client, tmp_path
+) -> None:
+    """
+    Test that a concurrent crawl writes the same rows as a sequential one and
+    overlaps the network wait.
+    """
+    mock_api.latency = 0.05
+    timings = {}
+    rows = {}
+    for concurrency in (1, 8):
+        file_path = tmp_path / f"events_{concurrency}.csv"
+        start = time.perf_counter()
+        get_all_events(
+            "key",
+            SEGMENT_JSON,
+            concurrency=concurrency,
+            file_path=str(file_path),
+            base_url=mock_api.base_url,
+            client=client,
+            start_date=WINDOW[0],
+            end_date=WINDOW[1],
+        )
+        timings[concurrency] = time.perf_counter() - start
+        rows[concurrency] = file_path.read_text(encoding="utf-8").splitlines()
+
+    assert len(rows[1]) == 1 + 450 + 30
+    assert rows[1][0] == rows[8][0]
+    assert sorted(rows[1][1:]) == sorted(rows[8][1:])
+    assert timings[8] < timings[1]
+
+
+def test_get_all_attractions_writes_every_record(mock_api, client, tmp_path) -> None:
+    """
+    Test that the attraction crawl writes one line per attraction.
+    """
+    file_path = tmp_path / "attraction.csv"
+    get_all_attractions(
+        "key",
+        SEGMENT_JSON,
+        file_path=str(file_path),
+        base_url=mock_api.base_url,
+        client=client,
+    )
+
+    lines = file_path.read_text(encoding="utf-8").splitlines()
+    assert lines[0].startswith("name,attraction_id,")
+    assert len(lines) == 1 + 450 + 30
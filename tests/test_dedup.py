@@ -0,0 +1,125 @@
+# This file contains the test cases for crawl-time deduplication.
+import pytest
+from sqlalchemy import create_engine, func, select
+
+from config.db.models import Event
+from tests.conftest import SEGMENT_JSON, WINDOW
+from utils.dedup import BloomFilter, SeenSet, make_seen_ids
+from utils.helpers import get_all_attractions, ingest_all_events
+from utils.mock_server import make_attraction, make_event
+
+# SG2 is listed under two genres, so both partitions return its records.
+OVERLAPPING_JSON = {
+    "Music-S1": {
+        "genres": [
+            {"id": "G1", "name": "Rock", "subgenres": [{"id": "SG2", "name": "Punk"}]},
+            {"id": "G2", "name": "Pop", "subgenres": [{"id": "SG2", "name": "Punk"}]},
+        ]
+    }
+}
+
+
+def test_seen_set_counts_duplicates() -> None:
+    """
+    Test that only the first occurrence of an ID is reported as new.
+    """
+    seen = SeenSet()
+    assert [seen.add(key) for key in ["a", "b", "a", "a"]] == [True, True, False, False]
+    assert len(seen) == 2
+    assert seen.ratio() == 0.5
+
+
+def test_bloom_filter_stays_within_its_error_rate() -> None:
+    """
+    Test that a Bloom filter never misses a seen ID and keeps false
+    positives near the configured rate.
+    """
+    bloom = BloomFilter(capacity=10_000, error_rate=0.01)
+    for i in range(10_000):
+        bloom.add(f"seen-{i}")
+    assert bloom.duplicates < 200
+    assert all(f"seen-{i}" in bloom for i in range(10_000))
+    false_positives = sum(f"other-{i}" in bloom for i in range(10_000))
+    assert false_positives < 200
+
+    with pytest.raises(ValueError):
+        make_seen_ids("list")
+
+
+def test_crawl_drops_records_found_in_several_partitions(
+    mock_api, client, tmp_path
+) -> None:
+    """
+    Test that records returned by two partitions are written once.
+    """
+    file_path = tmp_path / "attractions.csv"
+    get_all_attractions(
+        "key",
+        OVERLAPPING_JSON,
+        file_path=str(file_path),
+        base_url=mock_api.base_url,
+        client=client,
+    )
+
+    lines = file_path.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 1 + 30
+
+
+def test_crawl_keeps_records_without_an_id(mock_api, client, mocker, tmp_path) -> None:
+    """
+    Test that records without an ID are all written, not dropped as
+    duplicates of each other.
+    """
+
+    def without_id(subgenre_id: str, index: int) -> dict:
+        attraction = make_attraction(subgenre_id, index)
+        if index % 2:
+            del attraction["id"]
+        return attraction
+
+    mocker.patch("utils.mock_server.make_attraction", side_effect=without_id)
+    file_path = tmp_path / "attractions.csv"
+    get_all_attractions(
+        "key",
+        OVERLAPPING_JSON,
+        file_path=str(file_path),
+        base_url=mock_api.base_url,
+        client=client,
+    )
+
+    # Both partitions return the 15 records without an ID, the 15 with one
+    # are written once.
+    lines = file_path.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 1 + 15 + 2 * 15
+
+
+def test_ingest_keeps_records_without_an_id(mock_api, client, mocker, tmp_path) -> None:
+    """
+    Test that records without an ID are all upserted, not merged into one
+    row, when they are ingested straight into the database.
+    """
+
+    def event_without_id(subgenre_id: str, index: int, **kwargs) -> dict:
+        event = make_event(subgenre_id, index, **kwargs)
+        if index % 2:
+            del event["id"]
+        return event
+
+    mocker.patch("utils.mock_server.make_event", side_effect=event_without_id)
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    ingest_all_events(
+        "key",
+        SEGMENT_JSON,
+        engine,
+        base_url=mock_api.base_url,
+        client=client,
+        start_date=WINDOW[0],
+        end_date=WINDOW[1],
+    )
+
+    with engine.connect() as connection:
+        count = connection.scalar(select(func.count()).select_from(Event))
+        unkeyed = connection.scalar(
+            select(func.count()).select_from(Event).where(Event.event_id.is_(None))
+        )
+    assert (count, unkeyed) == (450 + 30, 225 + 15)
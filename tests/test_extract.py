@@ -0,0 +1,66 @@
+# This file contains the test cases for the declarative field extractor.
+from tests.conftest import make_event
+from utils.extract import Extractor, Field, join
+from utils.helpers import EVENT_COLUMNS, parse_event
+
+FIELDS = {
+    "name": "name",
+    "city": "venues.0.city.name",
+    "country": "venues.0.country",
+    "ids": Field("items.*.id", join),
+    "tags": "tags.*",
+}
+
+
+def test_extractor_walks_paths_and_tolerates_missing_values() -> None:
+    """
+    Test that paths resolve, missing steps give None and rows keep the
+    declared column order.
+    """
+    extract = Extractor(FIELDS)
+    record = {
+        "name": "Show",
+        "venues": [{"city": {"name": "Austin"}}],
+        "items": [{"id": 1}, {"id": "b"}],
+        "tags": ["x", "y"],
+    }
+    assert extract(record) == {
+        "name": "Show",
+        "city": "Austin",
+        "country": None,
+        "ids": "1, b",
+        "tags": ["x", "y"],
+    }
+    assert list(extract({})) == list(FIELDS)
+    assert extract({"venues": []}) == {
+        "name": None,
+        "city": None,
+        "country": None,
+        "ids": "",
+        "tags": [],
+    }
+
+
+def test_extractor_falls_back_on_unexpected_types() -> None:
+    """
+    Test that a record with a value of an unexpected type is extracted
+    without raising, and that a page is extracted in order.
+    """
+    extract = Extractor(FIELDS)
+    rows = extract.extract_many(
+        [{"name": "a", "venues": "n/a", "items": {"id": 3}}, {"name": "b"}]
+    )
+    assert [row["name"] for row in rows] == ["a", "b"]
+    assert rows[0]["city"] is None
+    assert rows[0]["ids"] == ""
+
+
+def test_parse_event_extracts_the_stored_columns() -> None:
+    """
+    Test that the event fields produce the stored columns.
+    """
+    record = parse_event(make_event("SG1", 3))
+    assert list(record) == EVENT_COLUMNS
+    assert record["venue_address"] == "3 Main St, Suite 1"
+    assert record["dmas"] == "345, 200"
+    assert record["attractions"] == "A-SG1-3"
@@ -0,0 +1,125 @@
+# This file contains the test cases for the shared HTTP client.
+import json
+import time
+
+import pytest
+
+from utils.http_client import (
+    FetchError,
+    HttpClient,
+    TokenBucket,
+    decode_json,
+    parse_retry_after,
+    redact_url,
+)
+
+
+class FakeResponse:
+    """A minimal stand-in for requests.Response."""
+
+    def __init__(self, status_code: int, headers=None, body=None) -> None:
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.body = body or {}
+
+    def json(self):
+        return self.body
+
+    @property
+    def content(self) -> bytes:
+        return json.dumps(self.body).encode()
+
+
+def test_token_bucket_limits_the_request_rate() -> None:
+    """
+    Test that a bucket of 20 tokens/s with burst 1 spaces out acquisitions.
+    """
+    bucket = TokenBucket(rate=20, capacity=1)
+
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+
+    assert time.monotonic() - start >= 0.2
+
+
+def test_get_retries_throttled_responses_honoring_retry_after(mocker) -> None:
+    """
+    Test that 429 and 5xx responses are retried and Retry-After is honored.
+    """
+    client = HttpClient(rate_per_second=None, daily_quota=None)
+    mocker.patch.object(
+        client.session,
+        "get",
+        side_effect=[
+            FakeResponse(429, {"Retry-After": "3"}),
+            FakeResponse(503),
+            FakeResponse(200, body={"ok": True}),
+        ],
+    )
+    sleep = mocker.patch("utils.http_client.time.sleep")
+
+    assert client.get_json("https://host/x.json?apikey=k") == {"ok": True}
+    assert client.session.get.call_count == 3
+    assert sleep.call_args_list[0].args == (3.0,)
+
+
+def test_get_gives_up_after_max_retries(mocker) -> None:
+    """
+    Test that a persistently failing request raises FetchError.
+    """
+    client = HttpClient(rate_per_second=None, daily_quota=None, max_retries=2)
+    mocker.patch.object(client.session, "get", return_value=FakeResponse(500))
+    mocker.patch("utils.http_client.time.sleep")
+
+    with pytest.raises(FetchError) as err:
+        client.get("https://host/x.json?apikey=k")
+
+    assert err.value.status_code == 500
+    assert client.session.get.call_count == 3
+
+
+def test_get_fails_fast_when_retry_after_is_too_long(mocker) -> None:
+    """
+    Test that a Retry-After over the backoff cap is waited in full, and one
+    over retry_after_max raises FetchError without waiting.
+    """
+    client = HttpClient(
+        rate_per_second=None, daily_quota=None, backoff_max=1, retry_after_max=120
+    )
+    mocker.patch.object(
+        client.session,
+        "get",
+        side_effect=[
+            FakeResponse(429, {"Retry-After": "90"}),
+            FakeResponse(429, {"Retry-After": "3600"}),
+        ],
+    )
+    sleep = mocker.patch("utils.http_client.time.sleep")
+
+    with pytest.raises(FetchError) as err:
+        client.get("https://host/x.json?apikey=k")
+
+    assert err.value.status_code == 429
+    assert "3600" in str(err.value)
+    assert [call.args for call in sleep.call_args_list] == [(90.0,)]
+
+
+def test_parse_retry_after_and_redact_url() -> None:
+    """
+    Test the Retry-After parser and the apikey redaction used in logs.
+    """
+    assert parse_retry_after("7") == 7.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+    assert (
+        redact_url("https://h/e.json?apikey=secret&page=2") == "https://h/e.json?page=2"
+    )
+
+
+def test_decode_json_matches_the_standard_decoder() -> None:
+    """
+    Test that the fast decoder returns what json.loads returns.
+    """
+    body = json.dumps({"name": 'Café, "Live"', "ids": [1, 2.5, None]}).encode()
+    assert decode_json(body) == json.loads(body)
@@ -0,0 +1,113 @@
+# This file contains the test cases for the venues and event link tables.
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+import utils.links
+from config.db.models import Base, Event, EventAttraction, EventDma, Venue
+from tests.conftest import SEGMENT_JSON, WINDOW, make_event
+from utils.helpers import (
+    EVENT_COLUMNS,
+    format_event_row,
+    get_all_events_from_db,
+    get_events_for_attraction,
+    get_events_for_dma,
+    ingest_all_events,
+    process_new_data,
+)
+from utils.links import split_ids
+
+
+def test_ingest_links_events_to_attractions_and_dmas(
+    mock_api, client, tmp_path
+) -> None:
+    """
+    Test that direct ingestion fills the link tables, without duplicates on a
+    re-run, and that events are found through them.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    for _ in range(2):
+        ingest_all_events(
+            "key",
+            SEGMENT_JSON,
+            engine,
+            base_url=mock_api.base_url,
+            client=client,
+            Session=Session,
+            start_date=WINDOW[0],
+            end_date=WINDOW[1],
+            batch_size=100,
+        )
+
+    with engine.connect() as connection:
+        count = select(func.count())
+        assert connection.scalar(count.select_from(EventAttraction)) == 480
+        assert connection.scalar(count.select_from(EventDma)) == 960
+
+    # Synthetic event i of a subgenre features attraction A-<subgenre>-<i % 5>.
+    events = get_events_for_attraction(Session, "A-SG1-0", ["event_id"])
+    assert len(events) == 90
+    assert set(events["event_id"]) == {f"E-SG1-{i}" for i in range(0, 450, 5)}
+
+    events = get_events_for_dma(
+        Session, 345, ["event_id"], Event.event_id.like("E-SG2-%")
+    )
+    assert len(events) == 30
+
+
+def test_staged_events_are_linked(tmp_path) -> None:
+    """
+    Test that events loaded from a CSV staging file are linked too.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    Base.metadata.create_all(engine)
+    staging = tmp_path / "events.csv"
+    with open(staging, "w", encoding="utf-8") as file:
+        file.write(",".join(EVENT_COLUMNS) + "\n")
+        file.write(format_event_row(make_event("SG1", 3)))
+
+    process_new_data(engine, staging, "event_id", "events")
+
+    with engine.connect() as connection:
+        assert connection.execute(select(EventAttraction.attraction_id)).all() == [
+            ("A-SG1-3",)
+        ]
+        assert sorted(connection.scalars(select(EventDma.dma_id))) == [200, 345]
+    assert split_ids("A1/ A2, A1, None") == ["A1", "A2"]
+
+
+def test_venues_are_stored_once_per_crawl(mock_api, client, mocker, tmp_path) -> None:
+    """
+    Test that every venue is upserted once per crawl, not once per event,
+    and that events read back with their venue.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    store_venues = mocker.spy(utils.links, "store_venues")
+
+    ingest_all_events(
+        "key",
+        SEGMENT_JSON,
+        engine,
+        base_url=mock_api.base_url,
+        client=client,
+        start_date=WINDOW[0],
+        end_date=WINDOW[1],
+        batch_size=100,
+    )
+
+    # The synthetic events share the venues V0-V6.
+    assert store_venues.call_count > 1
+    assert sum(map(len, store_venues.spy_return_list)) == 7
+    with engine.connect() as connection:
+        assert connection.scalar(select(func.count()).select_from(Venue)) == 7
+
+    events = get_all_events_from_db(
+        Session, ["event_id", "venue_id", "venue_address"], Venue.venue_id == "V1"
+    )
+    # V1 hosts events 1, 8, 15, ... of SG1 (65) and of SG2 (5).
+    assert len(events) == 65 + 5
+    assert set(events["venue_address"]) == {"1 Main St, Suite 1"}
@@ -0,0 +1,70 @@
+# This file contains the test cases for the pipeline metrics.
+import json
+
+from sqlalchemy import create_engine
+
+from tests.conftest import SEGMENT_JSON
+from utils.helpers import ingest_all_attractions
+from utils.metrics import Metrics, configure_metrics
+
+
+def test_prometheus_and_json_sinks(tmp_path) -> None:
+    """
+    Test that counters, gauges and histograms are rendered in the Prometheus
+    text format and written as JSON.
+    """
+    metrics = Metrics()
+    metrics.inc("rows_fetched_total", 3, resource="events")
+    metrics.inc("rows_fetched_total", 2, resource="events")
+    metrics.add("crawl_requests_in_flight", 1)
+    metrics.observe("http_request_seconds", 0.02, endpoint="events")
+    metrics.observe("http_request_seconds", 7, endpoint="events")
+
+    text = metrics.to_prometheus()
+    assert "# TYPE ticketmaster_rows_fetched_total counter" in text
+    assert 'ticketmaster_rows_fetched_total{resource="events"} 5' in text
+    assert "ticketmaster_crawl_requests_in_flight 1" in text
+    assert (
+        'ticketmaster_http_request_seconds_bucket{endpoint="events",le="0.025"} 1'
+        in text
+    )
+    assert (
+        'ticketmaster_http_request_seconds_bucket{endpoint="events",le="+Inf"} 2'
+        in text
+    )
+    assert 'ticketmaster_http_request_seconds_count{endpoint="events"} 2' in text
+
+    metrics.write(str(tmp_path / "metrics.json"))
+    snapshot = json.loads((tmp_path / "metrics.json").read_text())
+    assert snapshot["histograms"]["http_request_seconds"][0]["sum"] == 7.02
+
+
+def test_instrumented_crawl(mock_api, client, tmp_path) -> None:
+    """
+    Test that a crawl records its requests, retries, rows and queue depths,
+    and traces its partitions inside the stage span.
+    """
+    metrics = configure_metrics(trace=True)
+    mock_api.throttle_rate = 0.3
+    mock_api.retry_after = 0.01
+    client.max_retries = 20
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+
+    with metrics.stage("ingest_attractions"):
+        ingest_all_attractions(
+            "key", SEGMENT_JSON, engine, base_url=mock_api.base_url, client=client
+        )
+
+    requests = metrics.value("http_requests_total", endpoint="attractions", status=200)
+    throttled = metrics.value("http_requests_total", endpoint="attractions", status=429)
+    assert requests + throttled == mock_api.requests
+    assert metrics.value("http_retries_total", endpoint="attractions") == throttled
+    assert metrics.value("rows_fetched_total", resource="attractions") == 480
+    assert metrics.value("rows_upserted_total", table="attractions") == 480
+    assert metrics.value("crawl_requests_in_flight", resource="attractions") == 0
+
+    stage, *partitions = sorted(metrics.spans, key=lambda span: span["id"])
+    assert stage["name"] == "ingest_attractions"
+    assert {span["parent"] for span in partitions} == {stage["id"]}
+    assert len(partitions) == 2
+    configure_metrics()
@@ -0,0 +1,139 @@
+# This file contains the test cases for the database schema migrations.
+import datetime
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+
+from config.db.migrations import (
+    MIGRATIONS,
+    SCHEMA_VERSION,
+    get_schema_version,
+    migrate,
+)
+from config.db.models import Event, Venue
+from utils.search import search
+
+LEGACY_EVENTS = """
+CREATE TABLE events (
+    id INTEGER NOT NULL PRIMARY KEY, name VARCHAR, type VARCHAR,
+    event_id VARCHAR, event_url VARCHAR, event_image VARCHAR,
+    event_date VARCHAR, event_time VARCHAR, timezone VARCHAR,
+    segment VARCHAR, genre VARCHAR, sub_genre VARCHAR, currency VARCHAR,
+    price_range_min VARCHAR, price_range_max VARCHAR, age_restriction VARCHAR,
+    venue_name VARCHAR, venue_city VARCHAR, venue_state VARCHAR,
+    venue_country VARCHAR, venue_address VARCHAR, longitude VARCHAR,
+    latitude VARCHAR, dmas VARCHAR, attractions VARCHAR
+)
+"""
+LEGACY_ATTRACTIONS = """
+CREATE TABLE attractions (
+    name VARCHAR, attraction_id VARCHAR NOT NULL PRIMARY KEY,
+    attraction_type VARCHAR, attraction_url VARCHAR, attraction_image VARCHAR,
+    segment VARCHAR, genre VARCHAR, sub_genre VARCHAR
+)
+"""
+
+
+def test_migrate_converts_a_legacy_database_in_place(tmp_path) -> None:
+    """
+    Test that string columns become typed, duplicates collapse to the latest
+    row, the indexes exist afterwards, the joined IDs become links and the
+    venues move to their own table with an index of their locations, and
+    the names are indexed for search.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    with engine.begin() as connection:
+        connection.execute(text(LEGACY_EVENTS))
+        connection.execute(text(LEGACY_ATTRACTIONS))
+        connection.execute(
+            text(
+                "INSERT INTO events (id, name, event_id, event_date, event_time, "
+                "price_range_min, latitude, longitude, attractions, dmas) VALUES "
+                "(1, 'Old', 'E1', '2024-06-01', '19:30:00', '10.5', '40.7', '-73.9',"
+                " 'A0', '1'),"
+                "(2, 'New', 'E1', '2024-06-01', '19:30:00', '12.0', '40.7', '-73.9',"
+                " 'A1/ A2', '345/ 200'),"
+                "(3, 'Other', 'E2', 'None', 'None', 'None', 'None', 'None',"
+                " 'A1', 'None')"
+            )
+        )
+
+    migrate(engine)
+
+    session = sessionmaker(bind=engine)()
+    events = {event.event_id: event for event in session.query(Event)}
+    assert len(events) == 2
+    assert events["E1"].name == "New"
+    assert events["E1"].event_date == datetime.date(2024, 6, 1)
+    assert events["E1"].event_time == datetime.time(19, 30)
+    assert events["E1"].price_range_min == 12.0
+    assert events["E2"].event_date is None and events["E2"].price_range_min is None
+    venue = session.query(Venue).one()
+    assert venue.venue_id == events["E1"].venue_id
+    assert venue.venue_id.startswith("legacy-")
+    assert (venue.latitude, venue.longitude) == (40.7, -73.9)
+    assert events["E2"].venue_id is None
+    located = session.execute(text("SELECT id FROM venue_locations")).scalars()
+    assert list(located) == [venue.id]
+    session.close()
+
+    indexes = {index["name"]: index for index in inspect(engine).get_indexes("events")}
+    assert indexes["ix_events_event_id"]["unique"]
+    assert {
+        "ix_events_event_date",
+        "ix_events_segment_genre",
+        "ix_events_venue_date",
+    } <= set(indexes)
+    assert "venue_city" not in {
+        c["name"] for c in inspect(engine).get_columns("events")
+    }
+    assert inspect(engine).has_table("crawl_state")
+    with engine.connect() as connection:
+        assert connection.execute(
+            text("SELECT event_id, attraction_id FROM event_attractions")
+        ).all() == [("E1", "A1"), ("E1", "A2"), ("E2", "A1")]
+        assert connection.execute(
+            text("SELECT event_id, dma_id FROM event_dmas ORDER BY dma_id")
+        ).all() == [("E1", 200), ("E1", 345)]
+    assert list(search(sessionmaker(bind=engine), "oth")["key"]) == ["E2"]
+    with engine.connect() as connection:
+        assert get_schema_version(connection) == SCHEMA_VERSION
+
+
+def test_migrate_creates_new_databases_at_the_latest_version(tmp_path) -> None:
+    """
+    Test that a new database is created directly and re-running is a no-op.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+
+    migrate(engine)
+    migrate(engine)
+
+    assert inspect(engine).has_table("events")
+    with engine.connect() as connection:
+        assert get_schema_version(connection) == SCHEMA_VERSION
+
+
+def test_migrations_build_the_schema_of_their_version(mocker, tmp_path) -> None:
+    """
+    Test that migrating a legacy database to version 3 gives the version 3
+    tables, whatever the models look like now.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    with engine.begin() as connection:
+        connection.execute(text(LEGACY_EVENTS))
+        connection.execute(text(LEGACY_ATTRACTIONS))
+    mocker.patch("config.db.migrations.MIGRATIONS", MIGRATIONS[:3])
+    mocker.patch("config.db.migrations.Base.metadata.create_all")
+
+    migrate(engine)
+
+    assert {index["name"] for index in inspect(engine).get_indexes("events")} == {
+        "ix_events_event_date",
+        "ix_events_event_id",
+        "ix_events_segment_genre",
+        "ix_events_venue_id",
+    }
+    assert [index["name"] for index in inspect(engine).get_indexes("attractions")] == [
+        "ix_attractions_segment_genre"
+    ]
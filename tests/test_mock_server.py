@@ -0,0 +1,140 @@
+# This file contains the test cases for the mock Discovery API server and
+# the recording HTTP client.
+import pytest
+from sqlalchemy import create_engine, func, select
+
+from config.constants import EVENT_WINDOW_DAYS
+from config.db.models import Event
+from tests.conftest import WINDOW
+from utils.cache import ResponseCache
+from utils.clf_dict import process_json_data
+from utils.helpers import ingest_all_events
+from utils.http_client import FetchError
+from main import event_window
+from utils.mock_server import (
+    DEFAULT_RECORDS_PER_SUBGENRE,
+    FixtureStore,
+    MockDiscoveryServer,
+    fixture_key,
+    parse_args,
+)
+
+
+def test_recorded_responses_replay_offline(mock_api, client, tmp_path) -> None:
+    """
+    Test that responses recorded from one server are replayed by another,
+    whatever the host, API key and parameter order.
+    """
+    store = FixtureStore(str(tmp_path / "fixtures"))
+    client.recorder = store
+    url = f"{mock_api.base_url}/attractions.json?apikey=k1&subGenreId=SG2&size=10"
+    recorded = client.get_json(url)
+
+    assert fixture_key(url) == "attractions.json?size=10&subGenreId=SG2"
+    with MockDiscoveryServer(records_per_subgenre={}, fixtures=store) as replay:
+        body = client.get_json(
+            f"{replay.base_url}/attractions.json?size=10&subGenreId=SG2&apikey=k2"
+        )
+        empty = client.get_json(f"{replay.base_url}/attractions.json?subGenreId=SG1")
+    assert body == recorded
+    assert len(body["_embedded"]["attractions"]) == 10
+    assert "_embedded" not in empty
+
+
+def test_recording_through_a_warm_cache(mock_api, client, tmp_path) -> None:
+    """
+    Test that responses served from the cache are recorded too.
+    """
+    client.cache = ResponseCache(str(tmp_path / "cache.sqlite"), ttls={"events": 60})
+    url = f"{mock_api.base_url}/events.json?apikey=k&size=10&subGenreId=SG2"
+    fetched = client.get_json(url)
+
+    client.recorder = FixtureStore(str(tmp_path / "fixtures"))
+    assert client.get_json(url) == fetched
+    assert client.cache.stats["hits"] == 1
+    client.cache.close()
+    with MockDiscoveryServer(
+        records_per_subgenre={}, fixtures=client.recorder
+    ) as replay:
+        client.cache = None
+        replayed = client.get_json(
+            f"{replay.base_url}/events.json?size=10&subGenreId=SG2"
+        )
+    assert replayed == fetched
+
+
+def test_throttled_and_failed_requests(mock_api, client) -> None:
+    """
+    Test that 429s carry a Retry-After header the client honours, and that
+    persistent server errors surface as FetchError.
+    """
+    url = f"{mock_api.base_url}/attractions.json?subGenreId=SG2"
+    mock_api.throttle_rate = 0.5
+    mock_api.retry_after = 0.01
+    client.max_retries = 20
+    for _ in range(5):
+        assert client.get_json(url)["page"]["totalElements"] == 30
+    assert mock_api.requests > 5
+
+    mock_api.throttle_rate = 0.0
+    mock_api.error_rate = 1.0
+    client.max_retries = 1
+    with pytest.raises(FetchError) as err:
+        client.get_json(url)
+    assert err.value.status_code == 500
+
+
+def test_end_to_end_offline_crawl(mock_api, client, mocker, tmp_path) -> None:
+    """
+    Test a crawl from the classifications to the database against the
+    mock server alone.
+    """
+    mocker.patch("utils.clf_dict.get_client", return_value=client)
+    info = process_json_data("key", base_url=mock_api.base_url)
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+
+    ingest_all_events(
+        "key",
+        info,
+        engine,
+        base_url=mock_api.base_url,
+        client=client,
+        start_date=WINDOW[0],
+        end_date=WINDOW[1],
+    )
+
+    with engine.connect() as connection:
+        count = connection.scalar(select(func.count()).select_from(Event))
+    # Every synthetic SG1 and SG2 event starts inside the window.
+    assert count == 450 + 30
+    assert list(info) == ["Music-S1"]
+
+
+def test_default_mock_serves_events_in_the_crawl_window(
+    client, mocker, tmp_path
+) -> None:
+    """
+    Test that the mock server started with its command line defaults has
+    events in the window main.py crawls.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    start_date, end_date = event_window()
+    args = parse_args([])
+    mocker.patch("utils.clf_dict.get_client", return_value=client)
+    with MockDiscoveryServer(first_event=args.first_event) as server:
+        info = process_json_data("key", base_url=server.base_url)
+        ingest_all_events(
+            "key",
+            info,
+            engine,
+            base_url=server.base_url,
+            client=client,
+            start_date=start_date,
+            end_date=end_date,
+        )
+
+    # Event i starts i hours after midnight today.
+    hours = (EVENT_WINDOW_DAYS + 1) * 24
+    expected = sum(min(n, hours) for n in DEFAULT_RECORDS_PER_SUBGENRE.values())
+    with engine.connect() as connection:
+        assert connection.scalar(select(func.count()).select_from(Event)) == expected
@@ -0,0 +1,135 @@
+# This file contains the test cases for the stage orchestrator and the
+# queued writer feeding the database from a crawl.
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import create_engine, func, select
+
+from config.db.models import Attraction, Event
+from tests.conftest import WINDOW
+from utils.helpers import refresh_stages
+from utils.orchestrator import Stage, check_stages, run_stages
+from utils.writers import QueueWriter
+
+
+def test_stages_run_concurrently_after_their_dependencies() -> None:
+    """
+    Test that independent stages overlap, that results are passed on, and
+    that a failure stops the stages depending on it.
+    """
+    both_running = threading.Barrier(2, timeout=5)
+
+    def side(value):
+        def run(source):
+            both_running.wait()
+            return source + value
+
+        return run
+
+    results = run_stages(
+        [
+            Stage("source", lambda: 1),
+            Stage("left", side(10), after=("source",)),
+            Stage("right", side(20), after=("source",)),
+            Stage("total", lambda left, right: left + right, after=("left", "right")),
+        ]
+    )
+    assert results == {"source": 1, "left": 11, "right": 21, "total": 32}
+
+    ran = []
+    with pytest.raises(ZeroDivisionError):
+        run_stages(
+            [
+                Stage("broken", lambda: 1 / 0),
+                Stage("after", lambda broken: ran.append(broken), after=("broken",)),
+            ]
+        )
+    assert ran == []
+
+    with pytest.raises(ValueError):
+        check_stages([Stage("a", print, after=("b",)), Stage("b", print, after=("a",))])
+
+
+class SlowWriter:
+    def __init__(self) -> None:
+        self.rows = []
+        self.closed = False
+
+    def open(self, append: bool = False) -> None:
+        pass
+
+    def write(self, records) -> bool:
+        time.sleep(0.05)
+        if records == ["boom"]:
+            raise RuntimeError("boom")
+        self.rows.extend(records)
+        return True
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def test_queue_writer_applies_backpressure_and_raises_errors() -> None:
+    """
+    Test that a full queue blocks the producer, that close() waits for the
+    writer thread, and that its errors reach the producer.
+    """
+    inner = SlowWriter()
+    writer = QueueWriter(inner, maxsize=1)
+    writer.open()
+    start = time.perf_counter()
+    for page in range(6):
+        writer.write([page])
+    # At most the page being written and one queued page are ahead.
+    assert time.perf_counter() - start >= 0.05 * 4
+    writer.close()
+    assert inner.rows == list(range(6)) and inner.closed
+
+    writer = QueueWriter(SlowWriter(), maxsize=1)
+    writer.open()
+    with pytest.raises(RuntimeError):
+        for _ in range(10):
+            writer.write(["boom"])
+        writer.close()
+
+
+def test_refresh_runs_both_pipelines_side_by_side(
+    mock_api, client, mocker, tmp_path
+) -> None:
+    """
+    Test a full direct refresh: attractions and events are crawled at the
+    same time and upserted through their writer threads.
+    """
+    mocker.patch("utils.clf_dict.get_client", return_value=client)
+    mock_api.latency = 0.02
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    spans = {}
+
+    @contextmanager
+    def timed(name):
+        start = time.perf_counter()
+        yield
+        spans[name] = (start, time.perf_counter())
+
+    run_stages(
+        refresh_stages(
+            "key",
+            engine,
+            start_date=WINDOW[0],
+            end_date=WINDOW[1],
+            queue_size=2,
+            base_url=mock_api.base_url,
+            client=client,
+        ),
+        wrap=timed,
+    )
+
+    attractions, events = spans["ingest_attractions"], spans["ingest_events"]
+    assert attractions[0] < events[1] and events[0] < attractions[1]
+    assert spans["classifications"][1] <= min(attractions[0], events[0])
+    with engine.connect() as connection:
+        for model in (Attraction, Event):
+            count = connection.scalar(select(func.count()).select_from(model))
+            assert count == 480
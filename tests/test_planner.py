@@ -0,0 +1,87 @@
+# This file contains the test cases for the date-window partition planner.
+import datetime
+import functools
+
+from tests.conftest import SEGMENT_JSON, WINDOW
+from utils.crawler import Crawler, Partition, iter_partitions
+from utils.helpers import get_all_events
+from utils.planner import (
+    plan_crawl,
+    plan_event_partitions,
+    split_window,
+    window_of,
+    with_window,
+)
+
+
+def test_split_window_covers_the_range_without_overlap() -> None:
+    """
+    Test that the two halves are adjacent and cover the original window.
+    """
+    partition = with_window(
+        Partition("events", "S1", "G1", "SG1"),
+        datetime.datetime(2024, 6, 1),
+        datetime.datetime(2024, 6, 2, 23, 59, 59),
+    )
+    first, second = split_window(partition)
+
+    assert window_of(first)[0] == datetime.datetime(2024, 6, 1)
+    assert window_of(first)[1] + datetime.timedelta(seconds=1) == window_of(second)[0]
+    assert window_of(second)[1] == datetime.datetime(2024, 6, 2, 23, 59, 59)
+
+
+def test_planner_splits_large_subgenres_and_drops_empty_ones(mock_api, client) -> None:
+    """
+    Test that every planned slice fits under the paging limit.
+    """
+    mock_api.max_depth = 100
+    crawler = Crawler("key", base_url=mock_api.base_url, client=client, max_depth=100)
+
+    partitions = plan_event_partitions(crawler, SEGMENT_JSON, *WINDOW)
+    totals = crawler.count(partitions)
+
+    assert {p.subgenre_id for p in partitions} == {"SG1", "SG2"}
+    assert all(0 < total <= 100 for total in totals.values())
+    assert sum(totals.values()) == 450 + 30
+
+
+def test_event_crawl_gets_past_the_paging_limit(
+    mock_api, client, tmp_path, mocker
+) -> None:
+    """
+    Test that a subgenre larger than the paging limit is crawled completely.
+    """
+    mock_api.max_depth = 200
+    mocker.patch("utils.helpers.Crawler", functools.partial(Crawler, max_depth=200))
+    file_path = tmp_path / "events.csv"
+
+    get_all_events(
+        "key",
+        SEGMENT_JSON,
+        file_path=str(file_path),
+        base_url=mock_api.base_url,
+        client=client,
+        start_date=WINDOW[0],
+        end_date=WINDOW[1],
+    )
+
+    lines = file_path.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 1 + 450 + 30
+    assert len(set(lines)) == len(lines)
+
+
+def test_plan_crawl_drops_empty_partitions_and_orders_largest_first(
+    mock_api, client
+) -> None:
+    """
+    Test that the plan skips empty subgenres, puts the largest first and
+    estimates one request per page.
+    """
+    crawler = Crawler("key", base_url=mock_api.base_url, client=client)
+
+    plan = plan_crawl(crawler, iter_partitions("attractions", SEGMENT_JSON))
+
+    assert [p.subgenre_id for p in plan.partitions] == ["SG1", "SG2"]
+    assert plan.sizes == {plan.partitions[0]: 450, plan.partitions[1]: 30}
+    assert plan.requests == 3 + 1
+    assert plan.seconds is not None
@@ -0,0 +1,37 @@
+# This file contains the test cases for the profiling mode.
+import json
+import pstats
+import time
+
+from utils.profiling import StageProfiler
+
+
+def build_rows(count: int) -> list:
+    time.sleep(0.05)
+    return [{"id": str(index), "name": "x" * 100} for index in range(count)]
+
+
+def test_stage_artifacts_and_summary(tmp_path) -> None:
+    """
+    Test that a profiled stage writes a pstats profile, collapsed stacks,
+    its top allocators and a summary naming the work it did.
+    """
+    profiler = StageProfiler(str(tmp_path), interval=0.001)
+    with profiler.profile("build"):
+        rows = build_rows(20_000)
+
+    functions = pstats.Stats(str(tmp_path / "build.pstats")).stats
+    assert any(name == "build_rows" for _, _, name in functions)
+
+    collapsed = (tmp_path / "build.collapsed").read_text().splitlines()
+    stack, count = collapsed[0].rsplit(" ", 1)
+    assert int(count) >= 1
+    assert any("build_rows (test_profiling.py" in line for line in collapsed)
+
+    summary = json.loads((tmp_path / "summary.json").read_text())["build"]
+    assert summary["net_traced_bytes"] > 20_000 * 100
+    assert summary["peak_traced_bytes"] >= summary["net_traced_bytes"]
+    assert "test_profiling.py" in summary["top_allocations"][0]["location"]
+    assert "build_rows" in (tmp_path / "summary.txt").read_text()
+    assert (tmp_path / "build.allocations.txt").exists()
+    assert len(rows) == 20_000
@@ -0,0 +1,140 @@
+# This file contains the test cases for the cached read queries.
+import datetime
+
+import pandas as pd
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from config.db.models import Base, Venue
+from tests.conftest import SEGMENT_JSON, WINDOW, make_event
+from utils.helpers import (
+    EVENT_COLUMNS,
+    format_event_row,
+    ingest_all_events,
+    process_new_data,
+)
+from utils.links import store_venues
+from utils.metrics import configure_metrics
+from utils.query_cache import (
+    QueryCache,
+    bump_generations,
+    configure_query_cache,
+    generation,
+    get_upcoming_events,
+)
+
+JUNE = (datetime.date(2024, 6, 1), datetime.date(2024, 6, 30))
+
+
+def stage_events(engine, path, events) -> None:
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(",".join(EVENT_COLUMNS) + "\n")
+        file.writelines(format_event_row(event) for event in events)
+    process_new_data(engine, path, "event_id", "events")
+
+
+def test_ingest_invalidates_the_cached_partitions(mock_api, client, tmp_path) -> None:
+    """
+    Test that cached results are served until an ingest writes events of
+    the segment and months they read, and only then.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    ingest_all_events(
+        "key",
+        SEGMENT_JSON,
+        engine,
+        base_url=mock_api.base_url,
+        client=client,
+        start_date=WINDOW[0],
+        end_date=WINDOW[1],
+    )
+    configure_query_cache()
+    metrics = configure_metrics()
+
+    def upcoming() -> pd.DataFrame:
+        return get_upcoming_events(
+            Session, "Music", start_date=JUNE[0], end_date=JUNE[1], limit=5
+        )
+
+    first = upcoming()
+    assert list(first["event_id"]) == [
+        "E-SG1-0",
+        "E-SG2-0",
+        "E-SG1-1",
+        "E-SG2-1",
+        "E-SG1-2",
+    ]
+    # Event 720 is on July 1st, outside the months the query reads.
+    stage_events(engine, tmp_path / "july.csv", [make_event("SG9", 720)])
+    pd.testing.assert_frame_equal(upcoming(), first)
+    stage_events(engine, tmp_path / "june.csv", [make_event("SG9", 0)])
+    assert "E-SG9-0" in set(upcoming()["event_id"])
+
+    def lookups(result: str) -> float:
+        return metrics.value(
+            "query_cache_lookups_total", query="upcoming_events", result=result
+        )
+
+    assert (lookups("miss"), lookups("hit"), lookups("stale")) == (1, 1, 1)
+    configure_metrics()
+
+    # Moving an event bumps the partition it leaves and the one it enters.
+    with engine.begin() as connection:
+        moved = dict(event_id="E-SG1-0", segment="Music", event_date="2024-07-02")
+        assert bump_generations(connection, "events", [moved]) == 2
+
+
+def test_venue_changes_invalidate_the_cached_events(mock_api, client, tmp_path) -> None:
+    """
+    Test that renaming a venue invalidates the cached events joined to it,
+    and that storing it unchanged does not.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    ingest_all_events(
+        "key",
+        SEGMENT_JSON,
+        engine,
+        base_url=mock_api.base_url,
+        client=client,
+        start_date=WINDOW[0],
+        end_date=WINDOW[1],
+    )
+    configure_query_cache()
+
+    def first_venue() -> str:
+        events = get_upcoming_events(Session, start_date=JUNE[0], limit=1)
+        return events["venue_name"].iloc[0]
+
+    assert first_venue() == "Venue 0"
+    with engine.begin() as connection:
+        venue = connection.execute(select(Venue).where(Venue.venue_id == "V0"))
+        row = dict(venue.mappings().one())
+        before = generation(connection, "venues")
+        store_venues(connection, [row])
+        assert generation(connection, "venues") == before
+        store_venues(connection, [dict(row, venue_name="Hall 0")])
+    assert first_venue() == "Hall 0"
+
+
+def test_query_cache_evicts_least_recently_used() -> None:
+    """
+    Test the LRU eviction, and that results expire after the TTL or with
+    their generation.
+    """
+    cache = QueryCache(max_entries=2)
+    result = pd.DataFrame({"event_id": ["E1"]})
+    cache.put("a", 1, result)
+    cache.put("b", 1, result)
+    assert cache.get("a", 1)[0] == "hit"
+    cache.put("c", 1, result)
+    assert cache.get("b", 1) == ("miss", None)
+    assert cache.get("a", 2) == ("stale", None)
+    assert cache.stats["evictions"] == 1
+
+    cache = QueryCache(ttl=0)
+    cache.put("a", 1, result)
+    assert cache.get("a", 1) == ("stale", None)
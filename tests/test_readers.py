@@ -0,0 +1,52 @@
+# This file contains the test cases for reading stored records from the database.
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from config.db.models import Base, Event
+from tests.conftest import make_event
+from utils.helpers import (
+    EVENT_COLUMNS,
+    get_all_events_from_db,
+    parse_event,
+)
+from utils.writers import DatabaseWriter
+
+
+@pytest.fixture
+def Session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    Base.metadata.create_all(engine)
+    writer = DatabaseWriter(engine, Event, "event_id")
+    writer.write(
+        [parse_event(make_event(sg, i)) for sg in ("SG1", "SG2") for i in range(5)]
+    )
+    writer.close()
+    return sessionmaker(bind=engine)
+
+
+def test_get_all_events_from_db_projects_and_filters(Session) -> None:
+    """
+    Test that only the requested columns of the matching rows are returned.
+    """
+    df = get_all_events_from_db(Session)
+    assert list(df.columns) == EVENT_COLUMNS
+    assert len(df) == 10
+
+    df = get_all_events_from_db(
+        Session, columns=["event_id"], where=Event.sub_genre == "SG2"
+    )
+    assert list(df.columns) == ["event_id"]
+    assert sorted(df["event_id"]) == [f"E-SG2-{i}" for i in range(5)]
+
+    with pytest.raises(ValueError):
+        get_all_events_from_db(Session, columns=["missing"])
+
+
+def test_get_all_events_from_db_streams_chunks(Session) -> None:
+    """
+    Test that a chunksize yields DataFrames of at most that many rows.
+    """
+    chunks = list(get_all_events_from_db(Session, columns=["event_id"], chunksize=4))
+    assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+    assert sum(chunk["event_id"].nunique() for chunk in chunks) == 10
@@ -0,0 +1,58 @@
+# This file contains the test cases for the full-text search.
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from config.db.models import Base
+from tests.conftest import SEGMENT_JSON, WINDOW
+from utils.helpers import ingest_all_attractions, ingest_all_events
+from utils.search import match_query, search
+
+
+def test_ingest_keeps_the_search_index_in_step(mock_api, client, tmp_path) -> None:
+    """
+    Test that ingested events, attractions and venues are searchable once
+    each after a re-run, by prefix and by kind.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    for _ in range(2):
+        ingest_all_attractions(
+            "key", SEGMENT_JSON, engine, base_url=mock_api.base_url, client=client
+        )
+        ingest_all_events(
+            "key",
+            SEGMENT_JSON,
+            engine,
+            base_url=mock_api.base_url,
+            client=client,
+            start_date=WINDOW[0],
+            end_date=WINDOW[1],
+            batch_size=100,
+        )
+
+    with engine.connect() as connection:
+        indexed = connection.execute(text("SELECT COUNT(*) FROM search_index"))
+        assert indexed.scalar() == 480 + 480 + 7
+
+    results = search(Session, "venue 3")
+    assert list(results[["kind", "key"]].iloc[0]) == ["venue", "V3"]
+
+    results = search(Session, "Event SG2-1", kinds=["event"], limit=50)
+    assert set(results["key"]) == {"E-SG2-1"} | {f"E-SG2-{i}" for i in range(10, 20)}
+    assert results["score"].is_monotonic_decreasing
+    results = search(Session, "Event SG2-1", kinds=["event"], prefix=False)
+    assert list(results["key"]) == ["E-SG2-1"]
+
+
+def test_match_query() -> None:
+    """
+    Test that typed text becomes a query of quoted words, the last a prefix.
+    """
+    assert match_query('taylor "swi') == '"taylor" "swi"*'
+    assert match_query("AC/DC", prefix=False) == '"AC" "DC"'
+    assert match_query(" - ") is None
+    assert search(None, "").empty
+    with pytest.raises(ValueError):
+        search(None, "rock", kinds=["band"])
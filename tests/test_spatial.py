@@ -0,0 +1,70 @@
+# This file contains the test cases for the nearby events lookups.
+import datetime
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from config.db.models import Base
+from tests.conftest import SEGMENT_JSON, WINDOW
+from utils.helpers import ingest_all_events
+from utils.spatial import bounding_box, find_events_near, haversine_km
+
+
+def test_find_events_near_sorts_by_distance(mock_api, client, tmp_path) -> None:
+    """
+    Test that only events within the radius are found, nearest first, and
+    that the date and segment filters apply.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    # The second crawl updates the venues, and their locations, in place.
+    for _ in range(2):
+        ingest_all_events(
+            "key",
+            SEGMENT_JSON,
+            engine,
+            base_url=mock_api.base_url,
+            client=client,
+            start_date=WINDOW[0],
+            end_date=WINDOW[1],
+        )
+    with engine.connect() as connection:
+        located = connection.execute(text("SELECT COUNT(*) FROM venue_locations"))
+        assert located.scalar() == 7
+
+    # V0 is at the point and V1 8.4 km east of it; V2 is 16.9 km away.
+    events = find_events_near(Session, 40.75, -73.99, 10)
+    assert set(events["venue_id"]) == {"V0", "V1"}
+    assert len(events) == 65 + 5 + 65 + 5
+    assert events["distance_km"].is_monotonic_increasing
+    assert events["distance_km"].iloc[-1] == pytest.approx(8.43, abs=0.01)
+
+    first_day = (datetime.date(2024, 6, 1), datetime.date(2024, 6, 1))
+    events = find_events_near(
+        Session, 40.75, -73.99, 10, date_range=first_day, segment="Music", limit=10
+    )
+    assert len(events) == 10
+    assert set(events["event_date"]) == {datetime.date(2024, 6, 1)}
+    assert list(events["venue_id"]).count("V0") == 8
+    assert find_events_near(Session, 40.75, -73.99, 10, segment="Sports").empty
+
+
+def test_bounding_box_and_distance() -> None:
+    """
+    Test the distances, and boxes crossing the antimeridian or covering a pole.
+    """
+    assert haversine_km(0, 0, 0, 1) == pytest.approx(111.195, abs=0.001)
+    assert haversine_km(0, 0, None, 1) is None
+
+    latitudes, longitudes = bounding_box(0, 179.5, 111.195)
+    assert latitudes == pytest.approx((-1, 1))
+    assert longitudes == [
+        (pytest.approx(178.5), 180.0),
+        (-180.0, pytest.approx(-179.5)),
+    ]
+    assert bounding_box(89.5, 0, 200)[1] == [(-180.0, 180.0)]
+
+    with pytest.raises(ValueError):
+        find_events_near(None, 91, 0, 10)
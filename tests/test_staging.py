@@ -0,0 +1,95 @@
+# This file contains the test cases for loading staging files into the database.
+import pytest
+from sqlalchemy import create_engine, func, select
+
+from config.db.models import Base, Event, Venue
+from tests.conftest import SEGMENT_JSON, WINDOW, make_event
+from utils.helpers import (
+    EVENT_COLUMNS,
+    format_event_row,
+    get_all_events,
+    process_new_data,
+    read_staging,
+)
+
+
+def write_staging_file(path, indices) -> None:
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(",".join(EVENT_COLUMNS) + "\n")
+        for i in indices:
+            file.write(format_event_row(make_event("SG1", i)))
+
+
+def test_process_new_data_appends_only_unknown_keys(tmp_path) -> None:
+    """
+    Test that stored keys and keys repeated across chunks are not appended.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    Base.metadata.create_all(engine)
+    staging = tmp_path / "events.csv"
+
+    write_staging_file(staging, range(10))
+    assert process_new_data(engine, staging, "event_id", "events", chunksize=4) == 10
+
+    # 5-9 are stored already, 12 repeats in a later chunk.
+    write_staging_file(staging, [5, 6, 7, 8, 9, 10, 11, 12, 12, 13])
+    assert process_new_data(engine, staging, "event_id", "events", chunksize=4) == 4
+
+    with engine.connect() as connection:
+        assert connection.scalar(select(func.count()).select_from(Event)) == 14
+        keys = connection.scalars(select(Event.event_id)).all()
+    assert len(set(keys)) == 14
+
+
+def test_process_new_data_stores_typed_values(tmp_path) -> None:
+    """
+    Test that staged strings are stored with the column types, and values
+    with commas unchanged.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    Base.metadata.create_all(engine)
+    staging = tmp_path / "events.csv"
+    write_staging_file(staging, [0])
+
+    process_new_data(engine, staging, "event_id", "events")
+
+    with engine.connect() as connection:
+        event = connection.execute(select(Event)).one()
+        venue = connection.execute(select(Venue)).one()
+    assert str(event.event_date) == "2024-06-01"
+    assert event.venue_id == venue.venue_id == "V0"
+    assert isinstance(venue.latitude, float)
+    assert venue.venue_address == "0 Main St, Suite 1"
+
+
+def test_parquet_staging_round_trip(mock_api, client, tmp_path) -> None:
+    """
+    Test that a crawl staged as Parquet loads typed, unmangled values.
+    """
+    pytest.importorskip("pyarrow")
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    Base.metadata.create_all(engine)
+    staging = str(tmp_path / "events.parquet")
+
+    get_all_events(
+        "key",
+        SEGMENT_JSON,
+        file_path=staging,
+        base_url=mock_api.base_url,
+        client=client,
+        start_date=WINDOW[0],
+        end_date=WINDOW[1],
+    )
+    df = read_staging(staging, "events", columns=["event_id", "latitude"])
+    assert list(df.columns) == ["event_id", "latitude"]
+    assert len(df) == 480
+    assert df["latitude"].dtype == "float64"
+
+    assert process_new_data(engine, staging, "event_id", "events", chunksize=100) == 480
+    with engine.connect() as connection:
+        address = connection.scalar(
+            select(Venue.venue_address)
+            .join(Event, Event.venue_id == Venue.venue_id)
+            .where(Event.event_id == "E-SG1-1")
+        )
+    assert address == "1 Main St, Suite 1"
@@ -0,0 +1,95 @@
+# This file contains the test cases for the crawl work queue and its workers.
+import json
+import time
+
+from sqlalchemy import create_engine, func, select
+
+from config.db.models import Attraction
+from tests.conftest import SEGMENT_JSON
+from utils.crawler import iter_partitions
+from utils.helpers import publish_crawl, run_workers
+from utils.work_queue import DONE, FAILED, WorkQueue
+
+
+def test_expired_leases_are_reclaimed_and_retried(tmp_path) -> None:
+    """
+    Test that a partition whose lease expires goes to another worker, that
+    the first worker can no longer complete it, and that it is given up on
+    after max_attempts.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    queue = WorkQueue(engine, "attractions", lease_seconds=0.2, max_attempts=2)
+    assert queue.publish(iter_partitions("attractions", SEGMENT_JSON)) == 3
+
+    first_id, first = queue.claim("w1")
+    second_id, second = queue.claim("w2")
+    assert first != second
+    assert queue.heartbeat(second_id, "w2")
+
+    time.sleep(0.3)
+    reclaimed_id, reclaimed = queue.claim("w3")
+    assert (reclaimed_id, reclaimed) == (first_id, first)
+    assert not queue.complete(first_id, "w1")
+
+    assert queue.fail(reclaimed_id, "w3", "boom")
+    assert queue.counts()[FAILED] == 1
+
+
+def test_failed_partitions_are_retried_after_publishing_again(tmp_path) -> None:
+    """
+    Test that publishing a queue with failed and done partitions makes the
+    failed ones claimable again and keeps the done ones.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    queue = WorkQueue(engine, "attractions", max_attempts=1)
+    queue.publish(iter_partitions("attractions", SEGMENT_JSON))
+    failed_id, failed = queue.claim("w1")
+    assert queue.fail(failed_id, "w1", "boom")
+    while (claimed := queue.claim("w1")) is not None:
+        assert queue.complete(claimed[0], "w1")
+    assert queue.counts() == {DONE: 2, FAILED: 1}
+
+    assert queue.publish(iter_partitions("attractions", SEGMENT_JSON)) == 0
+    assert queue.claim("w2") == (failed_id, failed)
+    assert queue.complete(failed_id, "w2")
+    assert queue.claim("w2") is None
+    assert queue.counts() == {DONE: 3}
+
+
+def test_worker_processes_drain_the_queue(mock_api, client, tmp_path) -> None:
+    """
+    Test that several worker processes share the partitions and store every
+    record once.
+    """
+    database_url = f"sqlite:///{tmp_path / 'database.db'}"
+    engine = create_engine(database_url)
+    publish_crawl(
+        "key",
+        SEGMENT_JSON,
+        engine,
+        "attractions",
+        base_url=mock_api.base_url,
+        client=client,
+    )
+
+    counts = run_workers(
+        2,
+        "key",
+        database_url,
+        "attractions",
+        rate_per_second=None,
+        daily_quota=None,
+        base_url=mock_api.base_url,
+        metrics_path=str(tmp_path / "metrics.json"),
+    )
+
+    # The empty subgenre SG3 is not published.
+    assert counts == {DONE: 2}
+    with engine.connect() as connection:
+        assert connection.scalar(select(func.count()).select_from(Attraction)) == 480
+    # Every worker writes the rows it fetched to its own metrics file.
+    fetched = 0
+    for path in tmp_path.glob("metrics.*.json"):
+        counters = json.loads(path.read_text())["counters"]
+        fetched += sum(s["value"] for s in counters.get("rows_fetched_total", []))
+    assert fetched == 480
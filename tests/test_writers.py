@@ -0,0 +1,133 @@
+# This file contains the test cases for the record writers and direct ingestion.
+import threading
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from config.db.models import Attraction, Base, Event, Venue
+from tests.conftest import SEGMENT_JSON, WINDOW, make_event
+from utils.helpers import (
+    database_writer,
+    ingest_all_attractions,
+    ingest_all_events,
+    parse_event,
+)
+from utils.writers import DatabaseWriter
+
+
+def test_database_writer_upserts_in_batches(tmp_path) -> None:
+    """
+    Test that rows are committed per batch and repeated keys update in place.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    Base.metadata.create_all(engine)
+    writer = DatabaseWriter(engine, Event, "event_id", batch_size=3)
+    writer.open()
+
+    assert writer.write([parse_event(make_event("SG1", i)) for i in range(2)]) is False
+    assert writer.write([parse_event(make_event("SG1", 2))]) is True
+    renamed = parse_event(make_event("SG1", 0))
+    renamed["name"] = "Renamed, with comma"
+    writer.write([renamed])
+    writer.close()
+
+    with engine.connect() as connection:
+        assert connection.scalar(select(func.count()).select_from(Event)) == 3
+        name = connection.scalar(select(Event.name).where(Event.event_id == "E-SG1-0"))
+    assert name == "Renamed, with comma"
+    assert writer.rows_written == 4
+
+
+def test_writers_opening_at_once_create_shared_tables_once(tmp_path) -> None:
+    """
+    Test that the events and attractions writers can open side by side,
+    although both create the cache_generations table.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    errors = []
+
+    def open_writer(resource: str) -> None:
+        try:
+            database_writer(resource, engine, 10).open()
+        except Exception as err:
+            errors.append(err)
+
+    threads = [
+        threading.Thread(target=open_writer, args=(resource,))
+        for resource in ["events", "attractions"] * 4
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+def test_ingest_streams_crawled_records_into_the_database(
+    mock_api, client, tmp_path
+) -> None:
+    """
+    Test that direct ingestion stores every record once, also when re-run.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    for _ in range(2):
+        ingest_all_events(
+            "key",
+            SEGMENT_JSON,
+            engine,
+            base_url=mock_api.base_url,
+            client=client,
+            Session=Session,
+            start_date=WINDOW[0],
+            end_date=WINDOW[1],
+            batch_size=100,
+        )
+        ingest_all_attractions(
+            "key",
+            SEGMENT_JSON,
+            engine,
+            base_url=mock_api.base_url,
+            client=client,
+            Session=Session,
+        )
+
+    with engine.connect() as connection:
+        assert connection.scalar(select(func.count()).select_from(Event)) == 480
+        assert connection.scalar(select(func.count()).select_from(Attraction)) == 480
+        address = connection.scalar(
+            select(Venue.venue_address)
+            .join(Event, Event.venue_id == Venue.venue_id)
+            .where(Event.event_id == "E-SG1-1")
+        )
+    assert address == "1 Main St, Suite 1"
+
+
+def test_ingest_with_parse_workers_matches_inline_parsing(
+    mock_api, client, tmp_path
+) -> None:
+    """
+    Test that pages parsed on worker processes store the same rows.
+    """
+    rows = []
+    for parse_workers in (0, 2):
+        engine = create_engine(f"sqlite:///{tmp_path / f'{parse_workers}.db'}")
+        Base.metadata.create_all(engine)
+        ingest_all_events(
+            "key",
+            SEGMENT_JSON,
+            engine,
+            base_url=mock_api.base_url,
+            client=client,
+            start_date=WINDOW[0],
+            end_date=WINDOW[1],
+            parse_workers=parse_workers,
+        )
+        with engine.connect() as connection:
+            rows.append(
+                connection.execute(select(Event).order_by(Event.event_id)).all()
+            )
+    assert len(rows[0]) == 480
+    assert [row[1:] for row in rows[0]] == [row[1:] for row in rows[1]]
@@ -0,0 +1,210 @@
+# Description: Persistent on-disk cache for Discovery API responses with
+# per-endpoint TTLs and size-bounded LRU eviction.
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from config.constants import CACHE_MAX_BYTES, CACHE_PATH, CACHE_TTLS
+from utils.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_url(url: str) -> str:
+    """
+    Normalize a request URL into a cache key.
+
+    The apikey parameter is dropped and the remaining parameters are sorted,
+    so the same request made with different keys or parameter orders shares
+    one entry.
+
+    Args:
+        url (str): The request URL.
+
+    Returns:
+        str: The normalized URL.
+    """
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query) if k != "apikey")
+    return urlunsplit(
+        (parts.scheme.lower(), parts.netloc.lower(), parts.path, urlencode(query), "")
+    )
+
+
+def endpoint_of(url: str) -> str:
+    """
+    Get the Discovery API endpoint name of a URL, e.g. "events".
+
+    Args:
+        url (str): The request URL.
+
+    Returns:
+        str: The last path segment without its extension.
+    """
+    return urlsplit(url).path.rstrip("/").rsplit("/", 1)[-1].split(".")[0]
+
+
+class ResponseCache:
+    """
+    Stores raw response bodies in a SQLite file keyed by normalized URL.
+
+    Every endpoint has its own TTL; endpoints without one are never cached.
+    When the stored bodies exceed ``max_bytes`` the least recently used
+    entries are evicted. Hits, misses and evictions are counted in ``stats``.
+    """
+
+    def __init__(
+        self,
+        path: str = CACHE_PATH,
+        max_bytes: int = CACHE_MAX_BYTES,
+        ttls: Optional[Dict[str, float]] = None,
+    ) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = CACHE_TTLS if ttls is None else ttls
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self.lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """)
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_responses_last_access ON responses (last_access)"
+        )
+        self.conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+        self.conn.commit()
+        self.total_bytes = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    def get(self, url: str) -> Optional[bytes]:
+        """
+        Look up the cached body of a URL.
+
+        Args:
+            url (str): The request URL.
+
+        Returns:
+            bytes or None: The cached body, or None on a miss or expired entry.
+        """
+        if not self.ttls.get(endpoint_of(url)):
+            return None
+
+        key = normalize_url(url)
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT body, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] <= now:
+                self.stats["misses"] += 1
+                get_metrics().inc("cache_lookups_total", result="miss")
+                return None
+            self.conn.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?", (now, key)
+            )
+            self.conn.commit()
+            self.stats["hits"] += 1
+            get_metrics().inc("cache_lookups_total", result="hit")
+            return row[0]
+
+    def put(self, url: str, body: bytes) -> None:
+        """
+        Store the body of a URL if its endpoint has a TTL.
+
+        Args:
+            url (str): The request URL.
+            body (bytes): The raw response body.
+
+        Returns:
+            None
+        """
+        endpoint = endpoint_of(url)
+        ttl = self.ttls.get(endpoint)
+        if not ttl or len(body) > self.max_bytes:
+            return
+
+        key = normalize_url(url)
+        now = time.time()
+        with self.lock:
+            old = self.conn.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, endpoint, body, len(body), now + ttl, now),
+            )
+            self.total_bytes += len(body) - (old[0] if old else 0)
+            self.stats["stores"] += 1
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self) -> None:
+        while self.total_bytes > self.max_bytes:
+            rows = self.conn.execute(
+                "SELECT key, size FROM responses ORDER BY last_access LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self.total_bytes = 0
+                return
+            for key, size in rows:
+                if self.total_bytes <= self.max_bytes:
+                    break
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.total_bytes -= size
+                self.stats["evictions"] += 1
+                get_metrics().inc("cache_evictions_total")
+
+    def hit_rate(self) -> float:
+        """
+        Get the fraction of lookups served from the cache.
+
+        Returns:
+            float: Hits divided by lookups, 0.0 before the first lookup.
+        """
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    def clear(self) -> None:
+        """
+        Remove every cached response.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.conn.execute("DELETE FROM responses")
+            self.conn.commit()
+            self.total_bytes = 0
+
+    def close(self) -> None:
+        """
+        Close the underlying database connection.
+
+        Returns:
+            None
+        """
+        logger.info(
+            "Response cache: %s hits, %s misses, %s evictions (hit rate %.1f%%).",
+            self.stats["hits"],
+            self.stats["misses"],
+            self.stats["evictions"],
+            100 * self.hit_rate(),
+        )
+        self.conn.close()
@@ -0,0 +1,147 @@
+# Description: Crawl checkpoints stored in the crawl_state table, so an
+# interrupted crawl resumes at the page where it stopped.
+
+import datetime
+import logging
+from typing import Dict, List, Tuple
+
+from config.db.models import CrawlState
+from utils.crawler import Partition
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+IN_PROGRESS = "in_progress"
+DONE = "done"
+
+
+class CrawlCheckpoint:
+    """
+    Records the progress of every partition of one resource.
+
+    A crawl resumes when the table holds unfinished partitions of the
+    resource; once every partition is done the next crawl starts over.
+    """
+
+    def __init__(self, Session, resource: str) -> None:
+        self.Session = Session
+        self.resource = resource
+        self.session = Session()
+
+    def start(
+        self, partitions: List[Partition]
+    ) -> Tuple[List[Partition], Dict[Partition, int], bool]:
+        """
+        Load the saved progress for the given partitions.
+
+        Args:
+            partitions (List[Partition]): Every partition of the crawl.
+
+        Returns:
+            Tuple[List[Partition], Dict[Partition, int], bool]: The partitions
+            still to crawl, the page to start each of them at, and whether an
+            interrupted crawl is being resumed.
+        """
+        states = {
+            state.partition_key: state
+            for state in self.session.query(CrawlState).filter_by(
+                resource=self.resource
+            )
+        }
+        resuming = any(state.status != DONE for state in states.values())
+        keys = {partition.key for partition in partitions}
+        for key, state in list(states.items()):
+            # Drop all rows of a finished crawl, and rows of partitions that
+            # are no longer planned (e.g. a date window split differently).
+            if not resuming or key not in keys:
+                self.session.delete(state)
+                del states[key]
+        self.session.commit()
+
+        remaining = []
+        start_pages = {}
+        for partition in partitions:
+            state = states.get(partition.key)
+            if state is None:
+                self.session.add(
+                    CrawlState(
+                        partition_key=partition.key,
+                        resource=self.resource,
+                        segment_id=partition.segment_id,
+                        genre_id=partition.genre_id,
+                        subgenre_id=partition.subgenre_id,
+                        status=PENDING,
+                    )
+                )
+                remaining.append(partition)
+            elif state.status != DONE:
+                remaining.append(partition)
+                start_pages[partition] = state.last_page + 1
+        self.session.commit()
+
+        if resuming:
+            logger.info(
+                "Resuming %s crawl: %s of %s partitions left.",
+                self.resource,
+                len(remaining),
+                len(partitions),
+            )
+        return remaining, start_pages, resuming
+
+    def _update(self, partition: Partition, **values) -> None:
+        values["updated_at"] = datetime.datetime.utcnow()
+        self.session.query(CrawlState).filter_by(partition_key=partition.key).update(
+            values
+        )
+        self.session.commit()
+
+    def page_done(self, partition: Partition, page: int, records: int) -> None:
+        """
+        Record that a page has been written.
+
+        Args:
+            partition (Partition): The partition of the page.
+            page (int): The page number.
+            records (int): The number of records written from the page.
+
+        Returns:
+            None
+        """
+        self._update(
+            partition,
+            last_page=page,
+            records=CrawlState.records + records,
+            status=IN_PROGRESS,
+        )
+
+    def partition_done(self, partition: Partition) -> None:
+        """
+        Record that a partition has been crawled to its last page.
+
+        Args:
+            partition (Partition): The partition.
+
+        Returns:
+            None
+        """
+        self._update(partition, status=DONE)
+
+    def close(self) -> None:
+        """
+        Close the session and log partitions left unfinished.
+
+        Returns:
+            None
+        """
+        unfinished = (
+            self.session.query(CrawlState)
+            .filter(CrawlState.resource == self.resource, CrawlState.status != DONE)
+            .count()
+        )
+        if unfinished:
+            logger.info(
+                "%s %s partitions are unfinished and will resume on the next run.",
+                unfinished,
+                self.resource,
+            )
+        self.session.close()
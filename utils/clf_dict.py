@@ -5,7 +5,8 @@ import json
 import logging
 from typing import Dict, Union
 
-import requests
+from config.constants import BASE_URL
+from utils.http_client import FetchError, get_client
 
 logger = logging.getLogger(__name__)
 
@@ -37,42 +38,38 @@ def read_json_file(file_path: str) -> Union[Dict, None]:
         raise ValueError(f"An unexpected error occurred: {err}") from err
 
 
-def get_classifications_data(api_key: str) -> Dict:
+def get_classifications_data(api_key: str, base_url: str = BASE_URL) -> Dict:
     """
     Get the classifications data from the Ticketmaster API.
 
     Args:
         api_key (str): The API key used to fetch data.
+        base_url (str): The Discovery API base URL.
 
     Returns:
         dict: The classifications data.
     """
-    url = f"https://app.ticketmaster.com/discovery/v2/classifications.json?apikey={api_key}&size=200"
-    response = requests.get(url, timeout=360)
-
-    if response.status_code == 200:
-        return response.json()
-    else:
-        logger.info(
-            "Error: Unable to fetch data. Status code: %s", response.status_code
-        )
-        raise ValueError(
-            f"Error: Unable to fetch data. Status code: {response.status_code}"
-        )
+    url = f"{base_url}/classifications.json?apikey={api_key}&size=200"
+    try:
+        return get_client().get_json(url)
+    except FetchError as err:
+        logger.info("Error: Unable to fetch data. Status code: %s", err.status_code)
+        raise
 
 
-def process_json_data(api_key: str) -> Dict:
+def process_json_data(api_key: str, base_url: str = BASE_URL) -> Dict:
     """
     Processes the input JSON data to create a new structure.
 
     Args:
         api_key (str): The API key used to fetch data.
+        base_url (str): The Discovery API base URL.
 
     Returns:
         dict: Processed JSON data.
     """
 
-    data = get_classifications_data(api_key)
+    data = get_classifications_data(api_key, base_url)
 
     if not data:
         logger.info("Error: No data returned from the API.")
@@ -0,0 +1,291 @@
+# Description: Asynchronous crawl engine that fetches the Discovery API
+# partitions (segment / genre / subgenre) and their pages concurrently.
+
+import asyncio
+import logging
+import math
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from config.constants import BASE_URL, DEFAULT_CONCURRENCY, MAX_PAGING_DEPTH, PAGE_SIZE
+from utils.http_client import FetchError, HttpClient, get_client, redact_url
+from utils.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Partition:
+    """
+    A single crawl unit: one resource filtered down to one subgenre.
+
+    Attributes:
+        resource (str): The Discovery API resource, "events" or "attractions".
+        segment_id (str): The segment id.
+        genre_id (str): The genre id.
+        subgenre_id (str): The subgenre id.
+        params (Tuple[Tuple[str, str], ...]): Extra query parameters.
+    """
+
+    resource: str
+    segment_id: str
+    genre_id: str
+    subgenre_id: str
+    params: Tuple[Tuple[str, str], ...] = ()
+
+    @property
+    def key(self) -> str:
+        """
+        A stable identifier of this partition, used for checkpoints.
+
+        Returns:
+            str: The partition key.
+        """
+        parts = [self.resource, self.segment_id, self.genre_id, self.subgenre_id]
+        parts += [f"{key}={value}" for key, value in self.params]
+        return ":".join(str(part) for part in parts)
+
+    def url(
+        self, api_key: str, page: int, base_url: str = BASE_URL, size: int = PAGE_SIZE
+    ) -> str:
+        """
+        Build the request URL of the given page of this partition.
+
+        Args:
+            api_key (str): The API key for accessing the Ticketmaster API.
+            page (int): The page number.
+            base_url (str): The Discovery API base URL.
+            size (int): The page size.
+
+        Returns:
+            str: The request URL.
+        """
+        url = (
+            f"{base_url}/{self.resource}.json?apikey={api_key}&size={size}&page={page}"
+            f"&segmentId={self.segment_id}&genreId={self.genre_id}&subGenreId={self.subgenre_id}"
+        )
+        for key, value in self.params:
+            url += f"&{key}={value}"
+        return url
+
+
+def iter_partitions(
+    resource: str,
+    segment_json: Dict[str, Dict[str, List[Dict[str, str]]]],
+    params: Tuple[Tuple[str, str], ...] = (),
+) -> List[Partition]:
+    """
+    Flatten the classifications tree into crawl partitions.
+
+    Args:
+        resource (str): The Discovery API resource, "events" or "attractions".
+        segment_json (Dict[str, Dict[str, List[Dict[str, str]]]]): The output of process_json_data.
+        params (Tuple[Tuple[str, str], ...]): Extra query parameters for every partition.
+
+    Returns:
+        List[Partition]: One partition per subgenre.
+    """
+    partitions = []
+    for segment_info in segment_json:
+        segment_id = segment_info.split("-")[-1]
+        for genres in segment_json[segment_info]["genres"]:
+            for sub_genre in genres["subgenres"]:
+                partitions.append(
+                    Partition(
+                        resource,
+                        segment_id,
+                        genres.get("id"),
+                        sub_genre.get("id"),
+                        params,
+                    )
+                )
+    return partitions
+
+
+class Crawler:
+    """
+    Fetches many partitions and pages at once.
+
+    Blocking fetches run on a thread pool through the shared HTTP client, and
+    an asyncio semaphore caps the number of requests in flight at
+    ``concurrency``. Pages are handed to the ``on_page`` callback on the
+    calling thread, in page order per partition, so callbacks never need
+    locking. Pages that still fail after the client's retries are logged and
+    listed in ``failures``; their partition stops there and is not reported
+    as done.
+
+    With a ``page_parser`` and ``parse_workers`` > 0, raw page bodies are
+    decoded by the parser on a process pool, outside the request semaphore,
+    so parsing uses several cores while the fetchers keep the network busy.
+    The parser must be picklable and return the page as on_page receives it.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        base_url: str = BASE_URL,
+        page_size: int = PAGE_SIZE,
+        client: Optional[HttpClient] = None,
+        max_depth: int = MAX_PAGING_DEPTH,
+        page_parser: Optional[Callable[[bytes], Dict]] = None,
+        parse_workers: int = 0,
+    ) -> None:
+        self.api_key = api_key
+        self.concurrency = max(1, concurrency)
+        self.base_url = base_url
+        self.page_size = page_size
+        self.client = client or get_client()
+        self.failures: List[str] = []
+        self.max_depth = max_depth
+        self.max_pages = math.ceil(max_depth / page_size)
+        self.page_parser = page_parser if parse_workers > 0 else None
+        self.parse_workers = parse_workers
+
+    def run(
+        self,
+        partitions: Iterable[Partition],
+        on_page: Callable[[Partition, int, Dict], None],
+        start_pages: Optional[Dict[Partition, int]] = None,
+        on_done: Optional[Callable[[Partition], None]] = None,
+    ) -> None:
+        """
+        Crawl every page of every partition.
+
+        Args:
+            partitions (Iterable[Partition]): The partitions to crawl.
+            on_page (Callable[[Partition, int, Dict], None]): Called with the
+                partition, the page number and the decoded page for every page
+                that has results.
+            start_pages (Dict[Partition, int], optional): The first page to
+                fetch per partition, 0 for partitions not listed.
+            on_done (Callable[[Partition], None], optional): Called once a
+                partition has been crawled to its last page.
+
+        Returns:
+            None
+        """
+        self._start_pages = start_pages or {}
+        self._on_done = on_done
+        self._execute(
+            [self._crawl_partition(partition, on_page) for partition in partitions],
+            parse=True,
+        )
+        if self.failures:
+            logger.info("%s pages failed and were skipped.", len(self.failures))
+
+    def count(self, partitions: Iterable[Partition]) -> Dict[Partition, Optional[int]]:
+        """
+        Get the number of matching records of every partition.
+
+        Each partition costs one size=1 request reading ``page.totalElements``.
+
+        Args:
+            partitions (Iterable[Partition]): The partitions to count.
+
+        Returns:
+            Dict[Partition, Optional[int]]: The record count per partition,
+            None where the request failed.
+        """
+        partitions = list(partitions)
+        totals = self._execute(
+            [self._fetch(p, 0, size=1, parse=False) for p in partitions]
+        )
+        return {
+            partition: (
+                None if data is None else data.get("page", {}).get("totalElements", 0)
+            )
+            for partition, data in zip(partitions, totals)
+        }
+
+    def _execute(self, coroutines: List, parse: bool = False) -> List:
+        # The parse workers are only started for coroutines that parse pages;
+        # planner probes fetch raw counts and would start them for nothing.
+        async def main() -> List:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._parse_executor = None
+            with ExitStack() as stack:
+                self._executor = stack.enter_context(
+                    ThreadPoolExecutor(max_workers=self.concurrency)
+                )
+                if parse and self.page_parser is not None:
+                    self._parse_executor = stack.enter_context(
+                        ProcessPoolExecutor(max_workers=self.parse_workers)
+                    )
+                return await asyncio.gather(*coroutines)
+
+        return asyncio.run(main())
+
+    async def _fetch(
+        self,
+        partition: Partition,
+        page: int,
+        size: Optional[int] = None,
+        parse: bool = True,
+    ) -> Optional[Dict]:
+        url = partition.url(self.api_key, page, self.base_url, size or self.page_size)
+        parser = self.page_parser if parse else None
+        loop = asyncio.get_running_loop()
+        metrics = get_metrics()
+        resource = partition.resource
+        # Queue depths: requests waiting for a slot, in flight, and parsing.
+        metrics.add("crawl_requests_waiting", 1, resource=resource)
+        async with self._semaphore:
+            metrics.add("crawl_requests_waiting", -1, resource=resource)
+            metrics.add("crawl_requests_in_flight", 1, resource=resource)
+            try:
+                body = await loop.run_in_executor(
+                    self._executor,
+                    self.client.get_json if parser is None else self.client.get_body,
+                    url,
+                )
+            except FetchError as err:
+                logger.info("Error: Skipping %s. %s", redact_url(url), err)
+                self.failures.append(redact_url(url))
+                metrics.inc("crawl_page_failures_total", resource=resource)
+                return None
+            finally:
+                metrics.add("crawl_requests_in_flight", -1, resource=resource)
+        metrics.inc("crawl_pages_total", resource=resource)
+        if parser is None:
+            return body
+        metrics.add("crawl_pages_parsing", 1, resource=resource)
+        try:
+            return await loop.run_in_executor(self._parse_executor, parser, body)
+        finally:
+            metrics.add("crawl_pages_parsing", -1, resource=resource)
+
+    async def _crawl_partition(
+        self,
+        partition: Partition,
+        on_page: Callable[[Partition, int, Dict], None],
+    ) -> None:
+        # Every partition runs in its own task, so its span nests in the
+        # span that was current when the crawl started.
+        with get_metrics().span("crawl_partition", partition=partition.key):
+            start = self._start_pages.get(partition, 0)
+            first = await self._fetch(partition, start)
+            if first is None:
+                return
+
+            if "_embedded" in first:
+                total_pages = first.get("page", {}).get("totalPages", 1)
+                last_page = min(total_pages, self.max_pages)
+                rest = await asyncio.gather(
+                    *(
+                        self._fetch(partition, page)
+                        for page in range(start + 1, last_page)
+                    )
+                )
+
+                for page, data in enumerate([first, *rest], start=start):
+                    if data is None:
+                        return
+                    if "_embedded" not in data:
+                        break
+                    on_page(partition, page, data)
+
+            if self._on_done is not None:
+                self._on_done(partition)
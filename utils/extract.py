@@ -0,0 +1,214 @@
+# Description: Declarative field extraction for Discovery API records. Field
+# paths are declared once and compiled into a single-pass extractor.
+
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+WILDCARD = "*"
+
+
+@dataclass(frozen=True)
+class Field:
+    """
+    A field extracted from a record.
+
+    ``path`` is a dotted path of dict keys and list indices, e.g.
+    "_embedded.venues.0.city.name". A "*" step maps the rest of the path
+    over a list and yields a list of values. ``transform``, when given, is
+    applied to the extracted value, also when it is missing (None).
+    """
+
+    path: str
+    transform: Optional[Callable[[Any], Any]] = None
+
+
+def join(values: List[Any]) -> str:
+    """
+    Join the values of a "*" path with ", ", as the CSV columns hold them.
+
+    Args:
+        values (List[Any]): The extracted values.
+
+    Returns:
+        str: The joined values.
+    """
+    return ", ".join(map(str, values))
+
+
+def _parse_path(path: str) -> List[Union[str, int]]:
+    return [int(step) if step.isdigit() else step for step in path.split(".")]
+
+
+def _step(value: Any, step: Union[str, int]) -> Any:
+    if isinstance(step, int):
+        if isinstance(value, list) and len(value) > step:
+            return value[step]
+        return None
+    if isinstance(value, dict):
+        return value.get(step)
+    return None
+
+
+def _getter(steps: List[Union[str, int]]) -> Callable[[Any], Any]:
+    def get(value: Any) -> Any:
+        for step in steps:
+            value = _step(value, step)
+        return value
+
+    return get
+
+
+def _split(field: Field) -> Tuple[List[Union[str, int]], Optional[List]]:
+    steps = _parse_path(field.path)
+    if WILDCARD not in steps:
+        return steps, None
+    position = steps.index(WILDCARD)
+    steps, rest = steps[:position], steps[position + 1 :]
+    if WILDCARD in rest:
+        raise ValueError(f"Only one '*' is allowed in {field.path}.")
+    return steps, rest
+
+
+def _checked(fields: Dict[str, Field]) -> Callable[[Dict], Dict[str, Any]]:
+    # Type-checks every step; used for records the fast path cannot walk.
+    getters = []
+    for column, field in fields.items():
+        steps, rest = _split(field)
+        getters.append(
+            (column, _getter(steps), None if rest is None else _getter(rest), field)
+        )
+
+    def extract(record: Dict) -> Dict[str, Any]:
+        row = {}
+        for column, get, get_item, field in getters:
+            value = get(record)
+            if get_item is not None:
+                items = value if isinstance(value, list) else []
+                value = [get_item(item) for item in items]
+            row[column] = value if field.transform is None else field.transform(value)
+        return row
+
+    return extract
+
+
+def _step_source(source: str, step: Union[str, int], default: str) -> str:
+    if isinstance(step, int):
+        return f"({source}[{step}] if len({source}) > {step} else {default})"
+    if default == "None":
+        return f"{source}.get({step!r})"
+    return f"({source}.get({step!r}) or {default})"
+
+
+def _compile(
+    fields: Dict[str, Field],
+) -> Callable[[List[Dict]], List[Dict[str, Any]]]:
+    # Generate one function that walks every distinct path prefix once per
+    # record into a local variable and builds the row as a dict literal.
+    # Missing containers become an empty dict, so the walk needs no type
+    # checks; a record with an unexpected type raises and goes through the
+    # checked extractor instead.
+    lines = []
+    namespace = {"EMPTY": {}, "checked": _checked(fields)}
+    nodes = {(): "record"}
+    values = {}
+
+    def node(steps) -> str:
+        steps = tuple(steps)
+        if steps not in nodes:
+            parent = node(steps[:-1])
+            nodes[steps] = f"v{len(nodes)}"
+            source = _step_source(parent, steps[-1], "EMPTY")
+            lines.append(f"            {nodes[steps]} = {source}")
+        return nodes[steps]
+
+    for position, (column, field) in enumerate(fields.items()):
+        steps, rest = _split(field)
+        if rest is None:
+            value = _step_source(node(steps[:-1]), steps[-1], "None")
+        else:
+            source = node(steps)
+            item = "item"
+            for index, step in enumerate(rest):
+                default = "None" if index == len(rest) - 1 else "EMPTY"
+                item = _step_source(item, step, default)
+            value = f"[{item} for item in {source}]"
+        if field.transform is not None:
+            namespace[f"transform{position}"] = field.transform
+            value = f"transform{position}({value})"
+        values[column] = value
+
+    row = ", ".join(f"{column!r}: {value}" for column, value in values.items())
+    source = "\n".join(
+        [
+            "def extract_many(records):",
+            "    rows = []",
+            "    append = rows.append",
+            "    for record in records:",
+            "        try:",
+            *lines,
+            f"            append({{{row}}})",
+            "        except (AttributeError, KeyError, TypeError):",
+            "            append(checked(record))",
+            "    return rows",
+        ]
+    )
+    exec(compile(source, "<extractor>", "exec"), namespace)
+    return namespace["extract_many"]
+
+
+class Extractor:
+    """
+    Extracts columns from API records in one walk over each record.
+
+    The field paths are compiled into one generated function in which every
+    shared prefix, such as the first venue of an event, is looked up once
+    per record, not once per field. Rows hold the columns in the order they
+    were declared.
+    """
+
+    def __init__(self, fields: Dict[str, Union[str, Field]]) -> None:
+        self.columns = list(fields)
+        self.fields = {
+            column: Field(field) if isinstance(field, str) else field
+            for column, field in fields.items()
+        }
+        self._extract_many = _compile(self.fields)
+
+    def column_of(self, path: str) -> Optional[str]:
+        """
+        Get the column extracted from a path.
+
+        Args:
+            path (str): The field path, e.g. "id".
+
+        Returns:
+            str or None: The first column with that path, None if there is none.
+        """
+        return next(
+            (column for column, field in self.fields.items() if field.path == path),
+            None,
+        )
+
+    def __call__(self, record: Dict) -> Dict[str, Any]:
+        """
+        Extract the columns of a record.
+
+        Args:
+            record (Dict): The record as returned by the API.
+
+        Returns:
+            Dict[str, Any]: The row, keyed by column name.
+        """
+        return self._extract_many((record,))[0]
+
+    def extract_many(self, records: List[Dict]) -> List[Dict[str, Any]]:
+        """
+        Extract the columns of a page of records.
+
+        Args:
+            records (List[Dict]): The records as returned by the API.
+
+        Returns:
+            List[Dict[str, Any]]: The rows, in the order of the records.
+        """
+        return self._extract_many(records)
@@ -1,18 +1,77 @@
-# Description: Helper functions for processing data 
+# Description: Helper functions for processing data
 # and interacting with the database.
 
+import datetime
 import logging
-from typing import Dict, List
+import multiprocessing
+import os
+import re
+from functools import partial
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 import pandas as pd
-import requests
+from sqlalchemy import and_, create_engine, select, text
 from sqlalchemy.engine import Engine
 from sqlalchemy.inspection import inspect
 
-from config.db.models import Attraction, Event
+from config.constants import (
+    ATTRACTIONS_CSV,
+    BASE_URL,
+    DAILY_QUOTA,
+    DEFAULT_CONCURRENCY,
+    EVENT_WINDOW_DAYS,
+    EVENTS_CSV,
+    INGEST_BATCH_SIZE,
+    INGEST_QUEUE_SIZE,
+    RATE_LIMIT_PER_SECOND,
+    STAGING_CHUNK_SIZE,
+    WORK_LEASE_SECONDS,
+)
+from config.db.models import (
+    Attraction,
+    Base,
+    CacheGeneration,
+    Event,
+    EventAttraction,
+    EventDma,
+    Venue,
+)
+from utils.checkpoint import CrawlCheckpoint
+from utils.clf_dict import process_json_data
+from utils.crawler import Crawler, Partition, iter_partitions
+from utils.dedup import SeenSet, make_seen_ids
+from utils.extract import Extractor, Field, join
+from utils.http_client import HttpClient, decode_json
+from utils.links import VENUE_COLUMNS, EventRelations
+from utils.metrics import configure_metrics, get_metrics
+from utils.orchestrator import Stage
+from utils.planner import plan_crawl, plan_event_partitions
+from utils.query_cache import Invalidator
+from utils.search import SearchIndexer
+from utils.work_queue import WorkQueue, default_worker_id
+from utils.writers import (
+    CsvWriter,
+    DatabaseWriter,
+    ParquetWriter,
+    QueueWriter,
+    column_converters,
+    format_csv_row,
+    read_parquet,
+)
 
 logger = logging.getLogger(__name__)
 
+
 def process_data(
     db_df: pd.DataFrame, engine: Engine, file_path: str, subset_: str, table_name: str
 ) -> None:
@@ -22,29 +81,25 @@ def process_data(
     Args:
         db_df (pd.DataFrame): The DataFrame containing data from the database.
         engine (Engine): The SQLAlchemy engine object.
-        file_path (str): The path to the CSV file.
+        file_path (str): The path to the CSV file or Parquet dataset.
         subset_ (str): The column name to use for identifying duplicates.
         table_name (str): The name of the table in the database.
 
     Returns:
         None
     """
+    # read the staging file
+    csv_df = read_staging(file_path, table_name)
+
     if db_df.empty:
         logger.info("No data in the database.")
-        final_df = pd.read_csv(file_path)
+        final_df = csv_df
     else:
-        # read the csv file
-        csv_df = pd.read_csv(file_path)
-
-        merged_df = pd.merge(csv_df, db_df, how="left", indicator=True)
-
-        # Filter rows from csv_df that are not in db_df
-        not_in_db_df = merged_df[merged_df["_merge"] == "left_only"]
-
-        # Drop the indicator column if you don't need it
-        final_df = not_in_db_df.drop(columns=["_merge"])
+        # Filter rows from csv_df whose key is not in db_df. Rows already in
+        # the database are skipped, since the key column is unique.
+        final_df = csv_df[~csv_df[subset_].isin(db_df[subset_])]
 
-    logger.info(final_df.count())
+    logger.info(f"{len(final_df)} new rows for {table_name}.")
 
     duplicated_rows = final_df[final_df.duplicated(subset=subset_)]
     logger.info(f"Number of duplicated rows: {duplicated_rows.shape[0]}")
@@ -52,12 +107,175 @@ def process_data(
     df_unique = final_df.drop_duplicates(subset=[subset_])
 
     # write to the database
-    df_unique.to_sql(table_name, con=engine, if_exists="append", index=False)
+    with engine.begin() as connection:
+        _append_rows(connection, df_unique, table_name, related_writer(table_name))
+
+
+def _append_rows(
+    connection, df: pd.DataFrame, table_name: str, write_related=None
+) -> None:
+    """
+    Append staged rows to their table, after the rows derived from them.
+
+    Args:
+        connection (Connection): The connection, inside a transaction.
+        df (pd.DataFrame): The staged rows, possibly with columns the table
+            does not store, e.g. the venue of an event.
+        table_name (str): The name of the table in the database.
+        write_related (Callable, optional): Writes the derived rows.
+
+    Returns:
+        None
+    """
+    if write_related is not None:
+        write_related(connection, df.to_dict(orient="records"))
+    table = Base.metadata.tables[table_name]
+    columns = [column for column in df.columns if column in table.columns]
+    df[columns].to_sql(table_name, con=connection, if_exists="append", index=False)
+
+
+def process_new_data(
+    engine: Engine,
+    file_path: str,
+    subset_: str,
+    table_name: str,
+    chunksize: int = STAGING_CHUNK_SIZE,
+) -> int:
+    """
+    Append the staged rows whose key is not in the database yet.
+
+    Unlike process_data this never loads the table: the staging file is
+    read in chunks, and every chunk's keys go into a temporary table that is
+    anti-joined against the indexed key column. The cost grows with the
+    staged batch, not with the database.
+
+    Args:
+        engine (Engine): The SQLAlchemy engine object.
+        file_path (str): The path to the CSV file or Parquet dataset.
+        subset_ (str): The key column used to identify duplicates.
+        table_name (str): The name of the table in the database.
+        chunksize (int): The number of staged rows read at a time.
+
+    Returns:
+        int: The number of rows appended.
+    """
+    appended = 0
+    duplicated = 0
+    existing = 0
+    seen = set()
+    metrics = get_metrics()
+    write_related = related_writer(table_name)
+
+    with engine.begin() as connection:
+        connection.execute(
+            text("CREATE TEMP TABLE IF NOT EXISTS staged_keys (key TEXT PRIMARY KEY)")
+        )
+        for chunk in read_staging(file_path, table_name, chunksize=chunksize):
+            # Drop rows repeating a key staged earlier in the file
+            unique = chunk.drop_duplicates(subset=[subset_])
+            unique = unique[~unique[subset_].isin(seen)]
+            duplicated += len(chunk) - len(unique)
+            keys = unique[subset_].dropna().astype(str).tolist()
+            seen.update(keys)
+
+            connection.execute(text("DELETE FROM staged_keys"))
+            if keys:
+                connection.execute(
+                    text("INSERT INTO staged_keys (key) VALUES (:key)"),
+                    [{"key": key} for key in keys],
+                )
+            new_keys = connection.execute(
+                text(
+                    f"SELECT s.key FROM staged_keys s WHERE NOT EXISTS "
+                    f"(SELECT 1 FROM {table_name} t WHERE t.{subset_} = s.key)"
+                )
+            ).scalars()
+            new_rows = unique[unique[subset_].isin(set(new_keys))]
+            existing += len(unique) - len(new_rows)
+
+            # write to the database
+            with metrics.timer("to_sql_seconds", table=table_name):
+                _append_rows(connection, new_rows, table_name, write_related)
+            appended += len(new_rows)
+
+        connection.execute(text("DROP TABLE staged_keys"))
+
+    metrics.inc("rows_inserted_total", appended, table=table_name)
+    metrics.inc("rows_skipped_total", existing, table=table_name, reason="stored")
+    metrics.inc("rows_skipped_total", duplicated, table=table_name, reason="duplicate")
+    logger.info(
+        f"{table_name}: {appended} rows appended, {existing} already stored, "
+        f"{duplicated} duplicated rows dropped."
+    )
+    return appended
+
+
+def read_staging(
+    file_path: str,
+    table_name: str,
+    chunksize: Optional[int] = None,
+    columns: Optional[List[str]] = None,
+) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """
+    Read a staging file written by the crawl, a CSV file or a Parquet dataset.
+
+    Args:
+        file_path (str): The path to the CSV file or the ".parquet" dataset.
+        table_name (str): The name of the table the rows are loaded into.
+        chunksize (int, optional): Read the file in chunks of this many rows.
+        columns (List[str], optional): The columns to read, all by default.
+
+    Returns:
+        pd.DataFrame or Iterator[pd.DataFrame]: The staged rows, or an
+        iterator over chunks of them when chunksize is given.
+    """
+    if str(file_path).endswith(".parquet"):
+        # Parquet columns are typed already.
+        return read_parquet(file_path, columns=columns, chunksize=chunksize)
+    return read_staging_csv(file_path, table_name, chunksize=chunksize, columns=columns)
+
+
+def read_staging_csv(
+    file_path: str,
+    table_name: str,
+    chunksize: Optional[int] = None,
+    columns: Optional[List[str]] = None,
+) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """
+    Read a CSV staging file, converting typed columns to the table's types.
+
+    Args:
+        file_path (str): The path to the CSV file.
+        table_name (str): The name of the table the rows are loaded into.
+        chunksize (int, optional): Read the file in chunks of this many rows.
+        columns (List[str], optional): The columns to read, all by default.
+
+    Returns:
+        pd.DataFrame or Iterator[pd.DataFrame]: The staged rows, or an
+        iterator over chunks of them when chunksize is given.
+    """
+    converters = column_converters(
+        Base.metadata.tables[table_name],
+        *(model.__table__ for model in related_models(table_name)),
+    )
+
+    def convert(df: pd.DataFrame) -> pd.DataFrame:
+        for column, convert_value in converters.items():
+            if column in df:
+                df[column] = df[column].map(convert_value).astype(object)
+        return df
+
+    if chunksize is None:
+        return convert(pd.read_csv(file_path, usecols=columns))
+    return (
+        convert(chunk)
+        for chunk in pd.read_csv(file_path, chunksize=chunksize, usecols=columns)
+    )
 
 
 def check_tables_exist(engine_: Engine) -> bool:
     """
-    Check if the specified tables exist in the database.
+    Check if all the tables of the models exist in the database.
 
     Args:
         engine_ (Engine): The SQLAlchemy engine object.
@@ -66,365 +284,1119 @@ def check_tables_exist(engine_: Engine) -> bool:
         bool: True if all tables exist, False otherwise.
     """
     inspector = inspect(engine_)
-    return all(
-        inspector.has_table(table_name)
-        for table_name in ["events", "attractions"]
-    )
+    return all(inspector.has_table(table_name) for table_name in Base.metadata.tables)
+
+
+ATTRACTION_FIELDS = {
+    "name": "name",
+    "attraction_id": "id",
+    "attraction_type": "type",
+    "attraction_url": "url",
+    "attraction_image": "images.0.url",
+    "segment": "classifications.0.segment.name",
+    "genre": "classifications.0.genre.name",
+    "sub_genre": "classifications.0.subGenre.name",
+}
+EVENT_FIELDS = {
+    "name": "name",
+    "type": "type",
+    "event_id": "id",
+    "event_url": "url",
+    "event_image": "images.0.url",
+    "event_date": "dates.start.localDate",
+    "event_time": "dates.start.localTime",
+    "timezone": "dates.timezone",
+    "segment": "classifications.0.segment.name",
+    "genre": "classifications.0.genre.name",
+    "sub_genre": "classifications.0.subGenre.name",
+    "currency": "priceRanges.0.currency",
+    "price_range_min": "priceRanges.0.min",
+    "price_range_max": "priceRanges.0.max",
+    "age_restriction": Field("ageRestrictions", str),
+    "venue_id": "_embedded.venues.0.id",
+    "venue_name": "_embedded.venues.0.name",
+    "venue_city": "_embedded.venues.0.city.name",
+    "venue_state": "_embedded.venues.0.state.name",
+    "venue_country": "_embedded.venues.0.country.countryCode",
+    "venue_address": "_embedded.venues.0.address.line1",
+    "longitude": "_embedded.venues.0.location.longitude",
+    "latitude": "_embedded.venues.0.location.latitude",
+    "dmas": Field("_embedded.venues.0.dmas.*.id", join),
+    "attractions": Field("_embedded.attractions.*.id", join),
+}
+
+ATTRACTION_EXTRACTOR = Extractor(ATTRACTION_FIELDS)
+EVENT_EXTRACTOR = Extractor(EVENT_FIELDS)
+ATTRACTION_COLUMNS = ATTRACTION_EXTRACTOR.columns
+EVENT_COLUMNS = EVENT_EXTRACTOR.columns
+EXTRACTORS = {"attractions": ATTRACTION_EXTRACTOR, "events": EVENT_EXTRACTOR}
+
 
-def get_all_attractions(api_key: str, info) -> None:
+def extract_page(resource: str, body: bytes) -> Dict:
     """
-    Fetches all attractions from the Ticketmaster API and saves them to the database.
+    Decode a raw API page and extract its records into rows.
+
+    This is the page parser the crawl runs on its parse worker processes.
 
     Args:
-        api_key (str): The API key for accessing the Ticketmaster API.
+        resource (str): The resource of the page, "events" or "attractions".
+        body (bytes): The raw response body.
+
+    Returns:
+        Dict: The page metadata, with the extracted rows under
+        ``_embedded.<resource>`` and "extracted" set to True.
+    """
+    data = decode_json(body)
+    if "_embedded" not in data:
+        return data
+    records = data["_embedded"][resource]
+    return {
+        "page": data.get("page", {}),
+        "_embedded": {resource: EXTRACTORS[resource].extract_many(records)},
+        "extracted": True,
+    }
+
+
+def parse_attraction(attraction: Dict) -> Dict[str, Any]:
+    """
+    Extract the stored fields of an attraction returned by the Ticketmaster API.
+
+    Args:
+        attraction (Dict): The attraction as returned by the API.
+
+    Returns:
+        Dict[str, Any]: The attraction record, keyed by column name.
+    """
+    return ATTRACTION_EXTRACTOR(attraction)
+
+
+def parse_event(event: Dict) -> Dict[str, Any]:
+    """
+    Extract the stored fields of an event returned by the Ticketmaster API.
+
+    Args:
+        event (Dict): The event as returned by the API.
+
+    Returns:
+        Dict[str, Any]: The event record, keyed by column name.
     """
-    segment_json = info
+    return EVENT_EXTRACTOR(event)
 
-    # open a csv file
-    with open("./data/raw_data/attraction.csv", "w", encoding="utf-8") as file:
-        file.write(
-            "name,attraction_id,attraction_type,attraction_url,attraction_image,segment,genre,sub_genre\n"
+
+def format_attraction_row(attraction: Dict) -> str:
+    """
+    Format an attraction returned by the Ticketmaster API as a CSV line.
+
+    Args:
+        attraction (Dict): The attraction as returned by the API.
+
+    Returns:
+        str: The CSV line, including the trailing newline.
+    """
+    return format_csv_row(parse_attraction(attraction))
+
+
+def format_event_row(event: Dict) -> str:
+    """
+    Format an event returned by the Ticketmaster API as a CSV line.
+
+    Args:
+        event (Dict): The event as returned by the API.
+
+    Returns:
+        str: The CSV line, including the trailing newline.
+    """
+    return format_csv_row(parse_event(event))
+
+
+def staging_writer(file_path: str, model, columns: List[str]):
+    """
+    Create the writer of a staging file, chosen by its extension.
+
+    Args:
+        file_path (str): The path of a CSV file, or of a ".parquet" dataset.
+        model: The model of the table the rows are loaded into.
+        columns (List[str]): The columns, in file order.
+
+    Returns:
+        ParquetWriter or CsvWriter: The writer.
+    """
+    if str(file_path).endswith(".parquet"):
+        related = related_models(model.__tablename__)
+        return ParquetWriter(file_path, model, columns, related=related)
+    return CsvWriter(file_path, columns)
+
+
+def _crawl(
+    crawler: Crawler,
+    partitions: List[Partition],
+    writer,
+    extractor: Extractor,
+    Session=None,
+    seen: Optional[SeenSet] = None,
+) -> None:
+    """
+    Crawl the given partitions and stream the parsed records into a writer.
+
+    Records whose ID was already seen in another partition are dropped
+    before parsing. With a Session, progress is checkpointed once a page's
+    records are durable in the writer, and an interrupted crawl resumes at
+    its next page.
+
+    Args:
+        crawler (Crawler): The crawler.
+        partitions (List[Partition]): The partitions to crawl.
+        writer: A CsvWriter, ParquetWriter, DatabaseWriter or QueueWriter.
+        extractor (Extractor): Extracts the columns of the API records.
+        Session: SQLAlchemy session factory for checkpoints, or None.
+        seen (SeenSet, optional): The seen-ID structure, an exact set by default.
+
+    Returns:
+        None
+    """
+    resource = partitions[0].resource if partitions else ""
+    seen = SeenSet() if seen is None else seen
+    checkpoint = None
+    start_pages = {}
+    resuming = False
+    if Session is not None:
+        checkpoint = CrawlCheckpoint(Session, resource)
+        partitions, start_pages, resuming = checkpoint.start(partitions)
+
+    # Checkpoint updates wait here, with the number of pages written when
+    # they were made, until the writer has made those pages durable.
+    pending: List[Tuple[int, Callable[[], None]]] = []
+    pages = 0
+    # A QueueWriter makes pages durable on its own thread, behind the crawl.
+    durable_upto = getattr(writer, "durable_upto", None)
+
+    def commit_pending(upto: Optional[int] = None) -> None:
+        done = 0
+        for written, update in pending:
+            if upto is not None and written > upto:
+                break
+            update()
+            done += 1
+        del pending[:done]
+
+    key = extractor.column_of("id")
+    metrics = get_metrics()
+
+    def is_new(record_id: Optional[str]) -> bool:
+        # Records without an ID cannot be told apart, so all of them are kept.
+        return not record_id or seen.add(record_id)
+
+    def on_page(partition: Partition, page: int, data: Dict) -> None:
+        fetched = data["_embedded"][resource]
+        if data.get("extracted"):
+            # Extracted by a parse worker already.
+            records = [row for row in fetched if is_new(row[key])]
+        else:
+            records = extractor.extract_many(
+                [record for record in fetched if is_new(record.get("id"))]
+            )
+        metrics.inc("rows_fetched_total", len(fetched), resource=resource)
+        metrics.inc(
+            "rows_deduped_total", len(fetched) - len(records), resource=resource
         )
-        for segment_info in segment_json:
-            for genres in segment_json[segment_info]["genres"]:
-                for sub_genre in genres["subgenres"]:
-
-                    segment_id = segment_info.split("-")[-1]
-                    genres_id = genres.get("id")
-                    sub_genre_id = sub_genre.get("id")
-                    page = 0
-
-                    while True:
-                        url = f"https://app.ticketmaster.com/discovery/v2/attractions.json?apikey={api_key}&size=200&page={page}&segmentId={segment_id}&genreId={genres_id}&subGenreId={sub_genre_id}"
-                        response = requests.get(url, timeout=360)
-                        data = response.json()
-                        if "_embedded" not in data:
-                            break
-                        count = 0
-                        for attraction in data["_embedded"]["attractions"]:
-                            name = attraction.get("name")
-                            attraction_id = attraction.get("id")
-                            attraction_type = attraction.get("type")
-                            attraction_url = attraction.get("url")
-                            attraction_image = attraction.get("images", [{}])[0].get(
-                                "url"
-                            )
-                            segment = (
-                                attraction.get("classifications", [{}])[0]
-                                .get("segment", {})
-                                .get("name")
-                            )
-                            genre = (
-                                attraction.get("classifications", [{}])[0]
-                                .get("genre", {})
-                                .get("name")
-                            )
-                            sub_genre = (
-                                attraction.get("classifications", [{}])[0]
-                                .get("subGenre", {})
-                                .get("name")
-                            )
-
-                            # Replace comma with /
-                            if name is not None and "," in name:
-                                name = name.replace(",", "/")
-                            if attraction_id is not None and "," in attraction_id:
-                                attraction_id = attraction_id.replace(",", "/")
-                            if attraction_type is not None and "," in attraction_type:
-                                attraction_type = attraction_type.replace(",", "/")
-                            if attraction_url is not None and "," in attraction_url:
-                                attraction_url = attraction_url.replace(",", "/")
-                            if attraction_image is not None and "," in attraction_image:
-                                attraction_image = attraction_image.replace(",", "/")
-                            if segment is not None and "," in segment:
-                                segment = segment.replace(",", "/")
-                            if genre is not None and "," in genre:
-                                genre = genre.replace(",", "/")
-                            if sub_genre is not None and "," in sub_genre:
-                                sub_genre = sub_genre.replace(",", "/")
-
-                            # write to the csv file
-                            file.write(
-                                f"{name},{attraction_id},{attraction_type},{attraction_url},{attraction_image},{segment},{genre},{sub_genre}\n"
-                            )
-
-                            count += 1
-
-                        if data["page"]["totalPages"] == page - 1:
-                            break
-
-                        logger.info(f"Page {page} done. and {count} attractions added.")
-                        page += 1
+        nonlocal pages
+        durable = writer.write(records)
+        pages += 1
+        if checkpoint is not None:
+            update = partial(checkpoint.page_done, partition, page, len(records))
+            pending.append((pages, update))
+        if durable:
+            commit_pending()
+        elif durable_upto is not None:
+            commit_pending(durable_upto())
+        metrics.inc("rows_written_total", len(records), resource=resource)
+        logger.info(f"Page {page} done. and {len(records)} {resource} added.")
+
+    def on_done(partition: Partition) -> None:
+        pending.append((pages, partial(checkpoint.partition_done, partition)))
+
+    writer.open(append=resuming)
+    try:
+        crawler.run(
+            partitions,
+            on_page,
+            start_pages=start_pages,
+            on_done=on_done if checkpoint is not None else None,
+        )
+        logger.info(
+            "%s: %s duplicate records of %s dropped (%.1f%%).",
+            resource,
+            seen.duplicates,
+            seen.checked,
+            100 * seen.ratio(),
+        )
+    finally:
+        # Even when the crawl failed, the pages handed to the writer are
+        # durable once it is closed, e.g. in a published Parquet part, so
+        # their progress is kept.
+        try:
+            writer.close()
+            commit_pending()
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+
+
+def _plan_events(
+    crawler: Crawler,
+    segment_json: Dict[str, Dict[str, List[Dict[str, str]]]],
+    start_date: Optional[datetime.datetime],
+    end_date: Optional[datetime.datetime],
+) -> List[Partition]:
+    """
+    Plan the event partitions of a date window, by default today and the
+    following EVENT_WINDOW_DAYS days (UTC).
+    """
+    if start_date is None:
+        start_date = datetime.datetime.combine(
+            datetime.datetime.utcnow().date(), datetime.time()
+        )
+    if end_date is None:
+        end_date = start_date + datetime.timedelta(
+            days=EVENT_WINDOW_DAYS, hours=23, minutes=59, seconds=59
+        )
+    return plan_event_partitions(crawler, segment_json, start_date, end_date)
+
+
+def _plan_attractions(
+    crawler: Crawler, info: Dict[str, Dict[str, List[Dict[str, str]]]]
+) -> List[Partition]:
+    """
+    Plan the attraction partitions: empty subgenres dropped, largest first.
+    """
+    return plan_crawl(crawler, iter_partitions("attractions", info)).partitions
+
+
+def get_all_attractions(
+    api_key: str,
+    info: Dict[str, Dict[str, List[Dict[str, str]]]],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    file_path: str = ATTRACTIONS_CSV,
+    base_url: str = BASE_URL,
+    client: Optional[HttpClient] = None,
+    Session=None,
+    dedup: str = "set",
+    parse_workers: int = 0,
+) -> None:
+    """
+    Fetches all attractions from the Ticketmaster API and saves them to a staging file.
+
+    Args:
+        api_key (str): The API key for accessing the Ticketmaster API.
+        info (Dict[str, Dict[str, List[Dict[str, str]]]]): A dictionary containing segment information.
+        concurrency (int): The maximum number of requests in flight at once.
+        file_path (str): The path to the CSV file, or to a Parquet dataset
+            if it ends in ".parquet".
+        base_url (str): The Discovery API base URL.
+        client (HttpClient, optional): The HTTP client, the shared one by default.
+        Session: SQLAlchemy session factory. When given, the crawl is
+            checkpointed and resumes after an interruption.
+        dedup (str): The seen-ID structure dropping records found in more
+            than one partition, "set" (exact) or "bloom".
+        parse_workers (int): The number of processes decoding and extracting
+            pages, 0 to parse on the calling thread.
+
+    Returns:
+        None
+    """
+    crawler = Crawler(
+        api_key,
+        concurrency=concurrency,
+        base_url=base_url,
+        client=client,
+        page_parser=partial(extract_page, "attractions"),
+        parse_workers=parse_workers,
+    )
+    _crawl(
+        crawler,
+        _plan_attractions(crawler, info),
+        staging_writer(file_path, Attraction, ATTRACTION_COLUMNS),
+        ATTRACTION_EXTRACTOR,
+        Session,
+        make_seen_ids(dedup),
+    )
 
 
 def get_all_events(
-    api_key: str, segment_json: Dict[str, Dict[str, List[Dict[str, str]]]]
+    api_key: str,
+    segment_json: Dict[str, Dict[str, List[Dict[str, str]]]],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    file_path: str = EVENTS_CSV,
+    base_url: str = BASE_URL,
+    client: Optional[HttpClient] = None,
+    Session=None,
+    start_date: Optional[datetime.datetime] = None,
+    end_date: Optional[datetime.datetime] = None,
+    dedup: str = "set",
+    parse_workers: int = 0,
+) -> None:
+    """
+    Fetches all events from the Ticketmaster API and saves them to a staging file.
+
+    Every subgenre is split into date windows small enough to page through
+    completely, and the windows are crawled concurrently.
+
+    Args:
+        api_key (str): The API key for accessing the Ticketmaster API.
+        segment_json (Dict[str, Dict[str, List[Dict[str, str]]]]): A dictionary containing segment information.
+        concurrency (int): The maximum number of requests in flight at once.
+        file_path (str): The path to the CSV file, or to a Parquet dataset
+            if it ends in ".parquet".
+        base_url (str): The Discovery API base URL.
+        client (HttpClient, optional): The HTTP client, the shared one by default.
+        Session: SQLAlchemy session factory. When given, the crawl is
+            checkpointed and resumes after an interruption.
+        start_date (datetime.datetime, optional): The earliest event start
+            in UTC, the start of today by default.
+        end_date (datetime.datetime, optional): The latest event start in UTC,
+            the end of the day EVENT_WINDOW_DAYS after start_date by default.
+        dedup (str): The seen-ID structure dropping records found in more
+            than one partition, "set" (exact) or "bloom".
+        parse_workers (int): The number of processes decoding and extracting
+            pages, 0 to parse on the calling thread.
+
+    Returns:
+        None
+    """
+    crawler = Crawler(
+        api_key,
+        concurrency=concurrency,
+        base_url=base_url,
+        client=client,
+        page_parser=partial(extract_page, "events"),
+        parse_workers=parse_workers,
+    )
+    _crawl(
+        crawler,
+        _plan_events(crawler, segment_json, start_date, end_date),
+        staging_writer(file_path, Event, EVENT_COLUMNS),
+        EVENT_EXTRACTOR,
+        Session,
+        make_seen_ids(dedup),
+    )
+
+
+def ingest_all_attractions(
+    api_key: str,
+    info: Dict[str, Dict[str, List[Dict[str, str]]]],
+    engine: Engine,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    base_url: str = BASE_URL,
+    client: Optional[HttpClient] = None,
+    Session=None,
+    batch_size: int = INGEST_BATCH_SIZE,
+    dedup: str = "set",
+    parse_workers: int = 0,
+    queue_size: int = 0,
 ) -> None:
     """
-    Fetches all events from the Ticketmaster API and saves them to the database.
+    Fetches all attractions from the Ticketmaster API and upserts them
+    straight into the attractions table, without a CSV file.
+
+    Args:
+        api_key (str): The API key for accessing the Ticketmaster API.
+        info (Dict[str, Dict[str, List[Dict[str, str]]]]): A dictionary containing segment information.
+        engine (Engine): The SQLAlchemy engine object.
+        concurrency (int): The maximum number of requests in flight at once.
+        base_url (str): The Discovery API base URL.
+        client (HttpClient, optional): The HTTP client, the shared one by default.
+        Session: SQLAlchemy session factory. When given, the crawl is
+            checkpointed and resumes after an interruption.
+        batch_size (int): The number of rows per upsert batch.
+        dedup (str): The seen-ID structure dropping records found in more
+            than one partition, "set" (exact) or "bloom".
+        parse_workers (int): The number of processes decoding and extracting
+            pages, 0 to parse on the calling thread.
+        queue_size (int): When > 0, upsert on a writer thread fed through a
+            queue of this many pages, so upserts overlap the crawl.
+
+    Returns:
+        None
+    """
+    crawler = Crawler(
+        api_key,
+        concurrency=concurrency,
+        base_url=base_url,
+        client=client,
+        page_parser=partial(extract_page, "attractions"),
+        parse_workers=parse_workers,
+    )
+    writer = database_writer("attractions", engine, batch_size)
+    if queue_size > 0:
+        writer = QueueWriter(writer, queue_size)
+    _crawl(
+        crawler,
+        _plan_attractions(crawler, info),
+        writer,
+        ATTRACTION_EXTRACTOR,
+        Session,
+        make_seen_ids(dedup),
+    )
+
+
+def ingest_all_events(
+    api_key: str,
+    segment_json: Dict[str, Dict[str, List[Dict[str, str]]]],
+    engine: Engine,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    base_url: str = BASE_URL,
+    client: Optional[HttpClient] = None,
+    Session=None,
+    start_date: Optional[datetime.datetime] = None,
+    end_date: Optional[datetime.datetime] = None,
+    batch_size: int = INGEST_BATCH_SIZE,
+    dedup: str = "set",
+    parse_workers: int = 0,
+    queue_size: int = 0,
+) -> None:
+    """
+    Fetches all events from the Ticketmaster API and upserts them straight
+    into the events table, without a CSV file.
 
     Args:
         api_key (str): The API key for accessing the Ticketmaster API.
         segment_json (Dict[str, Dict[str, List[Dict[str, str]]]]): A dictionary containing segment information.
+        engine (Engine): The SQLAlchemy engine object.
+        concurrency (int): The maximum number of requests in flight at once.
+        base_url (str): The Discovery API base URL.
+        client (HttpClient, optional): The HTTP client, the shared one by default.
+        Session: SQLAlchemy session factory. When given, the crawl is
+            checkpointed and resumes after an interruption.
+        start_date (datetime.datetime, optional): The earliest event start in UTC.
+        end_date (datetime.datetime, optional): The latest event start in UTC.
+        batch_size (int): The number of rows per upsert batch.
+        dedup (str): The seen-ID structure dropping records found in more
+            than one partition, "set" (exact) or "bloom".
+        parse_workers (int): The number of processes decoding and extracting
+            pages, 0 to parse on the calling thread.
+        queue_size (int): When > 0, upsert on a writer thread fed through a
+            queue of this many pages, so upserts overlap the crawl.
 
     Returns:
         None
     """
-    page = 0
+    crawler = Crawler(
+        api_key,
+        concurrency=concurrency,
+        base_url=base_url,
+        client=client,
+        page_parser=partial(extract_page, "events"),
+        parse_workers=parse_workers,
+    )
+    writer = database_writer("events", engine, batch_size)
+    if queue_size > 0:
+        writer = QueueWriter(writer, queue_size)
+    _crawl(
+        crawler,
+        _plan_events(crawler, segment_json, start_date, end_date),
+        writer,
+        EVENT_EXTRACTOR,
+        Session,
+        make_seen_ids(dedup),
+    )
+
+
+def refresh_stages(
+    api_key: str,
+    engine: Engine,
+    ingest: str = "direct",
+    attractions_file: str = ATTRACTIONS_CSV,
+    events_file: str = EVENTS_CSV,
+    start_date: Optional[datetime.datetime] = None,
+    end_date: Optional[datetime.datetime] = None,
+    queue_size: int = INGEST_QUEUE_SIZE,
+    base_url: str = BASE_URL,
+    **crawl,
+) -> List[Stage]:
+    """
+    Declare the stages of a full refresh for run_stages.
+
+    The attraction and event pipelines only share the classifications, so
+    they run side by side. With direct ingest, each crawl upserts through a
+    bounded queue on a writer thread; with staging files, each table is
+    loaded as soon as its own crawl is done.
+
+    Args:
+        api_key (str): The API key for accessing the Ticketmaster API.
+        engine (Engine): The SQLAlchemy engine object.
+        ingest (str): "direct" to upsert while crawling, "csv" to crawl into
+            staging files and load those.
+        attractions_file (str): The attractions staging file, for "csv".
+        events_file (str): The events staging file, for "csv".
+        start_date (datetime.datetime, optional): The earliest event start in UTC.
+        end_date (datetime.datetime, optional): The latest event start in UTC.
+        queue_size (int): The pages queued between a crawl and its writer
+            thread, for "direct".
+        base_url (str): The Discovery API base URL.
+        **crawl: Passed on to the crawl functions, e.g. ``Session``,
+            ``client``, ``dedup`` or ``parse_workers``.
+
+    Returns:
+        List[Stage]: The stages.
+
+    Raises:
+        ValueError: If ingest is neither "direct" nor "csv".
+    """
+    crawl["base_url"] = base_url
+    window = {"start_date": start_date, "end_date": end_date}
+    stages = [
+        Stage("classifications", lambda: process_json_data(api_key, base_url)),
+    ]
+    if ingest == "direct":
+        stages += [
+            Stage(
+                "ingest_attractions",
+                lambda classifications: ingest_all_attractions(
+                    api_key, classifications, engine, queue_size=queue_size, **crawl
+                ),
+                after=("classifications",),
+            ),
+            Stage(
+                "ingest_events",
+                lambda classifications: ingest_all_events(
+                    api_key,
+                    classifications,
+                    engine,
+                    queue_size=queue_size,
+                    **window,
+                    **crawl,
+                ),
+                after=("classifications",),
+            ),
+        ]
+    elif ingest == "csv":
+        stages += [
+            Stage(
+                "crawl_attractions",
+                lambda classifications: get_all_attractions(
+                    api_key, classifications, file_path=attractions_file, **crawl
+                ),
+                after=("classifications",),
+            ),
+            Stage(
+                "crawl_events",
+                lambda classifications: get_all_events(
+                    api_key, classifications, file_path=events_file, **window, **crawl
+                ),
+                after=("classifications",),
+            ),
+            Stage(
+                "load_attractions",
+                lambda crawl_attractions: process_new_data(
+                    engine, attractions_file, "attraction_id", "attractions"
+                ),
+                after=("crawl_attractions",),
+            ),
+            Stage(
+                "load_events",
+                lambda crawl_events: process_new_data(
+                    engine, events_file, "event_id", "events"
+                ),
+                after=("crawl_events",),
+            ),
+        ]
+    else:
+        raise ValueError(f"Unknown ingest mode {ingest}; use 'direct' or 'csv'.")
+    return stages
+
+
+# The model and natural key column the rows of each resource are upserted by.
+RESOURCE_TABLES = {
+    "attractions": (Attraction, "attraction_id"),
+    "events": (Event, "event_id"),
+}
+
+
+# Builds the writers of the rows derived from the rows of a table, e.g. the
+# venues, links and search entries of events and the write generations read
+# by the query cache, and the tables they write them to (the search index
+# is created along with the tables it covers).
+RESOURCE_RELATIONS = {
+    "events": (
+        (EventRelations, partial(Invalidator, "events")),
+        (Venue, EventAttraction, EventDma, CacheGeneration),
+    ),
+    "attractions": (
+        (partial(SearchIndexer, "attraction"), partial(Invalidator, "attractions")),
+        (CacheGeneration,),
+    ),
+}
+
+
+def related_writer(table_name: str) -> Optional[Callable]:
+    """
+    Build the writer of the rows derived from the rows of a table, for one
+    crawl or load. It runs every writer of the table in turn.
+
+    Args:
+        table_name (str): The name of the table, e.g. "events".
+
+    Returns:
+        Callable or None: Called with a connection and rows, or None if the
+        table has no derived rows.
+    """
+    if table_name not in RESOURCE_RELATIONS:
+        return None
+    writers = [factory() for factory in RESOURCE_RELATIONS[table_name][0]]
+
+    def write_related(connection, rows: List[Dict[str, Any]]) -> None:
+        for writer in writers:
+            writer(connection, rows)
+
+    return write_related
+
+
+def related_models(table_name: str) -> Sequence:
+    """
+    Get the models of the tables derived from the rows of a table. Their
+    columns can appear in the table's staging files.
+
+    Args:
+        table_name (str): The name of the table, e.g. "events".
+
+    Returns:
+        Sequence: The models.
+    """
+    return RESOURCE_RELATIONS.get(table_name, (None, ()))[1]
+
+
+def database_writer(
+    resource: str, engine: Engine, batch_size: int = INGEST_BATCH_SIZE
+) -> DatabaseWriter:
+    """
+    Build the writer upserting the records of a resource, and the rows
+    derived from them.
+
+    Args:
+        resource (str): "attractions" or "events".
+        engine (Engine): The SQLAlchemy engine object.
+        batch_size (int): The number of rows per upsert batch.
+
+    Returns:
+        DatabaseWriter: The writer.
+    """
+    model, key = RESOURCE_TABLES[resource]
+    return DatabaseWriter(
+        engine,
+        model,
+        key,
+        batch_size,
+        related_writer(model.__tablename__),
+        related_models(model.__tablename__),
+    )
+
+
+def publish_crawl(
+    api_key: str,
+    segment_json: Dict[str, Dict[str, List[Dict[str, str]]]],
+    engine: Engine,
+    resource: str,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    base_url: str = BASE_URL,
+    client: Optional[HttpClient] = None,
+    start_date: Optional[datetime.datetime] = None,
+    end_date: Optional[datetime.datetime] = None,
+) -> int:
+    """
+    Plan the partitions of a resource and publish them to the work queue,
+    for workers started with run_worker to crawl.
+
+    Args:
+        api_key (str): The API key for accessing the Ticketmaster API.
+        segment_json (Dict[str, Dict[str, List[Dict[str, str]]]]): A dictionary containing segment information.
+        engine (Engine): The SQLAlchemy engine object.
+        resource (str): "attractions" or "events".
+        concurrency (int): The maximum number of planner requests in flight.
+        base_url (str): The Discovery API base URL.
+        client (HttpClient, optional): The HTTP client, the shared one by default.
+        start_date (datetime.datetime, optional): The earliest event start in UTC.
+        end_date (datetime.datetime, optional): The latest event start in UTC.
+
+    Returns:
+        int: The number of partitions added to the queue.
+
+    Raises:
+        ValueError: If the resource is unknown.
+    """
+    if resource not in RESOURCE_TABLES:
+        raise ValueError(f"Unknown resource: {resource}")
+    crawler = Crawler(
+        api_key, concurrency=concurrency, base_url=base_url, client=client
+    )
+    if resource == "events":
+        partitions = _plan_events(crawler, segment_json, start_date, end_date)
+    else:
+        partitions = _plan_attractions(crawler, segment_json)
+    # Created here so that workers starting at once do not race to create it.
+    RESOURCE_TABLES[resource][0].__table__.create(engine, checkfirst=True)
+    return WorkQueue(engine, resource).publish(partitions)
+
+
+def run_worker(
+    api_key: str,
+    database_url: str,
+    resource: str,
+    worker_id: Optional[str] = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    base_url: str = BASE_URL,
+    client: Optional[HttpClient] = None,
+    rate_per_second: Optional[float] = RATE_LIMIT_PER_SECOND,
+    daily_quota: Optional[int] = DAILY_QUOTA,
+    batch_size: int = INGEST_BATCH_SIZE,
+    lease_seconds: float = WORK_LEASE_SECONDS,
+    metrics_path: Optional[str] = None,
+    trace: bool = False,
+) -> int:
+    """
+    Claim partitions from the work queue and upsert their records until no
+    partition is left to claim.
 
-    # open a csv file
-    with open("./data/raw_data/events.csv", "w", encoding="utf-8") as file:
-        file.write(
-            "name,type,event_id,event_url,event_image,event_date,event_time,timezone,segment,genre,sub_genre,currency,price_range_min,price_range_max,age_restriction,venue_name,venue_city,venue_state,venue_country,venue_address,longitude,latitude,dmas,attractions\n"
+    Workers on any machine that can reach the database may run at once;
+    every partition is crawled under a lease renewed in the background, and
+    records are upserted, so a partition crawled twice after a lost lease
+    stores each record once.
+
+    Args:
+        api_key (str): The API key for accessing the Ticketmaster API.
+        database_url (str): The SQLAlchemy URL of the shared database.
+        resource (str): The queue to work on, "attractions" or "events".
+        worker_id (str, optional): The worker name, "<hostname>:<pid>" by default.
+        concurrency (int): The maximum number of requests in flight at once.
+        base_url (str): The Discovery API base URL.
+        client (HttpClient, optional): The HTTP client. By default a client
+            limited to rate_per_second and daily_quota is created.
+        rate_per_second (float, optional): This worker's share of the rate limit.
+        daily_quota (int, optional): This worker's share of the daily quota.
+        batch_size (int): The number of rows per upsert batch.
+        lease_seconds (float): How long a claim lasts without a heartbeat.
+        metrics_path (str, optional): Write this worker's metrics next to
+            this path, as "<path>.<worker_id>" before the extension.
+        trace (bool): Record a span per crawled partition in the metrics.
+
+    Returns:
+        int: The number of partitions this worker completed.
+    """
+    worker_id = worker_id or default_worker_id()
+    if metrics_path is not None:
+        metrics = configure_metrics(trace=trace)
+    connect_args = {"timeout": 60} if database_url.startswith("sqlite") else {}
+    engine = create_engine(database_url, connect_args=connect_args)
+    if client is None:
+        client = HttpClient(rate_per_second=rate_per_second, daily_quota=daily_quota)
+    crawler = Crawler(
+        api_key, concurrency=concurrency, base_url=base_url, client=client
+    )
+    queue = WorkQueue(engine, resource, lease_seconds=lease_seconds)
+    model, key = RESOURCE_TABLES[resource]
+    seen = SeenSet()
+    completed = 0
+
+    while (claimed := queue.claim(worker_id)) is not None:
+        item_id, partition = claimed
+        failures = len(crawler.failures)
+        try:
+            with queue.lease(item_id, worker_id) as lost:
+                _crawl(
+                    crawler,
+                    [partition],
+                    database_writer(resource, engine, batch_size),
+                    EXTRACTORS[resource],
+                    seen=seen,
+                )
+        except Exception as err:
+            logger.exception("Worker %s failed on %s.", worker_id, partition.key)
+            queue.fail(item_id, worker_id, repr(err))
+            continue
+
+        if len(crawler.failures) > failures:
+            queue.fail(item_id, worker_id, "; ".join(crawler.failures[failures:]))
+        elif queue.complete(item_id, worker_id):
+            completed += 1
+        elif lost.is_set():
+            logger.info("Worker %s lost the lease of %s.", worker_id, partition.key)
+
+    logger.info("Worker %s completed %s partitions.", worker_id, completed)
+    engine.dispose()
+    if metrics_path is not None:
+        metrics.write(worker_metrics_path(metrics_path, worker_id))
+    return completed
+
+
+def worker_metrics_path(path: str, worker_id: str) -> str:
+    """
+    Get the metrics file of one worker, e.g. "metrics.host-12.json".
+
+    Args:
+        path (str): The metrics file of the run.
+        worker_id (str): The worker name.
+
+    Returns:
+        str: The path with the worker name before the extension.
+    """
+    root, extension = os.path.splitext(path)
+    name = re.sub(r"[^\w.-]", "-", worker_id)
+    return f"{root}.{name}{extension}"
+
+
+def run_workers(
+    workers: int,
+    api_key: str,
+    database_url: str,
+    resource: str,
+    rate_per_second: Optional[float] = RATE_LIMIT_PER_SECOND,
+    daily_quota: Optional[int] = DAILY_QUOTA,
+    **kwargs,
+) -> Dict[str, int]:
+    """
+    Run worker processes on this machine until the queue is drained.
+
+    The rate limit and the daily quota are split evenly between the workers,
+    so together they stay within the API key's limits.
+
+    Args:
+        workers (int): The number of worker processes.
+        api_key (str): The API key for accessing the Ticketmaster API.
+        database_url (str): The SQLAlchemy URL of the shared database.
+        resource (str): The queue to work on, "attractions" or "events".
+        rate_per_second (float, optional): The rate limit of all workers together.
+        daily_quota (int, optional): The daily quota of all workers together.
+        **kwargs: Other keyword arguments for run_worker.
+
+    Returns:
+        Dict[str, int]: The number of partitions per status afterwards.
+    """
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(
+            target=run_worker,
+            args=(api_key, database_url, resource),
+            kwargs={
+                "rate_per_second": rate_per_second and rate_per_second / workers,
+                "daily_quota": daily_quota and daily_quota // workers,
+                **kwargs,
+            },
+        )
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    engine = create_engine(database_url)
+    counts = WorkQueue(engine, resource).counts()
+    engine.dispose()
+    logger.info("%s queue: %s", resource, counts)
+    return counts
+
+
+def _read_table(
+    Session,
+    model,
+    default_columns: List[str],
+    columns: Optional[List[str]],
+    where,
+    chunksize: Optional[int],
+    joined=None,
+) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    columns = default_columns if columns is None else columns
+    table = model.__table__
+    # Columns the table does not have come from the (model, onclause) joined
+    # to it, e.g. the venue of an event.
+    sources = [table] if joined is None else [table, joined[0].__table__]
+    unknown = [
+        column
+        for column in columns
+        if not any(column in source.columns for source in sources)
+    ]
+    if unknown:
+        raise ValueError(f"Unknown {table.name} columns: {', '.join(unknown)}")
+
+    statement = select(
+        *(
+            next(s.columns[column] for s in sources if column in s.columns)
+            for column in columns
         )
+    )
+    if joined is not None:
+        statement = statement.outerjoin_from(table, joined[0].__table__, joined[1])
+    if where is not None:
+        statement = statement.where(where)
+
+    if chunksize is None:
+        session = Session()
+        try:
+            rows = session.execute(statement).all()
+        finally:
+            session.close()
+        return pd.DataFrame.from_records(rows, columns=columns)
+
+    def chunks() -> Iterator[pd.DataFrame]:
+        session = Session()
+        try:
+            result = session.execute(statement.execution_options(yield_per=chunksize))
+            for rows in result.partitions():
+                yield pd.DataFrame.from_records(rows, columns=columns)
+        finally:
+            session.close()
 
-        end_date = "2024-06-10T23:59:59Z"
-
-        for segment_info in segment_json:
-            for genres in segment_json[segment_info]["genres"]:
-                for sub_genre in genres["subgenres"]:
-
-                    segment_id = segment_info.split("-")[-1]
-                    genres_id = genres.get("id")
-                    sub_genre_id = sub_genre.get("id")
-                    page = 0
-
-                    while True:
-                        url = f"https://app.ticketmaster.com/discovery/v2/events.json?apikey={api_key}&size=200&page={page}&segmentId={segment_id}&genreId={genres_id}&subGenreId={sub_genre_id}&endDateTime={end_date}"
-                        response = requests.get(url, timeout=360)
-                        data = response.json()
-                        if "_embedded" not in data:
-                            break
-                        count = 0
-                        for event in data["_embedded"]["events"]:
-                            name = event.get("name")
-                            type = event.get("type")
-                            event_id = event.get("id")
-                            event_url = event.get("url")
-                            event_image = event.get("images", [{}])[0].get("url")
-                            event_date = (
-                                event.get("dates", {}).get("start", {}).get("localDate")
-                            )
-                            event_time = (
-                                event.get("dates", {}).get("start", {}).get("localTime")
-                            )
-                            timezone = event.get("dates", {}).get("timezone")
-                            segment = (
-                                event.get("classifications", [{}])[0]
-                                .get("segment", {})
-                                .get("name")
-                            )
-                            genre = (
-                                event.get("classifications", [{}])[0]
-                                .get("genre", {})
-                                .get("name")
-                            )
-                            sub_genre = (
-                                event.get("classifications", [{}])[0]
-                                .get("subGenre", {})
-                                .get("name")
-                            )
-                            currency = event.get("priceRanges", [{}])[0].get("currency")
-                            price_range_min = event.get("priceRanges", [{}])[0].get(
-                                "min"
-                            )
-                            price_range_max = event.get("priceRanges", [{}])[0].get(
-                                "max"
-                            )
-                            age_restriction = str(event.get("ageRestrictions"))
-                            venue_name = (
-                                event["_embedded"].get("venues", [{}])[0].get("name")
-                            )
-                            venue_city = (
-                                event["_embedded"]
-                                .get("venues", [{}])[0]
-                                .get("city", {})
-                                .get("name")
-                            )
-                            venue_state = (
-                                event["_embedded"]
-                                .get("venues", [{}])[0]
-                                .get("state", {})
-                                .get("name")
-                            )
-                            venue_country = (
-                                event["_embedded"]
-                                .get("venues", [{}])[0]
-                                .get("country", {})
-                                .get("countryCode")
-                            )
-                            venue_address = (
-                                event["_embedded"]
-                                .get("venues", [{}])[0]
-                                .get("address", {})
-                                .get("line1")
-                            )
-                            longitude = (
-                                event["_embedded"]
-                                .get("venues", [{}])[0]
-                                .get("location", {})
-                                .get("longitude")
-                            )
-                            latitude = (
-                                event["_embedded"]
-                                .get("venues", [{}])[0]
-                                .get("location", {})
-                                .get("latitude")
-                            )
-                            dmas = ", ".join(
-                                [
-                                    str(dma.get("id"))
-                                    for dma in event["_embedded"]
-                                    .get("venues", [{}])[0]
-                                    .get("dmas", [])
-                                ]
-                            )
-                            attractions = ", ".join(
-                                [
-                                    attraction.get("id")
-                                    for attraction in event["_embedded"].get(
-                                        "attractions", []
-                                    )
-                                ]
-                            )
-
-                            # Replace comma with /
-                            if name is not None and "," in name:
-                                name = name.replace(",", "/")
-                            if type is not None and "," in type:
-                                type = type.replace(",", "/")
-                            if event_id is not None and "," in event_id:
-                                event_id = event_id.replace(",", "/")
-                            if event_url is not None and "," in event_url:
-                                event_url = event_url.replace(",", "/")
-                            if event_image is not None and "," in event_image:
-                                event_image = event_image.replace(",", "/")
-                            if event_date is not None and "," in event_date:
-                                event_date = event_date.replace(",", "/")
-                            if event_time is not None and "," in event_time:
-                                event_time = event_time.replace(",", "/")
-                            if timezone is not None and "," in timezone:
-                                timezone = timezone.replace(",", "/")
-                            if segment is not None and "," in segment:
-                                segment = segment.replace(",", "/")
-                            if genre is not None and "," in genre:
-                                genre = genre.replace(",", "/")
-                            if sub_genre is not None and "," in sub_genre:
-                                sub_genre = sub_genre.replace(",", "/")
-                            if currency is not None and "," in currency:
-                                currency = currency.replace(",", "/")
-                            if age_restriction is not None and "," in age_restriction:
-                                age_restriction = age_restriction.replace(",", "/")
-                            if venue_name is not None and "," in venue_name:
-                                venue_name = venue_name.replace(",", "/")
-                            if venue_city is not None and "," in venue_city:
-                                venue_city = venue_city.replace(",", "/")
-                            if venue_state is not None and "," in venue_state:
-                                venue_state = venue_state.replace(",", "/")
-                            if venue_country is not None and "," in venue_country:
-                                venue_country = venue_country.replace(",", "/")
-                            if venue_address is not None and "," in venue_address:
-                                venue_address = venue_address.replace(",", "/")
-                            if longitude is not None and "," in longitude:
-                                longitude = longitude.replace(",", "/")
-                            if latitude is not None and "," in latitude:
-                                latitude = latitude.replace(",", "/")
-                            if dmas is not None and "," in dmas:
-                                dmas = dmas.replace(",", "/")
-                            if attractions is not None and "," in attractions:
-                                attractions = attractions.replace(",", "/")
-
-                            # write to the csv file
-                            file.write(
-                                f"{name},{type},{event_id},{event_url},{event_image},{event_date},{event_time},{timezone},{segment},{genre},{sub_genre},{currency},{price_range_min},{price_range_max},{age_restriction},{venue_name},{venue_city},{venue_state},{venue_country},{venue_address},{longitude},{latitude},{dmas},{attractions}\n"
-                            )
-
-                            count += 1
-
-                        if data["page"]["totalPages"] == page - 1:
-                            break
-
-                        logger.info(f"Page {page} done. and {count} events added.")
-                        page += 1
-
-
-def get_all_attractions_from_db(Session) -> pd.DataFrame:
-    """
-    Retrieve all attractions from the database and return them as a pandas DataFrame.
+    return chunks()
+
+
+def get_all_attractions_from_db(
+    Session,
+    columns: Optional[List[str]] = None,
+    where=None,
+    chunksize: Optional[int] = None,
+) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """
+    Retrieve attractions from the database and return them as a pandas DataFrame.
+
+    Only the requested columns are selected, and with a chunksize the rows
+    are streamed from the cursor instead of being loaded at once.
 
     Parameters:
     - Session: SQLAlchemy session object
+    - columns: the columns to select, all attraction columns by default
+    - where: an optional filter, e.g. Attraction.segment == "Music"
+    - chunksize: yield DataFrames of at most this many rows instead
 
     Returns:
-    - df: pandas DataFrame containing the attraction data
-    """
-    session = Session()
-    attractions = session.query(Attraction).all()
-
-    df = pd.DataFrame(
-        [
-            {
-                "name": attraction.name,
-                "attraction_id": attraction.attraction_id,
-                "attraction_type": attraction.attraction_type,
-                "attraction_url": attraction.attraction_url,
-                "attraction_image": attraction.attraction_image,
-                "segment": attraction.segment,
-                "genre": attraction.genre,
-                "sub_genre": attraction.sub_genre,
-            }
-            for attraction in attractions
-        ]
+    - df: pandas DataFrame containing the attraction data, or an iterator
+      of DataFrames when chunksize is given
+
+    Raises:
+    - ValueError: if a column does not exist
+    """
+    return _read_table(
+        Session, Attraction, ATTRACTION_COLUMNS, columns, where, chunksize
     )
 
-    session.close()
-    return df
 
-def get_all_events_from_db(Session) -> pd.DataFrame:
+def get_all_venues_from_db(
+    Session,
+    columns: Optional[List[str]] = None,
+    where=None,
+    chunksize: Optional[int] = None,
+) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
     """
-    Retrieve all events from the database and return them as a pandas DataFrame.
+    Retrieve venues from the database and return them as a pandas DataFrame.
 
     Parameters:
     - Session: SQLAlchemy session object
+    - columns: the columns to select, all venue columns by default
+    - where: an optional filter, e.g. Venue.venue_city == "Chicago"
+    - chunksize: yield DataFrames of at most this many rows instead
 
     Returns:
-    - df: pandas DataFrame containing the event data
-
-    """
-    session = Session()
-    events = session.query(Event).all()
-
-    df = pd.DataFrame(
-        [
-            {
-                "name": event.name,
-                "type": event.type,
-                "event_id": event.event_id,
-                "event_url": event.event_url,
-                "event_image": event.event_image,
-                "event_date": event.event_date,
-                "event_time": event.event_time,
-                "timezone": event.timezone,
-                "segment": event.segment,
-                "genre": event.genre,
-                "sub_genre": event.sub_genre,
-                "currency": event.currency,
-                "price_range_min": event.price_range_min,
-                "price_range_max": event.price_range_max,
-                "age_restriction": event.age_restriction,
-                "venue_name": event.venue_name,
-                "venue_city": event.venue_city,
-                "venue_state": event.venue_state,
-                "venue_country": event.venue_country,
-                "venue_address": event.venue_address,
-                "longitude": event.longitude,
-                "latitude": event.latitude,
-                "dmas": event.dmas,
-                "attractions": event.attractions,
-            }
-            for event in events
-        ]
+    - df: pandas DataFrame containing the venue data, or an iterator of
+      DataFrames when chunksize is given
+
+    Raises:
+    - ValueError: if a column does not exist
+    """
+    return _read_table(Session, Venue, VENUE_COLUMNS, columns, where, chunksize)
+
+
+def get_all_events_from_db(
+    Session,
+    columns: Optional[List[str]] = None,
+    where=None,
+    chunksize: Optional[int] = None,
+) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """
+    Retrieve events from the database and return them as a pandas DataFrame.
+
+    Only the requested columns are selected, and with a chunksize the rows
+    are streamed from the cursor instead of being loaded at once. The venue
+    columns are joined from the venues table.
+
+    Parameters:
+    - Session: SQLAlchemy session object
+    - columns: the columns to select, all event columns by default
+    - where: an optional filter, e.g. Event.event_date >= datetime.date.today()
+      or Venue.venue_city == "Chicago"
+    - chunksize: yield DataFrames of at most this many rows instead
+
+    Returns:
+    - df: pandas DataFrame containing the event data, or an iterator of
+      DataFrames when chunksize is given
+
+    Raises:
+    - ValueError: if a column does not exist
+    """
+    return _read_table(
+        Session,
+        Event,
+        EVENT_COLUMNS,
+        columns,
+        where,
+        chunksize,
+        (Venue, Event.venue_id == Venue.venue_id),
+    )
+
+
+def get_events_for_attraction(
+    Session,
+    attraction_id: str,
+    columns: Optional[List[str]] = None,
+    where=None,
+) -> pd.DataFrame:
+    """
+    Retrieve the events of an attraction through the event_attractions index.
+
+    Parameters:
+    - Session: SQLAlchemy session object
+    - attraction_id: the Ticketmaster attraction id
+    - columns: the columns to select, all event columns by default
+    - where: an optional extra filter, e.g. Event.event_date >= datetime.date.today()
+
+    Returns:
+    - df: pandas DataFrame containing the events
+
+    Raises:
+    - ValueError: if a column does not exist
+    """
+    linked = Event.event_id.in_(
+        select(EventAttraction.event_id).where(
+            EventAttraction.attraction_id == attraction_id
+        )
     )
+    return get_all_events_from_db(
+        Session, columns, linked if where is None else and_(linked, where)
+    )
+
 
-    session.close()
-    return df
+def get_events_for_dma(
+    Session,
+    dma_id: int,
+    columns: Optional[List[str]] = None,
+    where=None,
+) -> pd.DataFrame:
+    """
+    Retrieve the events of a DMA (designated market area) through the
+    event_dmas index.
+
+    Parameters:
+    - Session: SQLAlchemy session object
+    - dma_id: the DMA id, e.g. 345
+    - columns: the columns to select, all event columns by default
+    - where: an optional extra filter, e.g. Event.event_date >= datetime.date.today()
+
+    Returns:
+    - df: pandas DataFrame containing the events
+
+    Raises:
+    - ValueError: if a column does not exist
+    """
+    linked = Event.event_id.in_(
+        select(EventDma.event_id).where(EventDma.dma_id == dma_id)
+    )
+    return get_all_events_from_db(
+        Session, columns, linked if where is None else and_(linked, where)
+    )
@@ -0,0 +1,350 @@
+# Description: Shared HTTP client for the Ticketmaster API with connection
+# pooling, retries with jittered exponential backoff and per-key rate limiting.
+
+import email.utils
+import json
+import logging
+import random
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config.constants import (
+    BACKOFF_BASE,
+    BACKOFF_MAX,
+    DAILY_QUOTA,
+    MAX_RETRIES,
+    POOL_SIZE,
+    RATE_LIMIT_PER_SECOND,
+    REQUEST_TIMEOUT,
+    RETRY_AFTER_MAX,
+)
+from utils.cache import endpoint_of
+from utils.metrics import get_metrics
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+if TYPE_CHECKING:
+    from utils.cache import ResponseCache
+    from utils.mock_server import FixtureStore
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying: throttling and transient server errors.
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+def decode_json(body: bytes) -> Dict:
+    """
+    Decode a JSON response body, with orjson when it is installed.
+
+    Args:
+        body (bytes): The raw response body.
+
+    Returns:
+        dict: The decoded body.
+    """
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+class FetchError(ValueError):
+    """
+    Raised when a request still fails after all retries.
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def redact_url(url: str) -> str:
+    """
+    Remove the apikey query parameter from a URL so it can be logged.
+
+    Args:
+        url (str): The request URL.
+
+    Returns:
+        str: The URL without the apikey parameter.
+    """
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query) if k != "apikey"]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header given either in seconds or as an HTTP date.
+
+    Args:
+        value (str or None): The header value.
+
+    Returns:
+        float or None: The number of seconds to wait, or None if absent or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket.
+
+    Tokens refill continuously at ``rate`` per second up to ``capacity``;
+    acquire() blocks until a token is available.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _wait_time(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def acquire(self) -> None:
+        """
+        Take one token, sleeping until one is available.
+
+        Returns:
+            None
+        """
+        while True:
+            with self.lock:
+                wait = self._wait_time()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+
+class HttpClient:
+    """
+    Keeps connections alive across requests, retries throttled and failed
+    requests, and rate-limits every API key to the Ticketmaster quota.
+    A Retry-After header is honoured in full, and a request asked to wait
+    longer than ``retry_after_max`` fails at once.
+    get_json() serves and stores responses through ``cache`` when one is set.
+    """
+
+    def __init__(
+        self,
+        rate_per_second: float = RATE_LIMIT_PER_SECOND,
+        daily_quota: Optional[int] = DAILY_QUOTA,
+        max_retries: int = MAX_RETRIES,
+        backoff_base: float = BACKOFF_BASE,
+        backoff_max: float = BACKOFF_MAX,
+        retry_after_max: float = RETRY_AFTER_MAX,
+        timeout: float = REQUEST_TIMEOUT,
+        pool_size: int = POOL_SIZE,
+        cache: Optional["ResponseCache"] = None,
+        recorder: Optional["FixtureStore"] = None,
+    ) -> None:
+        self.rate_per_second = rate_per_second
+        self.daily_quota = daily_quota
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_after_max = retry_after_max
+        self.timeout = timeout
+        self.cache = cache
+        self.recorder = recorder
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._buckets: Dict[str, List[TokenBucket]] = {}
+        self._buckets_lock = threading.Lock()
+
+    def _limiters(self, url: str) -> List[TokenBucket]:
+        api_key = dict(parse_qsl(urlsplit(url).query)).get("apikey", "")
+        with self._buckets_lock:
+            if api_key not in self._buckets:
+                buckets = []
+                if self.rate_per_second:
+                    buckets.append(
+                        TokenBucket(self.rate_per_second, max(1, self.rate_per_second))
+                    )
+                if self.daily_quota:
+                    buckets.append(
+                        TokenBucket(self.daily_quota / 86400, self.daily_quota)
+                    )
+                self._buckets[api_key] = buckets
+            return self._buckets[api_key]
+
+    def _backoff(self, attempt: int, response: Optional[requests.Response]) -> float:
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                return retry_after
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    def get(self, url: str) -> requests.Response:
+        """
+        Send a GET request, retrying throttled and transient failures.
+
+        Args:
+            url (str): The request URL.
+
+        Returns:
+            requests.Response: The final response. Its status code is not
+            checked unless it is retryable.
+
+        Raises:
+            FetchError: If the request still fails after all retries.
+        """
+        metrics = get_metrics()
+        endpoint = endpoint_of(url)
+        for attempt in range(self.max_retries + 1):
+            for bucket in self._limiters(url):
+                bucket.acquire()
+
+            response = None
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as err:
+                error = f"{type(err).__name__}: {err}"
+                status = type(err).__name__
+            else:
+                error = f"Status code: {response.status_code}"
+                status = response.status_code
+            metrics.observe(
+                "http_request_seconds", time.perf_counter() - start, endpoint=endpoint
+            )
+            metrics.inc("http_requests_total", endpoint=endpoint, status=status)
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                return response
+
+            if attempt == self.max_retries:
+                break
+            delay = self._backoff(attempt, response)
+            if delay > self.retry_after_max:
+                error += f", Retry-After {delay:g}s is over {self.retry_after_max:g}s"
+                break
+            metrics.inc("http_retries_total", endpoint=endpoint)
+            logger.info(
+                "Retrying %s in %.2fs (%s, attempt %s/%s).",
+                redact_url(url),
+                delay,
+                error,
+                attempt + 1,
+                self.max_retries,
+            )
+            time.sleep(delay)
+
+        metrics.inc("http_failures_total", endpoint=endpoint)
+        logger.info("Error: Giving up on %s. %s", redact_url(url), error)
+        raise FetchError(
+            f"Error: Unable to fetch data. {error}",
+            response.status_code if response is not None else None,
+        )
+
+    def get_body(self, url: str) -> bytes:
+        """
+        Send a GET request and return the raw body of a 200 response.
+
+        Args:
+            url (str): The request URL.
+
+        Returns:
+            bytes: The response body, from the cache when one is set.
+
+        Raises:
+            FetchError: If the request fails or does not return 200.
+        """
+        if self.cache is not None:
+            body = self.cache.get(url)
+            if body is not None:
+                # Recording covers every response the crawl uses, cached or not.
+                if self.recorder is not None:
+                    self.recorder.put(url, body)
+                return body
+
+        response = self.get(url)
+        if response.status_code != 200:
+            raise FetchError(
+                f"Error: Unable to fetch data. Status code: {response.status_code}",
+                response.status_code,
+            )
+        if self.cache is not None:
+            self.cache.put(url, response.content)
+        if self.recorder is not None:
+            self.recorder.put(url, response.content)
+        return response.content
+
+    def get_json(self, url: str) -> Dict:
+        """
+        Send a GET request and decode the JSON body of a 200 response.
+
+        Args:
+            url (str): The request URL.
+
+        Returns:
+            dict: The decoded response.
+
+        Raises:
+            FetchError: If the request fails or does not return 200.
+        """
+        return decode_json(self.get_body(url))
+
+
+_client: Optional[HttpClient] = None
+_client_lock = threading.Lock()
+
+
+def configure_client(**kwargs) -> HttpClient:
+    """
+    Replace the process-wide shared HTTP client.
+
+    Args:
+        **kwargs: Keyword arguments for HttpClient, e.g. ``cache``.
+
+    Returns:
+        HttpClient: The new shared client.
+    """
+    global _client
+    with _client_lock:
+        _client = HttpClient(**kwargs)
+        return _client
+
+
+def get_client() -> HttpClient:
+    """
+    Return the process-wide shared HTTP client, creating it on first use.
+
+    Returns:
+        HttpClient: The shared client.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
@@ -0,0 +1,194 @@
+# Description: Keeps the tables derived from event rows, the venues, the
+# event_attractions and event_dmas link tables and the search index, in
+# step with the events written by the ingest paths.
+
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.engine import Connection
+
+from config.db.models import EventAttraction, EventDma, Venue
+from utils.query_cache import bump_generations
+from utils.search import index_rows
+from utils.writers import column_converters, upsert_statement
+
+# Deletes and lookups per statement, well below SQLite's bound parameter
+# limit.
+_DELETE_BATCH = 500
+
+_SEPARATORS = re.compile(r"\s*[,/]\s*")
+
+
+def split_ids(value: Any) -> List[str]:
+    """
+    Split a joined ID column, e.g. Event.attractions, into its IDs.
+
+    The crawl joins IDs with ", ", and CSV staging files of older crawls
+    store them with "/" instead; both are understood.
+
+    Args:
+        value (Any): The column value; anything but a string has no IDs.
+
+    Returns:
+        List[str]: The distinct IDs, in order.
+    """
+    if not isinstance(value, str):
+        return []
+    ids = (item for item in _SEPARATORS.split(value) if item and item != "None")
+    return list(dict.fromkeys(ids))
+
+
+def event_link_rows(rows: Iterable[Dict[str, Any]]) -> Dict[str, List[Dict]]:
+    """
+    Build the link rows of some events.
+
+    Args:
+        rows (Iterable[Dict[str, Any]]): Event rows with event_id,
+            attractions and dmas.
+
+    Returns:
+        Dict[str, List[Dict]]: The rows of event_attractions and event_dmas.
+    """
+    attractions, dmas = [], []
+    for row in rows:
+        event_id = row.get("event_id")
+        if not isinstance(event_id, str):
+            continue
+        for attraction_id in split_ids(row.get("attractions")):
+            attractions.append({"event_id": event_id, "attraction_id": attraction_id})
+        for dma_id in split_ids(str(row.get("dmas"))):
+            if dma_id.isdigit():
+                dmas.append({"event_id": event_id, "dma_id": int(dma_id)})
+    return {"event_attractions": attractions, "event_dmas": dmas}
+
+
+def store_event_links(connection: Connection, rows: List[Dict[str, Any]]) -> None:
+    """
+    Replace the attraction and DMA links of some events.
+
+    Runs on the connection that wrote the events, so the links commit with
+    them.
+
+    Args:
+        connection (Connection): The connection, inside a transaction.
+        rows (List[Dict[str, Any]]): Event rows with event_id, attractions
+            and dmas.
+
+    Returns:
+        None
+    """
+    event_ids = [
+        row["event_id"] for row in rows if isinstance(row.get("event_id"), str)
+    ]
+    for start in range(0, len(event_ids), _DELETE_BATCH):
+        batch = event_ids[start : start + _DELETE_BATCH]
+        for model in (EventAttraction, EventDma):
+            connection.execute(delete(model).where(model.event_id.in_(batch)))
+
+    links = event_link_rows(rows)
+    for model in (EventAttraction, EventDma):
+        if links[model.__tablename__]:
+            connection.execute(insert(model), links[model.__tablename__])
+
+
+# The surrogate id is left to the database.
+VENUE_COLUMNS = [
+    column.name for column in Venue.__table__.columns if not column.primary_key
+]
+_VENUE_CONVERTERS = column_converters(Venue.__table__)
+
+
+def venue_rows(rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Extract the distinct venues of some event rows.
+
+    Args:
+        rows (Iterable[Dict[str, Any]]): Event rows with venue_id and the
+            venue columns.
+
+    Returns:
+        List[Dict[str, Any]]: One row per venue ID, typed for the venues
+        table; the last event row of a venue wins.
+    """
+    venues = {}
+    for row in rows:
+        venue_id = row.get("venue_id")
+        if not isinstance(venue_id, str) or venue_id in ("", "None"):
+            continue
+        venue = {}
+        for column in VENUE_COLUMNS:
+            value = row.get(column)
+            convert = _VENUE_CONVERTERS.get(column)
+            if convert is not None:
+                value = convert(value)
+            elif not isinstance(value, str) or value == "None":
+                value = None
+            venue[column] = value
+        venues[venue_id] = venue
+    return list(venues.values())
+
+
+def store_venues(
+    connection: Connection,
+    rows: List[Dict[str, Any]],
+    seen: Optional[Set[str]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Upsert the venues of some event rows. Venues that are new or changed
+    count as a write for the cached queries reading venues.
+
+    Args:
+        connection (Connection): The connection, inside a transaction.
+        rows (List[Dict[str, Any]]): Event rows with venue_id and the venue
+            columns.
+        seen (Set[str], optional): IDs of venues stored already, which are
+            skipped; the IDs stored now are added to it.
+
+    Returns:
+        List[Dict[str, Any]]: The venues upserted.
+    """
+    venues = venue_rows(rows)
+    if seen is not None:
+        venues = [venue for venue in venues if venue["venue_id"] not in seen]
+        seen.update(venue["venue_id"] for venue in venues)
+    if venues:
+        changed = _changed_venues(connection, venues)
+        statement = upsert_statement(connection.engine, Venue.__table__, "venue_id")
+        connection.execute(statement, venues)
+        if changed:
+            bump_generations(connection, "venues", changed)
+    return venues
+
+
+def _changed_venues(
+    connection: Connection, venues: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    columns = [Venue.__table__.columns[column] for column in VENUE_COLUMNS]
+    stored = {}
+    for start in range(0, len(venues), _DELETE_BATCH):
+        batch = [venue["venue_id"] for venue in venues[start : start + _DELETE_BATCH]]
+        statement = select(*columns).where(Venue.venue_id.in_(batch))
+        for row in connection.execute(statement).mappings():
+            stored[row["venue_id"]] = dict(row)
+    return [venue for venue in venues if stored.get(venue["venue_id"]) != venue]
+
+
+class EventRelations:
+    """
+    Writes the venues, the links and the search entries of event rows, as
+    the ``write_related`` hook of the events writer.
+
+    Tens of thousands of events share a few thousand venues, so a venue is
+    only upserted the first time one instance, i.e. one crawl or load, sees
+    it.
+    """
+
+    def __init__(self) -> None:
+        self.venues: Set[str] = set()
+
+    def __call__(self, connection: Connection, rows: List[Dict[str, Any]]) -> None:
+        venues = store_venues(connection, rows, self.venues)
+        store_event_links(connection, rows)
+        index_rows(connection, "event", rows)
+        index_rows(connection, "venue", venues)
@@ -0,0 +1,379 @@
+# Description: Pipeline metrics: labelled counters, gauges and histograms,
+# stage timers and optional span tracing, written to a Prometheus textfile
+# or a JSON file at the end of a run.
+
+import contextvars
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds, in seconds.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("span", default=None)
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels, extra: Labels = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+class Histogram:
+    """
+    Counts observations into cumulative buckets, as Prometheus histograms do.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """
+        Record one observation.
+
+        Args:
+            value (float): The observed value.
+
+        Returns:
+            None
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """
+        Get the cumulative count of every bucket, the last one being "+Inf".
+
+        Returns:
+            List[Tuple[str, int]]: (upper bound, count) pairs.
+        """
+        bounds = [f"{bound:g}" for bound in self.buckets] + ["+Inf"]
+        return list(zip(bounds, itertools.accumulate(self.counts)))
+
+
+class Metrics:
+    """
+    Collects the metrics of one process.
+
+    Every metric is identified by a name and keyword labels, e.g.
+    ``metrics.inc("http_requests_total", endpoint="events", status=200)``.
+    All methods are thread-safe. Spans are only kept when ``trace`` is set,
+    at most ``max_spans`` of them.
+    """
+
+    def __init__(
+        self,
+        namespace: str = "ticketmaster",
+        trace: bool = False,
+        max_spans: int = 100_000,
+    ) -> None:
+        self.namespace = namespace
+        self.trace = trace
+        self.max_spans = max_spans
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.gauges: Dict[str, Dict[Labels, float]] = {}
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.spans: List[Dict] = []
+        self._span_ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """
+        Increase a counter.
+
+        Args:
+            name (str): The counter name, e.g. "rows_fetched_total".
+            value (float): The increase.
+            **labels: The labels of the series.
+
+        Returns:
+            None
+        """
+        key = _labels(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        """
+        Set a gauge.
+
+        Args:
+            name (str): The gauge name.
+            value (float): The new value.
+            **labels: The labels of the series.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.gauges.setdefault(name, {})[_labels(labels)] = value
+
+    def add(self, name: str, value: float, **labels) -> None:
+        """
+        Add to a gauge, e.g. +1 when a request starts and -1 when it ends.
+
+        Args:
+            name (str): The gauge name.
+            value (float): The change, negative to decrease the gauge.
+            **labels: The labels of the series.
+
+        Returns:
+            None
+        """
+        key = _labels(labels)
+        with self.lock:
+            series = self.gauges.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """
+        Record an observation in a histogram.
+
+        Args:
+            name (str): The histogram name, e.g. "http_request_seconds".
+            value (float): The observed value.
+            **labels: The labels of the series.
+
+        Returns:
+            None
+        """
+        key = _labels(labels)
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    def value(self, name: str, **labels) -> float:
+        """
+        Get the current value of a counter or gauge series.
+
+        Args:
+            name (str): The counter or gauge name.
+            **labels: The labels of the series.
+
+        Returns:
+            float: The value, 0 for series never recorded.
+        """
+        key = _labels(labels)
+        with self.lock:
+            for metrics in (self.counters, self.gauges):
+                if key in metrics.get(name, {}):
+                    return metrics[name][key]
+        return 0
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """
+        Observe the duration of a block, in seconds, in a histogram.
+
+        Args:
+            name (str): The histogram name.
+            **labels: The labels of the series.
+
+        Yields:
+            None
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[None]:
+        """
+        Trace a block as a span, nested in the span enclosing it.
+
+        Args:
+            name (str): The span name.
+            **attributes: Extra attributes stored with the span.
+
+        Yields:
+            None
+        """
+        if not self.trace:
+            yield
+            return
+        span_id = next(self._span_ids)
+        token = _current_span.set(span_id)
+        start = time.time()
+        error = None
+        try:
+            yield
+        except BaseException as err:
+            error = type(err).__name__
+            raise
+        finally:
+            _current_span.reset(token)
+            span = {
+                "id": span_id,
+                "parent": _current_span.get(),
+                "name": name,
+                "start": start,
+                "seconds": time.time() - start,
+                "thread": threading.current_thread().name,
+                "attributes": attributes,
+            }
+            if error is not None:
+                span["error"] = error
+            with self.lock:
+                if len(self.spans) < self.max_spans:
+                    self.spans.append(span)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Time and trace a pipeline stage, e.g. the events crawl.
+
+        Args:
+            name (str): The stage name.
+
+        Yields:
+            None
+        """
+        with self.span(name), self.timer("stage_seconds", stage=name):
+            yield
+        logger.info("Stage %s finished.", name)
+
+    def snapshot(self) -> Dict:
+        """
+        Get every metric and span as plain data.
+
+        Returns:
+            Dict: The counters, gauges, histograms and spans.
+        """
+
+        def series(metrics: Dict[str, Dict[Labels, float]]) -> Dict:
+            return {
+                name: [
+                    {"labels": dict(key), "value": value} for key, value in s.items()
+                ]
+                for name, s in metrics.items()
+            }
+
+        with self.lock:
+            return {
+                "counters": series(self.counters),
+                "gauges": series(self.gauges),
+                "histograms": {
+                    name: [
+                        {
+                            "labels": dict(key),
+                            "count": histogram.count,
+                            "sum": histogram.sum,
+                            "buckets": dict(histogram.cumulative()),
+                        }
+                        for key, histogram in s.items()
+                    ]
+                    for name, s in self.histograms.items()
+                },
+                "spans": list(self.spans),
+            }
+
+    def to_prometheus(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics, e.g. for the node exporter's textfile collector.
+        """
+        lines = []
+        with self.lock:
+            for kind, metrics in (("counter", self.counters), ("gauge", self.gauges)):
+                for name, series in sorted(metrics.items()):
+                    name = f"{self.namespace}_{name}"
+                    lines.append(f"# TYPE {name} {kind}")
+                    for key, value in series.items():
+                        lines.append(f"{name}{_format_labels(key)} {value:g}")
+            for name, series in sorted(self.histograms.items()):
+                name = f"{self.namespace}_{name}"
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    for bound, count in histogram.cumulative():
+                        labels = _format_labels(key, (("le", bound),))
+                        lines.append(f"{name}_bucket{labels} {count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum:g}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """
+        Write the metrics to a file, replacing it atomically.
+
+        Args:
+            path (str): A ".json" file for the snapshot with spans, any other
+                file (e.g. ".prom") for the Prometheus text format.
+
+        Returns:
+            None
+        """
+        if path.endswith(".json"):
+            content = json.dumps(self.snapshot(), indent=2)
+        else:
+            content = self.to_prometheus()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            file.write(content)
+        os.replace(temporary, path)
+        logger.info("Metrics written to %s.", path)
+
+
+_metrics: Optional[Metrics] = None
+_metrics_lock = threading.Lock()
+
+
+def configure_metrics(**kwargs) -> Metrics:
+    """
+    Replace the process-wide metrics.
+
+    Args:
+        **kwargs: Keyword arguments for Metrics, e.g. ``trace``.
+
+    Returns:
+        Metrics: The new process-wide metrics.
+    """
+    global _metrics
+    with _metrics_lock:
+        _metrics = Metrics(**kwargs)
+        return _metrics
+
+
+def get_metrics() -> Metrics:
+    """
+    Return the process-wide metrics, creating them on first use.
+
+    Returns:
+        Metrics: The process-wide metrics.
+    """
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = Metrics()
+    return _metrics
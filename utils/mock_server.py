@@ -0,0 +1,530 @@
+# Description: Local mock Discovery API server for offline crawls. It replays
+# responses recorded into a fixture store, or synthesizes paged events,
+# attractions and classifications, with configurable latency, errors,
+# 429 throttling and paging depth.
+#
+# Usage: python -m utils.mock_server --port 8080 --latency 0.05 --throttle-rate 0.1
+# then run the crawler with --base-url http://127.0.0.1:8080/discovery/v2.
+# Synthetic events start today (UTC), in the window the crawler requests.
+
+import argparse
+import datetime
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from functools import partial
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from config.constants import MAX_PAGING_DEPTH
+
+logger = logging.getLogger(__name__)
+
+# The classifications the server synthesizes, in the format of
+# process_json_data, and the number of records of every subgenre.
+DEFAULT_SEGMENT_JSON = {
+    "Music-S1": {
+        "genres": [
+            {
+                "id": "G1",
+                "name": "Rock",
+                "subgenres": [
+                    {"id": "SG1", "name": "Alternative"},
+                    {"id": "SG2", "name": "Punk"},
+                ],
+            },
+            {"id": "G2", "name": "Pop", "subgenres": [{"id": "SG3", "name": "Dance"}]},
+        ]
+    }
+}
+DEFAULT_RECORDS_PER_SUBGENRE = {"SG1": 450, "SG2": 30, "SG3": 0}
+
+# Event i of every subgenre starts i hours after the first event, by
+# default FIRST_EVENT, a fixed date that tests and benchmarks rely on.
+FIRST_EVENT = datetime.datetime(2024, 6, 1)
+
+
+def event_start(
+    index: int, first_event: datetime.datetime = FIRST_EVENT
+) -> datetime.datetime:
+    """
+    Get the start time of synthetic event ``index``.
+
+    Args:
+        index (int): The event index within its subgenre.
+        first_event (datetime.datetime): The start of event 0.
+
+    Returns:
+        datetime.datetime: The start time (UTC).
+    """
+    return first_event + datetime.timedelta(hours=index)
+
+
+def make_event(
+    subgenre_id: str, index: int, first_event: datetime.datetime = FIRST_EVENT
+) -> Dict:
+    """
+    Build a synthetic Discovery API event.
+
+    Args:
+        subgenre_id (str): The subgenre of the event.
+        index (int): The event index within its subgenre.
+        first_event (datetime.datetime): The start of event 0.
+
+    Returns:
+        Dict: The event as the API returns it.
+    """
+    start = event_start(index, first_event)
+    return {
+        "name": f"Event {subgenre_id}-{index}",
+        "type": "event",
+        "id": f"E-{subgenre_id}-{index}",
+        "url": f"https://example.com/e/{subgenre_id}/{index}",
+        "images": [{"url": f"https://example.com/i/{index}.jpg"}],
+        "dates": {
+            "start": {
+                "localDate": start.strftime("%Y-%m-%d"),
+                "localTime": start.strftime("%H:%M:%S"),
+                "dateTime": start.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            },
+            "timezone": "America/New_York",
+        },
+        "classifications": [
+            {
+                "segment": {"name": "Music"},
+                "genre": {"name": "Rock"},
+                "subGenre": {"name": subgenre_id},
+            }
+        ],
+        "priceRanges": [{"currency": "USD", "min": 10.0, "max": 99.5}],
+        "_embedded": {
+            "venues": [
+                {
+                    "id": f"V{index % 7}",
+                    "name": f"Venue {index % 7}",
+                    "city": {"name": "New York"},
+                    "state": {"name": "New York"},
+                    "country": {"countryCode": "US"},
+                    "address": {"line1": f"{index % 7} Main St, Suite 1"},
+                    # Venues 0.1 degrees (8.4 km) apart along a parallel.
+                    "location": {
+                        "longitude": f"{-73.99 + 0.1 * (index % 7):.2f}",
+                        "latitude": "40.75",
+                    },
+                    "dmas": [{"id": 345}, {"id": 200}],
+                }
+            ],
+            "attractions": [{"id": f"A-{subgenre_id}-{index % 5}"}],
+        },
+    }
+
+
+def make_attraction(subgenre_id: str, index: int) -> Dict:
+    """
+    Build a synthetic Discovery API attraction.
+
+    Args:
+        subgenre_id (str): The subgenre of the attraction.
+        index (int): The attraction index within its subgenre.
+
+    Returns:
+        Dict: The attraction as the API returns it.
+    """
+    return {
+        "name": f"Attraction {subgenre_id}-{index}",
+        "id": f"A-{subgenre_id}-{index}",
+        "type": "attraction",
+        "url": f"https://example.com/a/{subgenre_id}/{index}",
+        "images": [{"url": f"https://example.com/a/{index}.jpg"}],
+        "classifications": [
+            {
+                "segment": {"name": "Music"},
+                "genre": {"name": "Rock"},
+                "subGenre": {"name": subgenre_id},
+            }
+        ],
+    }
+
+
+def make_classifications(segment_json: Dict[str, Dict[str, List[Dict]]]) -> Dict:
+    """
+    Build the classifications response that process_json_data turns into
+    ``segment_json``.
+
+    Args:
+        segment_json (Dict[str, Dict[str, List[Dict]]]): Segments keyed by
+            "<name>-<id>", in the format of process_json_data.
+
+    Returns:
+        Dict: The classifications response.
+    """
+    classifications = []
+    for segment, info in segment_json.items():
+        name, segment_id = segment.rsplit("-", 1)
+        genres = [
+            {
+                "id": genre["id"],
+                "name": genre["name"],
+                "_embedded": {"subgenres": genre["subgenres"]},
+            }
+            for genre in info["genres"]
+        ]
+        classifications.append(
+            {
+                "segment": {
+                    "id": segment_id,
+                    "name": name,
+                    "_embedded": {"genres": genres},
+                }
+            }
+        )
+    return {"_embedded": {"classifications": classifications}}
+
+
+def in_window(start: datetime.datetime, query: Dict[str, str]) -> bool:
+    """
+    Check an event start against the startDateTime/endDateTime filters.
+
+    Args:
+        start (datetime.datetime): The event start.
+        query (Dict[str, str]): The request's query parameters.
+
+    Returns:
+        bool: True if the event matches the filters.
+    """
+    text = start.strftime("%Y-%m-%dT%H:%M:%SZ")
+    return query.get("startDateTime", text) <= text <= query.get("endDateTime", text)
+
+
+def fixture_key(url: str) -> str:
+    """
+    Get the key of a request in a fixture store.
+
+    The key ignores the host, the API key and the parameter order, so a
+    response recorded from the real API replays on any mock server.
+
+    Args:
+        url (str): The request URL or path.
+
+    Returns:
+        str: The key, e.g. "events.json?page=0&size=200".
+    """
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query) if k != "apikey")
+    return f"{parts.path.rstrip('/').rsplit('/', 1)[-1]}?{urlencode(query)}"
+
+
+class FixtureStore:
+    """
+    Recorded response bodies in a directory, one file per request.
+
+    HttpClient writes every response it fetches to the store given as its
+    ``recorder``; MockDiscoveryServer replays them.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, url: str) -> str:
+        digest = hashlib.sha1(fixture_key(url).encode("utf-8")).hexdigest()
+        return os.path.join(self.path, f"{digest}.json")
+
+    def put(self, url: str, body: bytes) -> None:
+        """
+        Record the body of a request.
+
+        Args:
+            url (str): The request URL.
+            body (bytes): The raw response body.
+
+        Returns:
+            None
+        """
+        file = self._file(url)
+        temporary = f"{file}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as handle:
+            handle.write(body)
+        os.replace(temporary, file)
+
+    def get(self, url: str) -> Optional[bytes]:
+        """
+        Look up the recorded body of a request.
+
+        Args:
+            url (str): The request URL or path.
+
+        Returns:
+            bytes or None: The body, or None if the request was not recorded.
+        """
+        try:
+            with open(self._file(url), "rb") as handle:
+                return handle.read()
+        except FileNotFoundError:
+            return None
+
+
+class MockDiscoveryServer(ThreadingHTTPServer):
+    """
+    A local Discovery API serving events, attractions and classifications.
+
+    Requests recorded in ``fixtures`` are replayed; the rest are answered
+    with synthetic records, ``records_per_subgenre[subGenreId]`` of them per
+    subgenre, filtered by the event date window. Every request waits
+    ``latency`` seconds, then fails with a 500 with probability
+    ``error_rate`` or is throttled with a 429 and a Retry-After header with
+    probability ``throttle_rate``. Pages beyond ``max_depth`` records get
+    the API's 400 error. Synthetic event i starts i hours after
+    ``first_event``. The attributes can be changed while the server
+    runs; ``requests`` counts the requests served.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        retry_after: float = 1.0,
+        max_depth: int = MAX_PAGING_DEPTH,
+        segment_json: Optional[Dict] = None,
+        records_per_subgenre: Optional[Dict[str, int]] = None,
+        fixtures: Optional[FixtureStore] = None,
+        seed: Optional[int] = None,
+        first_event: datetime.datetime = FIRST_EVENT,
+    ) -> None:
+        super().__init__((host, port), _MockDiscoveryHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.max_depth = max_depth
+        self.segment_json = segment_json or DEFAULT_SEGMENT_JSON
+        self.records_per_subgenre = (
+            DEFAULT_RECORDS_PER_SUBGENRE
+            if records_per_subgenre is None
+            else records_per_subgenre
+        )
+        self.fixtures = fixtures
+        self.first_event = first_event
+        self.requests = 0
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        """
+        The Discovery API base URL of this server.
+
+        Returns:
+            str: The base URL, e.g. "http://127.0.0.1:8080/discovery/v2".
+        """
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/discovery/v2"
+
+    def start(self) -> "MockDiscoveryServer":
+        """
+        Serve requests on a background thread.
+
+        Returns:
+            MockDiscoveryServer: The server itself.
+        """
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stop serving and close the socket.
+
+        Returns:
+            None
+        """
+        if self.thread is not None:
+            self.shutdown()
+            self.thread.join()
+            self.thread = None
+        self.server_close()
+
+    def __enter__(self) -> "MockDiscoveryServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def roll(self) -> float:
+        with self.lock:
+            return self.random.random()
+
+    def synthesize(self, resource: str, query: Dict[str, str]) -> tuple:
+        """
+        Build the synthetic response of a request.
+
+        Args:
+            resource (str): The endpoint, e.g. "events".
+            query (Dict[str, str]): The query parameters.
+
+        Returns:
+            tuple: The status code and the body.
+        """
+        if resource == "classifications":
+            return 200, make_classifications(self.segment_json)
+        if resource not in ("events", "attractions"):
+            return 404, {"errors": [{"code": "DIS1004"}]}
+
+        size = int(query.get("size", 20))
+        page = int(query.get("page", 0))
+        if page * size >= self.max_depth:
+            return 400, {"errors": [{"code": "DIS1035"}]}
+
+        subgenre_id = query.get("subGenreId")
+        indexes = range(self.records_per_subgenre.get(subgenre_id, 0))
+        if resource == "events":
+            indexes = [
+                i for i in indexes if in_window(event_start(i, self.first_event), query)
+            ]
+            make = partial(make_event, first_event=self.first_event)
+        else:
+            make = make_attraction
+
+        total = len(indexes)
+        start = page * size
+        records = [make(subgenre_id, i) for i in indexes[start : start + size]]
+        body = {
+            "page": {
+                "size": size,
+                "number": page,
+                "totalElements": total,
+                "totalPages": -(-total // size),
+            }
+        }
+        if records:
+            body["_embedded"] = {resource: records}
+        return 200, body
+
+
+class _MockDiscoveryHandler(BaseHTTPRequestHandler):
+    server: MockDiscoveryServer
+
+    def do_GET(self) -> None:
+        server = self.server
+        url = urlsplit(self.path)
+        query = dict(parse_qsl(url.query))
+        resource = url.path.rsplit("/", 1)[-1].split(".")[0]
+        time.sleep(server.latency)
+
+        roll = server.roll()
+        if roll < server.error_rate:
+            self.send_body(500, b'{"errors": [{"code": "DIS1000"}]}')
+            return
+        if roll < server.error_rate + server.throttle_rate:
+            self.send_body(
+                429,
+                b'{"fault": {"detail": {"errorcode": "policies.ratelimit"}}}',
+                {"Retry-After": str(server.retry_after)},
+            )
+            return
+
+        if server.fixtures is not None:
+            body = server.fixtures.get(self.path)
+            if body is not None:
+                self.send_body(200, body)
+                return
+        status, body = server.synthesize(resource, query)
+        self.send_body(status, json.dumps(body).encode("utf-8"))
+
+    def send_body(
+        self, status: int, payload: bytes, headers: Optional[Dict[str, str]] = None
+    ) -> None:
+        with self.server.lock:
+            self.server.requests += 1
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """
+    Parse the command line arguments of the mock server.
+
+    Args:
+        argv (List[str], optional): The arguments, sys.argv by default.
+
+    Returns:
+        argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Mock Ticketmaster Discovery API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--max-depth", type=int, default=MAX_PAGING_DEPTH)
+    parser.add_argument(
+        "--records",
+        type=int,
+        default=None,
+        help="Records per synthetic subgenre, instead of the defaults.",
+    )
+    parser.add_argument(
+        "--replay", default=None, help="Directory of recorded responses to replay."
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--first-event",
+        type=datetime.date.fromisoformat,
+        default=datetime.datetime.utcnow().date(),
+        help="Date (YYYY-MM-DD) of the first synthetic event, today (UTC) by "
+        "default so that the crawler's event window finds them.",
+    )
+    args = parser.parse_args(argv)
+    args.first_event = datetime.datetime.combine(args.first_event, datetime.time())
+    return args
+
+
+def main() -> None:
+    args = parse_args()
+
+    records = None
+    if args.records is not None:
+        records = {key: args.records for key in DEFAULT_RECORDS_PER_SUBGENRE}
+    server = MockDiscoveryServer(
+        args.host,
+        args.port,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        max_depth=args.max_depth,
+        records_per_subgenre=records,
+        fixtures=FixtureStore(args.replay) if args.replay else None,
+        seed=args.seed,
+        first_event=args.first_event,
+    )
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Serving the mock Discovery API at %s", server.base_url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
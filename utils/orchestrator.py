@@ -0,0 +1,120 @@
+# Description: Runs pipeline stages as a DAG: every stage starts as soon as
+# the stages it depends on have finished, and independent stages run
+# concurrently on their own threads.
+
+import logging
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, ContextManager, Dict, List, Optional, Tuple
+
+from utils.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    A pipeline stage.
+
+    ``run`` is called with the result of every stage in ``after`` as a
+    keyword argument named after that stage, e.g. a stage after
+    "classifications" is called as ``run(classifications=...)``.
+    """
+
+    name: str
+    run: Callable[..., Any]
+    after: Tuple[str, ...] = ()
+
+
+def check_stages(stages: List[Stage]) -> List[str]:
+    """
+    Validate the dependencies of some stages.
+
+    Args:
+        stages (List[Stage]): The stages.
+
+    Returns:
+        List[str]: The stage names in an order that respects the dependencies.
+
+    Raises:
+        ValueError: If a name repeats, a dependency is unknown or the
+            dependencies form a cycle.
+    """
+    names = [stage.name for stage in stages]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Stage names must be unique: {names}")
+    for stage in stages:
+        unknown = set(stage.after) - set(names)
+        if unknown:
+            raise ValueError(f"Stage {stage.name} depends on unknown stages {unknown}.")
+
+    order = []
+    remaining = {stage.name: set(stage.after) for stage in stages}
+    while remaining:
+        ready = [name for name, after in remaining.items() if not after]
+        if not ready:
+            raise ValueError(f"Stages {sorted(remaining)} depend on each other.")
+        for name in ready:
+            del remaining[name]
+            order.append(name)
+        for after in remaining.values():
+            after.difference_update(ready)
+    return order
+
+
+def run_stages(
+    stages: List[Stage],
+    wrap: Optional[Callable[[str], ContextManager]] = None,
+) -> Dict[str, Any]:
+    """
+    Run stages concurrently, each once its dependencies have finished.
+
+    If a stage fails, no further stages start; the running ones finish and
+    the first error is raised.
+
+    Args:
+        stages (List[Stage]): The stages.
+        wrap (Callable[[str], ContextManager], optional): Called with a stage
+            name to get a context manager the stage runs in, the stage timer
+            of the process-wide metrics by default.
+
+    Returns:
+        Dict[str, Any]: The result of every stage, by name.
+
+    Raises:
+        ValueError: If the dependencies are invalid.
+    """
+    check_stages(stages)
+    wrap = wrap or get_metrics().stage
+    pending = {stage.name: stage for stage in stages}
+    results: Dict[str, Any] = {}
+    errors: List[BaseException] = []
+
+    def call(stage: Stage) -> Any:
+        with wrap(stage.name):
+            return stage.run(**{name: results[name] for name in stage.after})
+
+    with ThreadPoolExecutor(max_workers=len(stages) or 1) as pool:
+        running: Dict[Future, str] = {}
+        while pending or running:
+            if not errors:
+                for name, stage in list(pending.items()):
+                    if all(after in results for after in stage.after):
+                        running[pool.submit(call, stage)] = name
+                        del pending[name]
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                if future.exception() is not None:
+                    logger.info("Stage %s failed: %s", name, future.exception())
+                    errors.append(future.exception())
+                else:
+                    results[name] = future.result()
+
+    if errors:
+        logger.info("Stages not run: %s", sorted(pending))
+        raise errors[0]
+    return results
@@ -0,0 +1,242 @@
+# Description: Partition planner that probes partition sizes, drops empty
+# partitions, splits event crawls into date windows small enough to stay
+# under the Discovery API deep-paging limit and orders them largest first.
+
+import datetime
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from config.constants import MIN_DATE_WINDOW
+from utils.crawler import Crawler, Partition, iter_partitions
+
+logger = logging.getLogger(__name__)
+
+API_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def format_api_datetime(value: datetime.datetime) -> str:
+    """
+    Format a datetime the way the Discovery API expects it.
+
+    Args:
+        value (datetime.datetime): A naive UTC datetime.
+
+    Returns:
+        str: The datetime, e.g. "2024-06-10T23:59:59Z".
+    """
+    return value.strftime(API_DATETIME_FORMAT)
+
+
+def with_window(
+    partition: Partition, start: datetime.datetime, end: datetime.datetime
+) -> Partition:
+    """
+    Restrict a partition to events starting within [start, end].
+
+    Args:
+        partition (Partition): The partition.
+        start (datetime.datetime): The window start.
+        end (datetime.datetime): The window end, inclusive.
+
+    Returns:
+        Partition: A copy of the partition with the window as query parameters.
+    """
+    params = tuple(
+        (key, value)
+        for key, value in partition.params
+        if key not in ("startDateTime", "endDateTime")
+    )
+    params += (
+        ("startDateTime", format_api_datetime(start)),
+        ("endDateTime", format_api_datetime(end)),
+    )
+    return Partition(
+        partition.resource,
+        partition.segment_id,
+        partition.genre_id,
+        partition.subgenre_id,
+        params,
+    )
+
+
+def window_of(partition: Partition) -> Tuple[datetime.datetime, datetime.datetime]:
+    """
+    Get the date window of a partition made by with_window.
+
+    Args:
+        partition (Partition): The partition.
+
+    Returns:
+        Tuple[datetime.datetime, datetime.datetime]: The window start and end.
+    """
+    params = dict(partition.params)
+    return (
+        datetime.datetime.strptime(params["startDateTime"], API_DATETIME_FORMAT),
+        datetime.datetime.strptime(params["endDateTime"], API_DATETIME_FORMAT),
+    )
+
+
+def split_window(partition: Partition) -> List[Partition]:
+    """
+    Split the date window of a partition into two halves.
+
+    Args:
+        partition (Partition): The partition.
+
+    Returns:
+        List[Partition]: The partitions covering the first and second half.
+    """
+    start, end = window_of(partition)
+    middle = start + (end - start) / 2
+    middle = middle.replace(microsecond=0)
+    return [
+        with_window(partition, start, middle),
+        with_window(partition, middle + datetime.timedelta(seconds=1), end),
+    ]
+
+
+@dataclass
+class CrawlPlan:
+    """
+    The partitions of a crawl, largest first, and their probed sizes.
+
+    Attributes:
+        partitions (List[Partition]): The non-empty partitions, by size
+            descending; partitions that could not be probed come last.
+        sizes (Dict[Partition, Optional[int]]): The record count of every
+            planned partition, None where the probe failed.
+        requests (int): The estimated number of page requests.
+        seconds (Optional[float]): The estimated crawl time, None if unknown.
+    """
+
+    partitions: List[Partition]
+    sizes: Dict[Partition, Optional[int]]
+    requests: int = 0
+    seconds: Optional[float] = None
+
+
+def plan_crawl(
+    crawler: Crawler,
+    partitions: List[Partition],
+    split: bool = False,
+    min_window: datetime.timedelta = MIN_DATE_WINDOW,
+) -> CrawlPlan:
+    """
+    Probe the size of every partition and plan the crawl.
+
+    Every round counts the current partitions concurrently with one size=1
+    request each and drops the empty ones. With ``split``, partitions made
+    by with_window that hold more than ``crawler.max_depth`` records are
+    halved and probed again; slices that still do not fit at ``min_window``
+    are kept and will be truncated. Probes go through the crawler's client,
+    so its response cache keeps the sizes between runs.
+
+    Args:
+        crawler (Crawler): The crawler used to probe the partitions.
+        partitions (List[Partition]): The partitions to plan.
+        split (bool): Whether to split date windows over the paging limit.
+        min_window (datetime.timedelta): The smallest window worth splitting.
+
+    Returns:
+        CrawlPlan: The plan.
+    """
+    pending = list(partitions)
+    sizes: Dict[Partition, Optional[int]] = {}
+    probes = 0
+    empty = 0
+    rounds = 0
+    started = time.monotonic()
+
+    while pending:
+        rounds += 1
+        probes += len(pending)
+        totals = crawler.count(pending)
+        pending = []
+        for partition, total in totals.items():
+            if total is None:
+                # Could not count it; crawl it as is rather than lose it.
+                sizes[partition] = None
+            elif total == 0:
+                empty += 1
+            elif not split or total <= crawler.max_depth:
+                sizes[partition] = total
+            else:
+                window_start, window_end = window_of(partition)
+                if window_end - window_start <= min_window:
+                    logger.info(
+                        "Partition %s holds %s records in its smallest window; "
+                        "only the first %s will be crawled.",
+                        partition.key,
+                        total,
+                        crawler.max_depth,
+                    )
+                    sizes[partition] = total
+                else:
+                    pending.extend(split_window(partition))
+
+    elapsed = time.monotonic() - started
+    ordered = sorted(
+        sizes, key=lambda p: -1 if sizes[p] is None else sizes[p], reverse=True
+    )
+    requests = sum(
+        max(1, math.ceil(min(total or 0, crawler.max_depth) / crawler.page_size))
+        for total in sizes.values()
+    )
+
+    # Pages are fetched at the rate limit or at the throughput the probes
+    # reached, whichever is slower.
+    rates = []
+    if crawler.client.rate_per_second:
+        rates.append(crawler.client.rate_per_second)
+    if probes and elapsed > 0:
+        rates.append(probes / elapsed)
+    seconds = requests / min(rates) if rates else None
+
+    plan = CrawlPlan(ordered, sizes, requests, seconds)
+    logger.info(
+        "Planned %s partitions (%s records) in %s rounds; %s of %s probed "
+        "partitions were empty. Estimated %s requests%s.",
+        len(ordered),
+        sum(total or 0 for total in sizes.values()),
+        rounds,
+        empty,
+        probes,
+        requests,
+        "" if seconds is None else f", about {seconds:.0f}s",
+    )
+    return plan
+
+
+def plan_event_partitions(
+    crawler: Crawler,
+    segment_json: Dict[str, Dict[str, List[Dict[str, str]]]],
+    start: datetime.datetime,
+    end: datetime.datetime,
+    min_window: datetime.timedelta = MIN_DATE_WINDOW,
+) -> List[Partition]:
+    """
+    Split every subgenre's date range until each slice fits the paging limit.
+
+    Empty slices are dropped, slices holding more than ``crawler.max_depth``
+    events are halved until they fit (see plan_crawl), and the slices are
+    ordered largest first.
+
+    Args:
+        crawler (Crawler): The crawler used to count the slices.
+        segment_json (Dict[str, Dict[str, List[Dict[str, str]]]]): The output of process_json_data.
+        start (datetime.datetime): The start of the crawl window.
+        end (datetime.datetime): The end of the crawl window, inclusive.
+        min_window (datetime.timedelta): The smallest window worth splitting.
+
+    Returns:
+        List[Partition]: The planned partitions, independent of each other,
+        largest first.
+    """
+    partitions = [
+        with_window(partition, start, end)
+        for partition in iter_partitions("events", segment_json)
+    ]
+    return plan_crawl(crawler, partitions, split=True, min_window=min_window).partitions
@@ -0,0 +1,277 @@
+# Description: Profiling mode for pipeline runs. Every stage gets a cProfile
+# CPU profile, wall-clock stack samples of all threads and tracemalloc
+# allocation snapshots, written as artifacts with a summary report.
+
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+from config.constants import (
+    PROFILE_SAMPLE_INTERVAL,
+    PROFILE_TOP,
+    PROFILE_TRACE_FRAMES,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class StackSampler:
+    """
+    Samples the stacks of every thread at a fixed interval.
+
+    Unlike cProfile, which only sees the thread that enabled it, the samples
+    cover the crawler's fetch threads too. Stacks are counted in the
+    collapsed format flame graph tools read: frames joined by ";", root
+    first, starting with the thread name.
+    """
+
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL) -> None:
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self) -> None:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == self._thread.ident:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                filename = os.path.basename(code.co_filename)
+                stack.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self) -> None:
+        """
+        Start sampling on a background thread.
+
+        Returns:
+            None
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop sampling.
+
+        Returns:
+            None
+        """
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        """
+        Render the samples as collapsed stacks, one "stack count" per line.
+
+        Returns:
+            str: The collapsed stacks, e.g. for flamegraph.pl or speedscope.
+        """
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+def _format_size(size: float) -> str:
+    return f"{size / 2**20:.1f} MiB"
+
+
+class StageProfiler:
+    """
+    Profiles pipeline stages into ``output_dir``.
+
+    For every stage it writes:
+
+    - ``<stage>.pstats``: the cProfile profile of the calling thread, for
+      pstats or snakeviz.
+    - ``<stage>.collapsed``: wall-clock stack samples of every thread, for
+      flame graphs.
+    - ``<stage>.allocations.txt``: the lines that allocated the most memory
+      still held at the end of the stage, with ``frames`` frames of traceback.
+
+    ``summary.json`` and ``summary.txt`` list, per stage, the wall time, the
+    peak and net traced memory, the top functions and the top allocators.
+    They are rewritten after every stage, so a run that crashes or runs out
+    of memory still leaves a report of the stages it finished. Worker
+    processes (parse workers, crawl workers) are not profiled, and the
+    memory figures of stages that run concurrently include each other's
+    allocations.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        top: int = PROFILE_TOP,
+        interval: float = PROFILE_SAMPLE_INTERVAL,
+        frames: int = PROFILE_TRACE_FRAMES,
+    ) -> None:
+        self.output_dir = output_dir
+        self.top = top
+        self.interval = interval
+        self.frames = frames
+        self.stages: Dict[str, Dict] = {}
+        # Stages may overlap; tracemalloc runs while any of them does.
+        self._tracing = 0
+        self._started_tracing = False
+        self.lock = threading.Lock()
+        os.makedirs(output_dir, exist_ok=True)
+
+    def _path(self, stage: str, suffix: str) -> str:
+        return os.path.join(self.output_dir, f"{stage}{suffix}")
+
+    @contextmanager
+    def profile(self, stage: str) -> Iterator[None]:
+        """
+        Profile a block as one stage.
+
+        Args:
+            stage (str): The stage name, used for the artifact file names.
+
+        Yields:
+            None
+        """
+        with self.lock:
+            if self._tracing == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+                self._started_tracing = True
+            self._tracing += 1
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        traced_before = tracemalloc.get_traced_memory()[0]
+        sampler = StackSampler(self.interval)
+        profiler = cProfile.Profile()
+
+        start = time.perf_counter()
+        sampler.start()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            sampler.stop()
+            seconds = time.perf_counter() - start
+            traced, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+            with self.lock:
+                self._tracing -= 1
+                if self._tracing == 0 and self._started_tracing:
+                    tracemalloc.stop()
+                    self._started_tracing = False
+            self._report(
+                stage,
+                seconds,
+                profiler,
+                sampler,
+                after.compare_to(before, "lineno"),
+                peak - traced_before,
+                traced - traced_before,
+            )
+
+    def _report(
+        self,
+        stage: str,
+        seconds: float,
+        profiler: cProfile.Profile,
+        sampler: StackSampler,
+        allocations: List[tracemalloc.StatisticDiff],
+        peak: int,
+        net: int,
+    ) -> None:
+        profiler.dump_stats(self._path(stage, ".pstats"))
+        with open(self._path(stage, ".collapsed"), "w", encoding="utf-8") as file:
+            file.write(sampler.collapsed())
+
+        top_allocations = [
+            {
+                "location": str(diff.traceback[0]),
+                "size": diff.size_diff,
+                "count": diff.count_diff,
+            }
+            for diff in allocations[: self.top]
+        ]
+        with open(self._path(stage, ".allocations.txt"), "w", encoding="utf-8") as file:
+            for diff in allocations[: self.top]:
+                file.write(f"{diff}\n")
+                for line in diff.traceback.format():
+                    file.write(f"    {line}\n")
+
+        stats = pstats.Stats(profiler)
+        functions = sorted(
+            stats.stats.items(), key=lambda item: item[1][3], reverse=True
+        )
+        top_functions = [
+            {
+                "function": f"{name} ({os.path.basename(filename)}:{line})",
+                "calls": calls,
+                "self_seconds": round(own, 4),
+                "cumulative_seconds": round(cumulative, 4),
+            }
+            for (filename, line, name), (_, calls, own, cumulative, _) in functions
+            if filename != "~"
+        ][: self.top]
+
+        summary = {
+            "seconds": round(seconds, 4),
+            "peak_traced_bytes": peak,
+            "net_traced_bytes": net,
+            "samples": sampler.samples,
+            "top_functions": top_functions,
+            "top_allocations": top_allocations,
+        }
+        with self.lock:
+            self.stages[stage] = summary
+            self._write_summary()
+        logger.info(
+            "Profiled %s: %.2fs, peak %s traced.", stage, seconds, _format_size(peak)
+        )
+
+    def _write_summary(self) -> None:
+        with open(
+            os.path.join(self.output_dir, "summary.json"), "w", encoding="utf-8"
+        ) as file:
+            json.dump(self.stages, file, indent=2)
+
+        report = io.StringIO()
+        for stage, summary in self.stages.items():
+            report.write(
+                f"== {stage}: {summary['seconds']:.2f}s, "
+                f"peak {_format_size(summary['peak_traced_bytes'])}, "
+                f"net {_format_size(summary['net_traced_bytes'])}\n"
+            )
+            report.write("  Top functions (cumulative s, self s, calls):\n")
+            for function in summary["top_functions"][:10]:
+                report.write(
+                    f"    {function['cumulative_seconds']:>9.3f} "
+                    f"{function['self_seconds']:>9.3f} {function['calls']:>9} "
+                    f"{function['function']}\n"
+                )
+            report.write("  Top allocators (size, blocks):\n")
+            for allocation in summary["top_allocations"][:10]:
+                report.write(
+                    f"    {_format_size(allocation['size']):>11} "
+                    f"{allocation['count']:>9} {allocation['location']}\n"
+                )
+        with open(
+            os.path.join(self.output_dir, "summary.txt"), "w", encoding="utf-8"
+        ) as file:
+            file.write(report.getvalue())
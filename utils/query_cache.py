@@ -0,0 +1,444 @@
+# Description: Cached read queries over the events and attractions. Results
+# are kept in a bounded LRU cache with a TTL, and stamped with the write
+# generations of the partitions they read (the events or attractions of a
+# segment in a month, or all venues). The ingest paths bump the generations
+# of the partitions they write, so a cached result is only served while
+# nothing it depends on changed.
+
+import datetime
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Set, Tuple
+
+import pandas as pd
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+
+from config.constants import QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_TTL
+from config.db.models import Attraction, CacheGeneration, Event, Venue
+from utils.metrics import get_metrics
+
+# The model, key column, segment column and date column of every table
+# whose writes are counted. A table without a segment or date column is
+# one partition in that dimension.
+PARTITIONED_TABLES = {
+    "events": (Event, "event_id", "segment", "event_date"),
+    "attractions": (Attraction, "attraction_id", "segment", None),
+    "venues": (Venue, "venue_id", None, None),
+}
+EVENT_QUERY_COLUMNS = [
+    "event_id",
+    "name",
+    "event_date",
+    "event_time",
+    "segment",
+    "genre",
+    "venue_name",
+    "venue_city",
+]
+ATTRACTION_QUERY_COLUMNS = ["attraction_id", "name", "segment", "genre", "sub_genre"]
+
+# Keys per lookup of the partitions rows are stored in.
+_LOOKUP_BATCH = 500
+_MONTH = re.compile(r"\d{4}-\d{2}")
+
+
+def _segment(value: Any) -> str:
+    return value if isinstance(value, str) else ""
+
+
+def _month(value: Any) -> str:
+    if isinstance(value, datetime.date):
+        return f"{value.year:04d}-{value.month:02d}"
+    if isinstance(value, str) and _MONTH.match(value):
+        return value[:7]
+    return ""
+
+
+def bump_generations(
+    connection: Connection, table_name: str, rows: List[Dict[str, Any]]
+) -> int:
+    """
+    Count a write to the partitions of some rows, before the rows are
+    written.
+
+    Both the partitions the rows are written to and those they are stored
+    in, if they move, are bumped, in the transaction writing the rows.
+
+    Args:
+        connection (Connection): The connection, inside a transaction.
+        table_name (str): "events", "attractions" or "venues".
+        rows (List[Dict[str, Any]]): The rows, keyed by column name.
+
+    Returns:
+        int: The number of partitions bumped.
+
+    Raises:
+        ValueError: If the database does not support upserts.
+    """
+    model, key, segment_column, date_column = PARTITIONED_TABLES[table_name]
+    columns = [column for column in (segment_column, date_column) if column]
+
+    def partition(values: Sequence[Any]) -> Tuple[str, str]:
+        named = dict(zip(columns, values))
+        month = _month(named[date_column]) if date_column else ""
+        return _segment(named.get(segment_column)), month
+
+    partitions: Set[Tuple[str, str]] = {
+        partition([row.get(column) for column in columns]) for row in rows
+    }
+
+    # Rows of a table that is one partition cannot move out of it.
+    keys = [row[key] for row in rows if isinstance(row.get(key), str) and columns]
+    stored = [getattr(model, column) for column in columns]
+    for start in range(0, len(keys), _LOOKUP_BATCH):
+        batch = keys[start : start + _LOOKUP_BATCH]
+        statement = select(*stored).where(getattr(model, key).in_(batch)).distinct()
+        partitions.update(partition(values) for values in connection.execute(statement))
+    if not partitions:
+        return 0
+
+    dialects = {"sqlite": sqlite, "postgresql": postgresql}
+    if connection.dialect.name not in dialects:
+        raise ValueError(f"Upserts are not supported for {connection.dialect.name}.")
+    statement = dialects[connection.dialect.name].insert(CacheGeneration)
+    statement = statement.on_conflict_do_update(
+        index_elements=["table_name", "segment", "month"],
+        set_={"generation": CacheGeneration.generation + 1},
+    )
+    # In a fixed order, so concurrent writers lock the rows alike.
+    connection.execute(
+        statement,
+        [
+            {"table_name": table_name, "segment": s, "month": m, "generation": 1}
+            for s, m in sorted(partitions)
+        ],
+    )
+    return len(partitions)
+
+
+class Invalidator:
+    """
+    Bumps the generations of the partitions of the rows of a table, as the
+    ``write_related`` hook of their writer.
+    """
+
+    def __init__(self, table_name: str) -> None:
+        self.table_name = table_name
+
+    def __call__(self, connection: Connection, rows: List[Dict[str, Any]]) -> None:
+        bump_generations(connection, self.table_name, rows)
+
+
+def generation(
+    connection: Connection,
+    table_name: str,
+    segment: Optional[str] = None,
+    months: Optional[Tuple[Optional[str], Optional[str]]] = None,
+) -> int:
+    """
+    Get the generation of the partitions a query reads.
+
+    The generation is the sum of the write counts of the partitions, so it
+    grows with every write to any of them.
+
+    Args:
+        connection (Connection): A connection to the database.
+        table_name (str): "events", "attractions" or "venues".
+        segment (str, optional): The segment read, all by default.
+        months (Tuple, optional): The first and last "YYYY-MM" month read,
+            either open; all months, and undated rows, by default.
+
+    Returns:
+        int: The generation.
+    """
+    statement = select(func.coalesce(func.sum(CacheGeneration.generation), 0)).where(
+        CacheGeneration.table_name == table_name
+    )
+    if segment is not None:
+        statement = statement.where(CacheGeneration.segment == _segment(segment))
+    if months is not None:
+        statement = statement.where(CacheGeneration.month != "")
+        if months[0] is not None:
+            statement = statement.where(CacheGeneration.month >= months[0])
+        if months[1] is not None:
+            statement = statement.where(CacheGeneration.month <= months[1])
+    return connection.execute(statement).scalar()
+
+
+class QueryCache:
+    """
+    Keeps the results of up to ``max_entries`` queries, evicting the least
+    recently used first.
+
+    A result is served while its generation is current and for at most
+    ``ttl`` seconds. Hits, misses, stale results and evictions are counted
+    in ``stats``.
+    """
+
+    def __init__(
+        self, max_entries: int = QUERY_CACHE_MAX_ENTRIES, ttl: float = QUERY_CACHE_TTL
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[Hashable, Tuple[int, float, pd.DataFrame]]" = (
+            OrderedDict()
+        )
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0}
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable, generation: int) -> Tuple[str, Optional[pd.DataFrame]]:
+        """
+        Look up the result of a query.
+
+        Args:
+            key (Hashable): The query and its arguments.
+            generation (int): The current generation of what it reads.
+
+        Returns:
+            Tuple: "hit", "miss" or "stale", and the result on a hit.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return "miss", None
+            if entry[0] != generation or entry[1] <= time.monotonic():
+                del self.entries[key]
+                self.stats["stale"] += 1
+                return "stale", None
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return "hit", entry[2]
+
+    def put(self, key: Hashable, generation: int, result: pd.DataFrame) -> None:
+        """
+        Store the result of a query.
+
+        Args:
+            key (Hashable): The query and its arguments.
+            generation (int): The generation of what it read.
+            result (pd.DataFrame): The result.
+
+        Returns:
+            None
+        """
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (generation, time.monotonic() + self.ttl, result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+                get_metrics().inc("query_cache_evictions_total")
+
+    def hit_rate(self) -> float:
+        """
+        Get the fraction of lookups served from the cache.
+
+        Returns:
+            float: Hits divided by lookups, 0.0 before the first lookup.
+        """
+        lookups = self.stats["hits"] + self.stats["misses"] + self.stats["stale"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    def clear(self) -> None:
+        """
+        Remove every cached result.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.entries.clear()
+
+
+_query_cache: Optional[QueryCache] = None
+_query_cache_lock = threading.Lock()
+
+
+def configure_query_cache(**kwargs) -> QueryCache:
+    """
+    Replace the process-wide query cache.
+
+    Args:
+        **kwargs: Keyword arguments for QueryCache, e.g. ``max_entries``;
+            ``max_entries=0`` turns caching off.
+
+    Returns:
+        QueryCache: The new process-wide query cache.
+    """
+    global _query_cache
+    with _query_cache_lock:
+        _query_cache = QueryCache(**kwargs)
+        return _query_cache
+
+
+def get_query_cache() -> QueryCache:
+    """
+    Return the process-wide query cache, creating it on first use.
+
+    Returns:
+        QueryCache: The process-wide query cache.
+    """
+    global _query_cache
+    if _query_cache is None:
+        with _query_cache_lock:
+            if _query_cache is None:
+                _query_cache = QueryCache()
+    return _query_cache
+
+
+def _columns(columns: Sequence[str], *tables) -> List:
+    unknown = [c for c in columns if not any(c in t.columns for t in tables)]
+    if unknown:
+        raise ValueError(f"Unknown {tables[0].name} columns: {', '.join(unknown)}")
+    return [next(t.columns[c] for t in tables if c in t.columns) for c in columns]
+
+
+def _cached_read(
+    Session,
+    key: Tuple,
+    statement,
+    columns: List[str],
+    table_name: str,
+    segment: Optional[str] = None,
+    months: Optional[Tuple[Optional[str], Optional[str]]] = None,
+    joined: Sequence[str] = (),
+) -> pd.DataFrame:
+    cache = get_query_cache()
+    start = time.perf_counter()
+    session = Session()
+    try:
+        # The generation and the rows are read in one transaction, so the
+        # rows are never newer than the generation they are stored with.
+        connection = session.connection()
+        current = generation(connection, table_name, segment, months)
+        # Every write to a joined table, e.g. a venue rename, counts too.
+        current += sum(generation(connection, joined_table) for joined_table in joined)
+        result, df = cache.get(key, current)
+        if df is None:
+            rows = connection.execute(statement).all()
+            df = pd.DataFrame.from_records(rows, columns=columns)
+            cache.put(key, current, df)
+    finally:
+        session.close()
+
+    metrics = get_metrics()
+    metrics.inc("query_cache_lookups_total", query=key[0], result=result)
+    metrics.observe("query_seconds", time.perf_counter() - start, query=key[0])
+    metrics.set("query_cache_entries", len(cache.entries))
+    # Callers may modify the frame they get; the cached one stays intact.
+    return df.copy()
+
+
+def get_upcoming_events(
+    Session,
+    segment: Optional[str] = None,
+    genre: Optional[str] = None,
+    city: Optional[str] = None,
+    start_date: Optional[datetime.date] = None,
+    end_date: Optional[datetime.date] = None,
+    columns: Optional[List[str]] = None,
+    limit: Optional[int] = 100,
+) -> pd.DataFrame:
+    """
+    Get the upcoming events, soonest first, through the query cache.
+
+    Parameters:
+    - Session: SQLAlchemy session object
+    - segment: only include events of this segment, e.g. "Music"
+    - genre: only include events of this genre, e.g. "Rock"
+    - city: only include events at venues in this city
+    - start_date: the first event date to include, today by default
+    - end_date: the last event date to include, none by default
+    - columns: the event or venue columns to select, by default the event
+      id, name, date, time, segment and genre and the venue name and city
+    - limit: return at most this many events, all if None
+
+    Returns:
+    - df: pandas DataFrame containing the events, sorted by date and time
+
+    Raises:
+    - ValueError: if a column does not exist
+    """
+    columns = EVENT_QUERY_COLUMNS if columns is None else columns
+    start_date = datetime.date.today() if start_date is None else start_date
+    statement = (
+        select(*_columns(columns, Event.__table__, Venue.__table__))
+        .outerjoin_from(Event, Venue, Event.venue_id == Venue.venue_id)
+        .where(Event.event_date >= start_date)
+        .order_by(Event.event_date, Event.event_time, Event.event_id)
+        .limit(limit)
+    )
+    if end_date is not None:
+        statement = statement.where(Event.event_date <= end_date)
+    if segment is not None:
+        statement = statement.where(Event.segment == segment)
+    if genre is not None:
+        statement = statement.where(Event.genre == genre)
+    if city is not None:
+        statement = statement.where(Venue.venue_city == city)
+
+    key = (
+        "upcoming_events",
+        segment,
+        genre,
+        city,
+        start_date,
+        end_date,
+        tuple(columns),
+        limit,
+    )
+    months = (_month(start_date), _month(end_date) if end_date else None)
+    return _cached_read(
+        Session, key, statement, columns, "events", segment, months, ("venues",)
+    )
+
+
+def get_attractions(
+    Session,
+    attraction_ids: Optional[Sequence[str]] = None,
+    segment: Optional[str] = None,
+    genre: Optional[str] = None,
+    columns: Optional[List[str]] = None,
+    limit: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Look up attractions by ID or classification through the query cache.
+
+    Parameters:
+    - Session: SQLAlchemy session object
+    - attraction_ids: only include these attractions
+    - segment: only include attractions of this segment, e.g. "Music"
+    - genre: only include attractions of this genre, e.g. "Rock"
+    - columns: the attraction columns to select, by default the ID, name
+      and classification
+    - limit: return at most this many attractions, all if None
+
+    Returns:
+    - df: pandas DataFrame containing the attractions, sorted by name
+
+    Raises:
+    - ValueError: if a column does not exist
+    """
+    columns = ATTRACTION_QUERY_COLUMNS if columns is None else columns
+    statement = (
+        select(*_columns(columns, Attraction.__table__))
+        .order_by(Attraction.name, Attraction.attraction_id)
+        .limit(limit)
+    )
+    if attraction_ids is not None:
+        statement = statement.where(Attraction.attraction_id.in_(attraction_ids))
+    if segment is not None:
+        statement = statement.where(Attraction.segment == segment)
+    if genre is not None:
+        statement = statement.where(Attraction.genre == genre)
+
+    ids = None if attraction_ids is None else tuple(sorted(attraction_ids))
+    key = ("attractions", ids, segment, genre, tuple(columns), limit)
+    return _cached_read(Session, key, statement, columns, "attractions", segment)
@@ -0,0 +1,204 @@
+# Description: Full-text search over the names of events, attractions and
+# venues and the genres of events and attractions. The ingest paths keep
+# the search_index FTS5 table in step as they write the rows; search()
+# ranks the matches with BM25 and matches the last word as a prefix, for
+# typeahead.
+
+import hashlib
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import pandas as pd
+from sqlalchemy import bindparam, column, delete, insert, table, text
+from sqlalchemy.engine import Connection
+
+# The key and name columns of the rows of every kind of entry.
+KINDS = {
+    "event": ("event_id", "name"),
+    "attraction": ("attraction_id", "name"),
+    "venue": ("venue_id", "venue_name"),
+}
+# Names weigh ten times more than genres in the ranking.
+NAME_WEIGHT = 10.0
+GENRE_WEIGHT = 1.0
+
+# Deletes per statement, well below SQLite's bound parameter limit.
+_DELETE_BATCH = 500
+_WORDS = re.compile(r"\w+")
+
+search_index = table(
+    "search_index",
+    column("rowid"),
+    column("name"),
+    column("genre"),
+    column("kind"),
+    column("key"),
+)
+
+
+def search_rowid(kind: str, key: str) -> int:
+    """
+    Get the rowid of the search entry of a row.
+
+    The rowid is derived from the key, so an entry is replaced by rowid
+    without a lookup, whatever path wrote the row.
+
+    Args:
+        kind (str): "event", "attraction" or "venue".
+        key (str): The Ticketmaster ID of the row.
+
+    Returns:
+        int: A signed 64-bit rowid.
+    """
+    digest = hashlib.blake2b(f"{kind}:{key}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def _text(value: Any) -> Optional[str]:
+    if not isinstance(value, str) or value in ("", "None", "Undefined"):
+        return None
+    return value
+
+
+def search_rows(kind: str, rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Build the search entries of some rows.
+
+    Args:
+        kind (str): "event", "attraction" or "venue".
+        rows (Iterable[Dict[str, Any]]): The rows, keyed by column name.
+
+    Returns:
+        List[Dict[str, Any]]: One entry per key; the last row of a key wins.
+    """
+    key_column, name_column = KINDS[kind]
+    entries = {}
+    for row in rows:
+        key = _text(row.get(key_column))
+        if key is None:
+            continue
+        genres = (_text(row.get(c)) for c in ("segment", "genre", "sub_genre"))
+        entries[key] = {
+            "rowid": search_rowid(kind, key),
+            "name": _text(row.get(name_column)),
+            "genre": " ".join(dict.fromkeys(g for g in genres if g)) or None,
+            "kind": kind,
+            "key": key,
+        }
+    return list(entries.values())
+
+
+def index_rows(connection: Connection, kind: str, rows: List[Dict[str, Any]]) -> int:
+    """
+    Add or replace the search entries of some rows.
+
+    Runs on the connection that wrote the rows, so the entries commit with
+    them. Does nothing on databases other than SQLite.
+
+    Args:
+        connection (Connection): The connection, inside a transaction.
+        kind (str): "event", "attraction" or "venue".
+        rows (List[Dict[str, Any]]): The rows, keyed by column name.
+
+    Returns:
+        int: The number of entries written.
+    """
+    if connection.dialect.name != "sqlite":
+        return 0
+    # FTS5 flushes its pending terms whenever a rowid is lower than the
+    # last one inserted, so the entries go in rowid order.
+    entries = sorted(search_rows(kind, rows), key=lambda entry: entry["rowid"])
+    rowids = [entry["rowid"] for entry in entries]
+    for start in range(0, len(rowids), _DELETE_BATCH):
+        batch = rowids[start : start + _DELETE_BATCH]
+        connection.execute(delete(search_index).where(search_index.c.rowid.in_(batch)))
+    if entries:
+        connection.execute(insert(search_index), entries)
+    return len(entries)
+
+
+class SearchIndexer:
+    """
+    Indexes the rows of one kind, as the ``write_related`` hook of their
+    writer.
+    """
+
+    def __init__(self, kind: str) -> None:
+        self.kind = kind
+
+    def __call__(self, connection: Connection, rows: List[Dict[str, Any]]) -> None:
+        index_rows(connection, self.kind, rows)
+
+
+def match_query(query: str, prefix: bool = True) -> Optional[str]:
+    """
+    Turn what a user typed into an FTS5 query matching every word.
+
+    Args:
+        query (str): The search text, e.g. "taylor swi".
+        prefix (bool): Match the last word as a prefix, as while typing.
+
+    Returns:
+        str or None: The FTS5 query, e.g. '"taylor" "swi"*', or None if the
+        text has no words.
+    """
+    words = _WORDS.findall(query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    if prefix:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search(
+    Session,
+    query: str,
+    kinds: Optional[Sequence[str]] = None,
+    limit: int = 20,
+    prefix: bool = True,
+) -> pd.DataFrame:
+    """
+    Search events, attractions and venues by name and genre, best first.
+
+    Parameters:
+    - Session: SQLAlchemy session object, bound to a SQLite database
+    - query: the search text, e.g. "taylor swi"
+    - kinds: only return entries of these kinds, e.g. ["event"]
+    - limit: return at most this many entries
+    - prefix: match the last word as a prefix
+
+    Returns:
+    - df: pandas DataFrame with the kind, key (the Ticketmaster ID), name,
+      genre and BM25 score of the matches, highest score first
+
+    Raises:
+    - ValueError: if a kind is unknown
+    """
+    columns = ["kind", "key", "name", "genre", "score"]
+    unknown = set(kinds or ()) - set(KINDS)
+    if unknown:
+        raise ValueError(f"Unknown kinds: {', '.join(sorted(unknown))}")
+    match = match_query(query, prefix)
+    if match is None:
+        return pd.DataFrame(columns=columns)
+
+    kinds_filter = ""
+    params = {"match": match, "limit": limit}
+    if kinds:
+        kinds_filter = "AND kind IN :kinds"
+        params["kinds"] = list(kinds)
+    statement = text(
+        "SELECT kind, key, name, genre, "
+        f"-bm25(search_index, {NAME_WEIGHT}, {GENRE_WEIGHT}) AS score "
+        f"FROM search_index WHERE search_index MATCH :match {kinds_filter} "
+        "ORDER BY score DESC LIMIT :limit"
+    )
+    if kinds:
+        statement = statement.bindparams(bindparam("kinds", expanding=True))
+    session = Session()
+    try:
+        rows = session.execute(statement, params).all()
+    finally:
+        session.close()
+    return pd.DataFrame.from_records(rows, columns=columns)
@@ -0,0 +1,229 @@
+# Description: "Events near me" lookups. The venue_locations R*Tree narrows
+# the venues down to a bounding box around the point, the exact distance
+# filters and sorts them, and the events are joined through their indexed
+# venue_id.
+
+import datetime
+import math
+from typing import List, Optional, Tuple
+
+import pandas as pd
+from sqlalchemy import and_, column, func, literal_column, or_, select, table
+
+from config.db.models import Event, Venue
+
+EARTH_RADIUS_KM = 6371.0088
+# Kilometres per degree of latitude.
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# The venues whose events are read per query, at first and at most; the
+# batches double in between.
+NEAR_FIRST_BATCH = 16
+NEAR_MAX_BATCH = 500
+
+venue_locations = table(
+    "venue_locations",
+    column("id"),
+    column("min_latitude"),
+    column("max_latitude"),
+    column("min_longitude"),
+    column("max_longitude"),
+)
+
+
+def haversine_km(
+    lat1: Optional[float],
+    lon1: Optional[float],
+    lat2: Optional[float],
+    lon2: Optional[float],
+) -> Optional[float]:
+    """
+    Compute the great-circle distance between two points.
+
+    Args:
+        lat1 (float): The latitude of the first point, in degrees.
+        lon1 (float): The longitude of the first point, in degrees.
+        lat2 (float): The latitude of the second point, in degrees.
+        lon2 (float): The longitude of the second point, in degrees.
+
+    Returns:
+        float or None: The distance in kilometres, None if a coordinate is
+        missing.
+    """
+    if None in (lat1, lon1, lat2, lon2):
+        return None
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (
+        math.sin((phi2 - phi1) / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(
+    latitude: float, longitude: float, radius_km: float
+) -> Tuple[Tuple[float, float], List[Tuple[float, float]]]:
+    """
+    Get a box enclosing every point within a radius of a point.
+
+    Args:
+        latitude (float): The latitude of the centre, in degrees.
+        longitude (float): The longitude of the centre, in degrees.
+        radius_km (float): The radius, in kilometres.
+
+    Returns:
+        Tuple: The (min, max) latitude, and one or two (min, max) longitude
+        ranges; two when the box crosses the antimeridian.
+    """
+    delta = radius_km / KM_PER_DEGREE
+    latitudes = (max(latitude - delta, -90.0), min(latitude + delta, 90.0))
+    # sin(delta) / cos(latitude) is the sine of the widest longitude offset.
+    ratio = math.sin(math.radians(delta)) / math.cos(math.radians(latitude))
+    if latitudes[0] <= -90 or latitudes[1] >= 90 or ratio >= 1:
+        # The circle covers a pole, so every longitude.
+        return latitudes, [(-180.0, 180.0)]
+
+    delta = math.degrees(math.asin(ratio))
+    low, high = longitude - delta, longitude + delta
+    if low < -180:
+        return latitudes, [(-180.0, high), (low + 360, 180.0)]
+    if high > 180:
+        return latitudes, [(low, 180.0), (-180.0, high - 360)]
+    return latitudes, [(low, high)]
+
+
+def _unindexed(column_):
+    # SQLite's unary "+" hides the column from the planner, so it reaches
+    # the events through the venues the R*Tree found instead of scanning
+    # the events of a segment.
+    return literal_column(f"+{column_.table.name}.{column_.name}", column_.type)
+
+
+def find_events_near(
+    Session,
+    latitude: float,
+    longitude: float,
+    radius_km: float,
+    date_range: Optional[Tuple[datetime.date, datetime.date]] = None,
+    segment: Optional[str] = None,
+    columns: Optional[List[str]] = None,
+    limit: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Find the events at venues within a radius of a point, nearest first.
+
+    Parameters:
+    - Session: SQLAlchemy session object, bound to a SQLite database
+    - latitude: the latitude of the point, in degrees
+    - longitude: the longitude of the point, in degrees
+    - radius_km: the radius, in kilometres
+    - date_range: the first and last event date to include, inclusive
+    - segment: only include events of this segment, e.g. "Music"
+    - columns: the event or venue columns to select, by default the event
+      id, name, date and time and the venue id and name
+    - limit: return at most this many events
+
+    Returns:
+    - df: pandas DataFrame containing the events, with their distance in
+      kilometres as "distance_km", sorted by distance and then date
+
+    Raises:
+    - ValueError: if a coordinate or the radius is out of range, a column
+      does not exist or the database is not SQLite
+    """
+    if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+        raise ValueError(f"Invalid coordinates: {latitude}, {longitude}")
+    if radius_km <= 0:
+        raise ValueError(f"The radius must be positive, got {radius_km}.")
+    columns = (
+        ["event_id", "name", "event_date", "event_time", "venue_id", "venue_name"]
+        if columns is None
+        else columns
+    )
+    sources = (Event.__table__, Venue.__table__)
+    unknown = [c for c in columns if not any(c in s.columns for s in sources)]
+    if unknown:
+        raise ValueError(f"Unknown events columns: {', '.join(unknown)}")
+
+    (min_latitude, max_latitude), longitudes = bounding_box(
+        latitude, longitude, radius_km
+    )
+    distance = func.distance_km(latitude, longitude, Venue.latitude, Venue.longitude)
+    venues = (
+        select(Venue.venue_id, distance.label("distance_km"))
+        .select_from(venue_locations)
+        .join(Venue, Venue.id == venue_locations.c.id)
+        .where(
+            venue_locations.c.min_latitude <= max_latitude,
+            venue_locations.c.max_latitude >= min_latitude,
+            or_(
+                *(
+                    and_(
+                        venue_locations.c.min_longitude <= high,
+                        venue_locations.c.max_longitude >= low,
+                    )
+                    for low, high in longitudes
+                )
+            ),
+            distance <= radius_km,
+        )
+        .order_by("distance_km")
+    )
+    conditions = []
+    if date_range is not None:
+        conditions.append(Event.event_date.between(*date_range))
+    if segment is not None:
+        conditions.append(_unindexed(Event.segment) == segment)
+    events = (
+        select(
+            *(
+                next(s.columns[name] for s in sources if name in s.columns)
+                for name in columns
+            ),
+            Event.venue_id,
+        )
+        .join(Venue, Venue.venue_id == Event.venue_id)
+        .where(*conditions)
+    )
+
+    session = Session()
+    try:
+        connection = session.connection()
+        if connection.dialect.name != "sqlite":
+            raise ValueError(
+                f"Spatial queries are not supported for {connection.dialect.name}."
+            )
+        connection.connection.driver_connection.create_function(
+            "distance_km", 4, haversine_km, deterministic=True
+        )
+        distances = dict(connection.execute(venues).all())
+
+        # The venues are read nearest first, in growing batches, until the
+        # batches hold the limit: the events of farther venues cannot be
+        # nearer.
+        found = []
+        nearest = list(distances)
+        size = NEAR_FIRST_BATCH
+        while nearest and (limit is None or len(found) < limit):
+            batch, nearest = nearest[:size], nearest[size:]
+            size = min(size * 2, NEAR_MAX_BATCH)
+            rows = connection.execute(events.where(Event.venue_id.in_(batch)))
+            found.extend(rows.all())
+    finally:
+        session.close()
+
+    # Sort by distance, then date and time, missing ones last.
+    def order(row) -> Tuple:
+        values = row._mapping
+        return (
+            distances[row[-1]],
+            values.get("event_date") is None,
+            values.get("event_date") or datetime.date.min,
+            values.get("event_time") is None,
+            values.get("event_time") or datetime.time.min,
+        )
+
+    found.sort(key=order)
+    df = pd.DataFrame.from_records([row[:-1] for row in found[:limit]], columns=columns)
+    df["distance_km"] = [distances[row[-1]] for row in found[:limit]]
+    return df
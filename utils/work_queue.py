@@ -0,0 +1,346 @@
+# Description: Crawl work queue stored in the work_queue table. Workers in
+# any number of processes or machines sharing the database claim partitions
+# under renewable leases; expired leases are reclaimed by other workers.
+
+import datetime
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import case, delete, func, insert, or_, select, update
+from sqlalchemy.engine import Engine
+
+from config.constants import WORK_LEASE_SECONDS, WORK_MAX_ATTEMPTS
+from config.db.models import WorkItem
+from utils.crawler import Partition
+from utils.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+def default_worker_id() -> str:
+    """
+    Get an identifier of the current process that is unique across machines.
+
+    Returns:
+        str: "<hostname>:<pid>".
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def partition_to_payload(partition: Partition) -> str:
+    """
+    Serialize a partition for the work queue.
+
+    Args:
+        partition (Partition): The partition.
+
+    Returns:
+        str: The partition as JSON.
+    """
+    return json.dumps(
+        {
+            "resource": partition.resource,
+            "segment_id": partition.segment_id,
+            "genre_id": partition.genre_id,
+            "subgenre_id": partition.subgenre_id,
+            "params": [list(pair) for pair in partition.params],
+        }
+    )
+
+
+def partition_from_payload(payload: str) -> Partition:
+    """
+    Deserialize a partition stored by partition_to_payload.
+
+    Args:
+        payload (str): The partition as JSON.
+
+    Returns:
+        Partition: The partition.
+    """
+    values = json.loads(payload)
+    values["params"] = tuple(tuple(pair) for pair in values["params"])
+    return Partition(**values)
+
+
+class WorkQueue:
+    """
+    The partitions of one crawl queue, e.g. "events", and their leases.
+
+    A claim leases the oldest claimable partition to one worker for
+    ``lease_seconds``. The worker renews the lease while it crawls and
+    completes or fails the partition when it is done. A partition whose
+    lease expired is claimable again, and one claimed ``max_attempts``
+    times without completing is marked failed. Every state change is a
+    single conditional UPDATE, so concurrent workers never claim the same
+    partition twice.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        queue: str,
+        lease_seconds: float = WORK_LEASE_SECONDS,
+        max_attempts: int = WORK_MAX_ATTEMPTS,
+    ) -> None:
+        self.engine = engine
+        self.queue = queue
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        WorkItem.__table__.create(engine, checkfirst=True)
+
+    def publish(self, partitions: List[Partition]) -> int:
+        """
+        Publish the partitions of a crawl.
+
+        A queue with unfinished partitions keeps them, so workers resume an
+        interrupted crawl; a finished queue is cleared first. Failed
+        partitions are pending again, with their attempts reset, so a new
+        run retries them. Partitions that are no longer planned are removed.
+
+        Args:
+            partitions (List[Partition]): Every partition of the crawl.
+
+        Returns:
+            int: The number of partitions added.
+        """
+        keys = {partition.key for partition in partitions}
+        with self.engine.begin() as connection:
+            retried = connection.execute(
+                update(WorkItem)
+                .where(WorkItem.queue == self.queue, WorkItem.status == FAILED)
+                .values(
+                    status=PENDING,
+                    attempts=0,
+                    lease_owner=None,
+                    lease_expires_at=None,
+                    updated_at=datetime.datetime.utcnow(),
+                )
+            ).rowcount
+            unfinished = connection.scalar(
+                select(func.count())
+                .select_from(WorkItem)
+                .where(WorkItem.queue == self.queue, WorkItem.status != DONE)
+            )
+            stored = set(
+                connection.scalars(
+                    select(WorkItem.partition_key).where(WorkItem.queue == self.queue)
+                )
+            )
+            stale = stored - keys if unfinished else stored
+            if stale:
+                connection.execute(
+                    delete(WorkItem).where(
+                        WorkItem.queue == self.queue,
+                        WorkItem.partition_key.in_(stale),
+                    )
+                )
+            rows = [
+                {
+                    "queue": self.queue,
+                    "partition_key": partition.key,
+                    "payload": partition_to_payload(partition),
+                    "status": PENDING,
+                }
+                for partition in partitions
+                if partition.key not in stored - stale
+            ]
+            if rows:
+                connection.execute(insert(WorkItem), rows)
+
+        if unfinished:
+            logger.info(
+                "Resuming %s queue: %s unfinished partitions kept (%s failed "
+                "retried), %s added.",
+                self.queue,
+                unfinished,
+                retried,
+                len(rows),
+            )
+        return len(rows)
+
+    def claim(self, worker_id: str) -> Optional[Tuple[int, Partition]]:
+        """
+        Lease the next claimable partition to a worker.
+
+        Args:
+            worker_id (str): The claiming worker.
+
+        Returns:
+            Tuple[int, Partition] or None: The work item id and its partition,
+            or None when nothing is claimable.
+        """
+        now = time.time()
+        with self.engine.begin() as connection:
+            # Partitions whose leases expired too often are given up on.
+            connection.execute(
+                update(WorkItem)
+                .where(
+                    WorkItem.queue == self.queue,
+                    WorkItem.status == LEASED,
+                    WorkItem.lease_expires_at < now,
+                    WorkItem.attempts >= self.max_attempts,
+                )
+                .values(status=FAILED, last_error="Lease expired.")
+            )
+            claimable = (
+                select(WorkItem.id)
+                .where(
+                    WorkItem.queue == self.queue,
+                    or_(
+                        WorkItem.status == PENDING,
+                        (WorkItem.status == LEASED) & (WorkItem.lease_expires_at < now),
+                    ),
+                )
+                .order_by(WorkItem.id)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+                .scalar_subquery()
+            )
+            row = connection.execute(
+                update(WorkItem)
+                .where(WorkItem.id == claimable)
+                .values(
+                    status=LEASED,
+                    lease_owner=worker_id,
+                    lease_expires_at=now + self.lease_seconds,
+                    attempts=WorkItem.attempts + 1,
+                    updated_at=datetime.datetime.utcnow(),
+                )
+                .returning(WorkItem.id, WorkItem.payload)
+            ).first()
+        if row is None:
+            return None
+        return row.id, partition_from_payload(row.payload)
+
+    def _update_lease(self, item_id: int, worker_id: str, **values) -> bool:
+        values["updated_at"] = datetime.datetime.utcnow()
+        with self.engine.begin() as connection:
+            result = connection.execute(
+                update(WorkItem)
+                .where(
+                    WorkItem.id == item_id,
+                    WorkItem.status == LEASED,
+                    WorkItem.lease_owner == worker_id,
+                )
+                .values(**values)
+            )
+        return result.rowcount == 1
+
+    def heartbeat(self, item_id: int, worker_id: str) -> bool:
+        """
+        Renew a lease.
+
+        Args:
+            item_id (int): The work item id.
+            worker_id (str): The worker holding the lease.
+
+        Returns:
+            bool: False if the worker no longer holds the lease.
+        """
+        return self._update_lease(
+            item_id, worker_id, lease_expires_at=time.time() + self.lease_seconds
+        )
+
+    def complete(self, item_id: int, worker_id: str) -> bool:
+        """
+        Mark a leased partition as done.
+
+        Args:
+            item_id (int): The work item id.
+            worker_id (str): The worker holding the lease.
+
+        Returns:
+            bool: False if the worker no longer held the lease.
+        """
+        return self._update_lease(
+            item_id, worker_id, status=DONE, lease_owner=None, lease_expires_at=None
+        )
+
+    def fail(self, item_id: int, worker_id: str, error: str) -> bool:
+        """
+        Release a leased partition after an error, to be retried unless it
+        has been attempted ``max_attempts`` times.
+
+        Args:
+            item_id (int): The work item id.
+            worker_id (str): The worker holding the lease.
+            error (str): The error, kept in last_error.
+
+        Returns:
+            bool: False if the worker no longer held the lease.
+        """
+        return self._update_lease(
+            item_id,
+            worker_id,
+            status=case(
+                (WorkItem.attempts >= self.max_attempts, FAILED), else_=PENDING
+            ),
+            lease_owner=None,
+            lease_expires_at=None,
+            last_error=error[:1000],
+        )
+
+    @contextmanager
+    def lease(self, item_id: int, worker_id: str) -> Iterator[threading.Event]:
+        """
+        Renew a lease from a background thread for the duration of a block.
+
+        Args:
+            item_id (int): The work item id.
+            worker_id (str): The worker holding the lease.
+
+        Yields:
+            threading.Event: Set if the lease was lost while the block ran.
+        """
+        stop = threading.Event()
+        lost = threading.Event()
+
+        def renew() -> None:
+            while not stop.wait(self.lease_seconds / 3):
+                if not self.heartbeat(item_id, worker_id):
+                    lost.set()
+                    return
+
+        thread = threading.Thread(target=renew, daemon=True)
+        thread.start()
+        try:
+            yield lost
+        finally:
+            stop.set()
+            thread.join()
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Count the partitions of the queue by status.
+
+        Returns:
+            Dict[str, int]: The number of partitions per status.
+        """
+        with self.engine.connect() as connection:
+            rows = connection.execute(
+                select(WorkItem.status, func.count())
+                .where(WorkItem.queue == self.queue)
+                .group_by(WorkItem.status)
+            )
+            counts = {status: count for status, count in rows}
+        metrics = get_metrics()
+        for status in (PENDING, LEASED, DONE, FAILED):
+            metrics.set(
+                "work_queue_items",
+                counts.get(status, 0),
+                queue=self.queue,
+                status=status,
+            )
+        return counts
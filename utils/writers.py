@@ -0,0 +1,677 @@
+# Description: Record writers the crawler streams parsed records into:
+# CSV or Parquet staging files and batched upserts straight into the database.
+
+import datetime
+import glob
+import logging
+import math
+import os
+import queue
+import re
+import threading
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+import pandas as pd
+from sqlalchemy import Date, Float, Integer, Table, Time
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection, Engine
+
+from config.constants import (
+    INGEST_BATCH_SIZE,
+    INGEST_QUEUE_SIZE,
+    PARQUET_COMPRESSION,
+    PARQUET_ROW_GROUP_SIZE,
+    PARQUET_ROW_GROUPS_PER_PART,
+)
+from utils.metrics import get_metrics
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - pyarrow is optional
+    pa = ds = pq = None
+
+logger = logging.getLogger(__name__)
+
+
+_CSV_SPECIAL = re.compile(r'[,"\r\n]')
+
+
+def format_csv_row(record: Dict[str, Any]) -> str:
+    """
+    Format a parsed record as a CSV line, quoting values that need it.
+
+    Values holding commas, quotes or line breaks are quoted as in RFC 4180,
+    so names like "Earth, Wind & Fire" survive the staging file. (Older
+    crawls replaced those commas with "/".)
+
+    Args:
+        record (Dict[str, Any]): The record, keyed by column name.
+
+    Returns:
+        str: The CSV line, including the trailing newline.
+    """
+    values = []
+    for value in record.values():
+        value = f"{value}"
+        if _CSV_SPECIAL.search(value):
+            value = '"' + value.replace('"', '""') + '"'
+        values.append(value)
+    return ",".join(values) + "\n"
+
+
+class CsvWriter:
+    """
+    Writes records to a CSV staging file, one line per record.
+    """
+
+    def __init__(self, file_path: str, columns: List[str]) -> None:
+        self.file_path = file_path
+        self.columns = columns
+        self.rows_written = 0
+        self.file = None
+
+    def open(self, append: bool = False) -> None:
+        """
+        Open the file, truncating it unless appending to an existing one.
+
+        Args:
+            append (bool): Whether to continue an interrupted crawl's file.
+
+        Returns:
+            None
+        """
+        append = append and os.path.exists(self.file_path)
+        os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+        self.file = open(self.file_path, "a" if append else "w", encoding="utf-8")
+        if not append:
+            self.file.write(",".join(self.columns) + "\n")
+
+    def write(self, records: List[Dict[str, Any]]) -> bool:
+        """
+        Write records and flush them to the file.
+
+        Args:
+            records (List[Dict[str, Any]]): The parsed records.
+
+        Returns:
+            bool: Always True; the records are durable once this returns.
+        """
+        for record in records:
+            self.file.write(format_csv_row(record))
+        self.file.flush()
+        self.rows_written += len(records)
+        return True
+
+    def flush(self) -> None:
+        """
+        Flush buffered lines to the file.
+
+        Returns:
+            None
+        """
+        self.file.flush()
+
+    def close(self) -> None:
+        """
+        Close the file.
+
+        Returns:
+            None
+        """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def _converter(parse: Callable[[Any], Any], kind: type) -> Callable[[Any], Any]:
+    def convert(value: Any) -> Any:
+        if value is None or isinstance(value, kind):
+            return value
+        if isinstance(value, float) and math.isnan(value):
+            return None
+        if value in ("", "None"):
+            return None
+        try:
+            return parse(value)
+        except (TypeError, ValueError):
+            return None
+
+    return convert
+
+
+_CONVERTERS = {
+    Date: _converter(lambda v: datetime.date.fromisoformat(str(v)[:10]), datetime.date),
+    Time: _converter(lambda v: datetime.time.fromisoformat(str(v)), datetime.time),
+    Float: _converter(float, float),
+    Integer: _converter(int, int),
+}
+
+
+def column_converters(*tables: Table) -> Dict[str, Callable[[Any], Any]]:
+    """
+    Get the value converters of the typed (non-string) columns of tables.
+
+    Each converter turns the strings the API and the staging files carry
+    into the column's Python type, and "None", "" or unparsable values into
+    None.
+
+    Args:
+        *tables (Table): The tables; a column name in several of them takes
+            the type it has in the first.
+
+    Returns:
+        Dict[str, Callable[[Any], Any]]: The converter per column name.
+    """
+    converters = {}
+    for table in reversed(tables):
+        for column in table.columns:
+            converters.pop(column.name, None)
+            for column_type, converter in _CONVERTERS.items():
+                if isinstance(column.type, column_type):
+                    converters[column.name] = converter
+    return converters
+
+
+def has_parquet() -> bool:
+    """
+    Check whether pyarrow is installed, so Parquet staging files can be used.
+
+    Returns:
+        bool: True if pyarrow can be imported.
+    """
+    return pa is not None
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise ValueError("Parquet staging files require pyarrow to be installed.")
+
+
+def arrow_schema(table: Table, columns: List[str], related: Sequence[Table] = ()):
+    """
+    Build the Arrow schema of some columns of a table.
+
+    Args:
+        table (Table): The table.
+        columns (List[str]): The columns, in file order.
+        related (Sequence[Table]): Tables holding the columns the table
+            does not, e.g. the venue columns of staged events.
+
+    Returns:
+        pyarrow.Schema: The schema, with every column nullable.
+    """
+    _require_pyarrow()
+    types = {
+        Date: pa.date32(),
+        Time: pa.time64("us"),
+        Float: pa.float64(),
+        Integer: pa.int64(),
+    }
+    fields = []
+    for column in columns:
+        owner = next(t for t in (table, *related) if column in t.columns)
+        column_type = owner.columns[column].type
+        arrow_type = next(
+            (t for kind, t in types.items() if isinstance(column_type, kind)),
+            pa.string(),
+        )
+        fields.append(pa.field(column, arrow_type))
+    return pa.schema(fields)
+
+
+class ParquetWriter:
+    """
+    Writes records to a Parquet staging dataset: a directory of part files.
+
+    Records are buffered column by column and written as one row group per
+    ``row_group_size`` records, with typed columns and real nulls. A part
+    file is written under a hidden name and published once it holds
+    ``row_groups_per_part`` row groups, or on close(); records are durable
+    once their part is published. A resumed crawl adds new part files next
+    to the published ones. Columns the model does not have are typed after
+    the ``related`` models holding them.
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        model,
+        columns: List[str],
+        row_group_size: int = PARQUET_ROW_GROUP_SIZE,
+        compression: str = PARQUET_COMPRESSION,
+        related: Sequence = (),
+        row_groups_per_part: int = PARQUET_ROW_GROUPS_PER_PART,
+    ) -> None:
+        self.file_path = file_path
+        self.table: Table = model.__table__
+        self.related = [related_model.__table__ for related_model in related]
+        self.columns = columns
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.row_groups_per_part = row_groups_per_part
+        self.converters = {
+            column: convert
+            for column, convert in column_converters(self.table, *self.related).items()
+            if column in columns
+        }
+        self.buffer: Dict[str, List[Any]] = {column: [] for column in columns}
+        self.buffered = 0
+        self.rows_written = 0
+        self.writer = None
+        self.part_path = None
+        self.schema = None
+        self.parts = 0
+        self.row_groups = 0
+
+    def open(self, append: bool = False) -> None:
+        """
+        Prepare the dataset directory, removing the existing part files
+        unless appending. Unpublished part files of a killed crawl are
+        always removed.
+
+        Args:
+            append (bool): Whether to continue an interrupted crawl's dataset.
+
+        Returns:
+            None
+        """
+        _require_pyarrow()
+        os.makedirs(self.file_path, exist_ok=True)
+        for part in glob.glob(os.path.join(self.file_path, ".part-*.parquet")):
+            os.remove(part)
+        parts = sorted(glob.glob(os.path.join(self.file_path, "*.parquet")))
+        if not append:
+            for part in parts:
+                os.remove(part)
+            parts = []
+        self.schema = arrow_schema(self.table, self.columns, self.related)
+        self.parts = len(parts)
+
+    def _hidden_path(self) -> str:
+        # Files starting with "." are skipped when reading the dataset.
+        return os.path.join(self.file_path, "." + os.path.basename(self.part_path))
+
+    def write(self, records: List[Dict[str, Any]]) -> bool:
+        """
+        Buffer records, writing a row group once a full one is buffered.
+
+        Args:
+            records (List[Dict[str, Any]]): The parsed records.
+
+        Returns:
+            bool: True if every record written so far is in a published part.
+        """
+        for record in records:
+            for column, values in self.buffer.items():
+                value = record.get(column)
+                convert = self.converters.get(column)
+                values.append(convert(value) if convert else value)
+        self.buffered += len(records)
+        if self.buffered >= self.row_group_size:
+            self.flush()
+        return not self.buffered and self.writer is None
+
+    def flush(self) -> None:
+        """
+        Write the buffered records as one row group, publishing the part
+        file once it is full.
+
+        Returns:
+            None
+        """
+        if not self.buffered:
+            return
+        if self.writer is None:
+            self._start_part()
+        batch = pa.Table.from_pydict(self.buffer, schema=self.schema)
+        self.writer.write_table(batch, row_group_size=self.buffered)
+        self.rows_written += self.buffered
+        self.buffer = {column: [] for column in self.columns}
+        self.buffered = 0
+        self.row_groups += 1
+        if self.row_groups >= self.row_groups_per_part:
+            self._publish()
+
+    def _start_part(self) -> None:
+        self.part_path = os.path.join(self.file_path, f"part-{self.parts:05d}.parquet")
+        self.writer = pq.ParquetWriter(
+            self._hidden_path(), self.schema, compression=self.compression
+        )
+
+    def _publish(self) -> None:
+        self.writer.close()
+        self.writer = None
+        os.replace(self._hidden_path(), self.part_path)
+        self.parts += 1
+        self.row_groups = 0
+
+    def close(self) -> None:
+        """
+        Write the last row group and publish the part file.
+
+        Returns:
+            None
+        """
+        if self.schema is None:
+            return
+        self.flush()
+        if self.writer is None and not self.parts:
+            # An empty part keeps the schema of a dataset without records.
+            self._start_part()
+        if self.writer is not None:
+            self._publish()
+
+
+def read_parquet(
+    file_path: str,
+    columns: Optional[List[str]] = None,
+    chunksize: Optional[int] = None,
+) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """
+    Read a Parquet staging dataset written by ParquetWriter.
+
+    Only the requested columns are read from the files.
+
+    Args:
+        file_path (str): The dataset directory.
+        columns (List[str], optional): The columns to read, all by default.
+        chunksize (int, optional): Read the dataset in chunks of this many rows.
+
+    Returns:
+        pd.DataFrame or Iterator[pd.DataFrame]: The staged rows, or an
+        iterator over chunks of them when chunksize is given.
+    """
+    _require_pyarrow()
+    dataset = ds.dataset(file_path, format="parquet")
+    if chunksize is None:
+        return dataset.to_table(columns=columns).to_pandas()
+    return (
+        batch.to_pandas()
+        for batch in dataset.to_batches(columns=columns, batch_size=chunksize)
+        if batch.num_rows
+    )
+
+
+def upsert_statement(engine: Engine, table: Table, key: str):
+    """
+    Build an INSERT ... ON CONFLICT (key) DO UPDATE statement for a table.
+
+    Args:
+        engine (Engine): The SQLAlchemy engine object.
+        table (Table): The target table.
+        key (str): The column holding the natural key.
+
+    Returns:
+        The insert statement, to be executed with a list of records.
+
+    Raises:
+        ValueError: If the database does not support upserts.
+    """
+    dialects = {"sqlite": sqlite, "postgresql": postgresql}
+    if engine.dialect.name not in dialects:
+        raise ValueError(f"Upserts are not supported for {engine.dialect.name}.")
+
+    statement = dialects[engine.dialect.name].insert(table)
+    updates = {
+        column.name: statement.excluded[column.name]
+        for column in table.columns
+        if column.name != key and not column.primary_key
+    }
+    return statement.on_conflict_do_update(index_elements=[key], set_=updates)
+
+
+class DatabaseWriter:
+    """
+    Upserts records into a table in batches of ``batch_size``.
+
+    Every batch is one INSERT ... ON CONFLICT(key) DO UPDATE executed inside
+    its own transaction, so memory stays constant and a record seen again
+    simply updates its row. ``write_related``, when given, is called with
+    the connection and the records of every batch, with the columns the
+    table does not store, inside the same transaction and before the
+    upsert, to write rows derived from them into the ``related`` tables.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        model,
+        key: str,
+        batch_size: int = INGEST_BATCH_SIZE,
+        write_related: Optional[Callable[[Connection, List[Dict]], None]] = None,
+        related: Sequence = (),
+    ) -> None:
+        self.engine = engine
+        self.table: Table = model.__table__
+        self.key = key
+        self.batch_size = batch_size
+        self.write_related = write_related
+        self.related = [related_model.__table__ for related_model in related]
+        # Surrogate primary keys are left to the database.
+        self.columns = [
+            column.name
+            for column in self.table.columns
+            if column.name == key or not column.primary_key
+        ]
+        self.converters = {
+            column: convert
+            for column, convert in column_converters(self.table).items()
+            if column in self.columns
+        }
+        self.statement = upsert_statement(engine, self.table, key)
+        # key -> (row, record)
+        self.buffer: Dict[Any, Tuple[Dict[str, Any], Dict[str, Any]]] = {}
+        # (row, record) of the records without a key, which are all kept.
+        self.unkeyed: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+        self.rows_written = 0
+
+    def open(self, append: bool = False) -> None:
+        """
+        Make sure the table, the unique index on the key and the related
+        tables exist.
+
+        Args:
+            append (bool): Unused; rows are always upserted.
+
+        Returns:
+            None
+        """
+        with self.engine.connect() as connection:
+            if connection.dialect.name == "sqlite":
+                # pysqlite does not open transactions for DDL on its own. The
+                # write lock keeps writers opening at once, e.g. the events
+                # and attractions writers sharing related tables, from both
+                # creating a table.
+                connection.exec_driver_sql("BEGIN IMMEDIATE")
+            for table in self.related:
+                table.create(connection, checkfirst=True)
+            self.table.create(connection, checkfirst=True)
+            for index in self.table.indexes:
+                if index.unique and [c.name for c in index.columns] == [self.key]:
+                    index.create(connection, checkfirst=True)
+            connection.commit()
+
+    def write(self, records: List[Dict[str, Any]]) -> bool:
+        """
+        Buffer records, upserting the buffer once it holds a full batch.
+
+        Args:
+            records (List[Dict[str, Any]]): The parsed records.
+
+        Returns:
+            bool: True if every record written so far is committed.
+        """
+        for record in records:
+            row = {column: record.get(column) for column in self.columns}
+            for column, convert in self.converters.items():
+                row[column] = convert(row[column])
+            if record.get(self.key) is None:
+                self.unkeyed.append((row, record))
+            else:
+                # A later copy of the same key replaces the earlier one.
+                self.buffer[record[self.key]] = (row, record)
+        if len(self.buffer) + len(self.unkeyed) >= self.batch_size:
+            self.flush()
+        return not self.buffer and not self.unkeyed
+
+    def flush(self) -> None:
+        """
+        Upsert the buffered records in one transaction.
+
+        Returns:
+            None
+        """
+        buffered = [*self.buffer.values(), *self.unkeyed]
+        if not buffered:
+            return
+        rows = [row for row, _ in buffered]
+        metrics = get_metrics()
+        with metrics.timer("db_write_seconds", table=self.table.name):
+            with self.engine.begin() as connection:
+                if self.write_related is not None:
+                    records = [record for _, record in buffered]
+                    self.write_related(connection, records)
+                connection.execute(self.statement, rows)
+        metrics.inc("rows_upserted_total", len(rows), table=self.table.name)
+        self.rows_written += len(rows)
+        self.buffer = {}
+        self.unkeyed = []
+        logger.info("Upserted %s rows into %s.", len(rows), self.table.name)
+
+    def close(self) -> None:
+        """
+        Upsert whatever is still buffered.
+
+        Returns:
+            None
+        """
+        self.flush()
+
+
+class QueueWriter:
+    """
+    Hands records to another writer running on its own thread, through a
+    queue of at most ``maxsize`` pages.
+
+    The crawl keeps fetching while the inner writer, e.g. a DatabaseWriter,
+    upserts earlier pages; once the queue is full, write() blocks, so a slow
+    database throttles the crawl and memory stays bounded. The writer thread
+    records how many of the queued pages are durable, see durable_upto(). An
+    error in the writer thread is raised by the next write() or by close().
+    """
+
+    _END = object()
+
+    def __init__(self, writer, maxsize: int = INGEST_QUEUE_SIZE) -> None:
+        self.writer = writer
+        self.queue: queue.Queue = queue.Queue(maxsize)
+        self.error: Optional[BaseException] = None
+        self.queued = 0
+        self.written = 0
+        self.durable = 0
+        self.thread = None
+
+    def open(self, append: bool = False) -> None:
+        """
+        Open the inner writer and start its thread.
+
+        Args:
+            append (bool): Passed on to the inner writer.
+
+        Returns:
+            None
+        """
+        self.writer.open(append=append)
+        self.thread = threading.Thread(
+            target=self._drain, name="queue-writer", daemon=True
+        )
+        self.thread.start()
+
+    def _drain(self) -> None:
+        try:
+            while True:
+                records = self.queue.get()
+                if records is self._END:
+                    self.writer.close()
+                    return
+                self.written += 1
+                if self.writer.write(records):
+                    self.durable = self.written
+        except BaseException as err:
+            self.error = err
+            # Unblock a producer waiting for room in the queue.
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    return
+
+    def _put(self, item) -> None:
+        while True:
+            if self.error is not None:
+                raise self.error
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def write(self, records: List[Dict[str, Any]]) -> bool:
+        """
+        Queue a page of records, blocking while the queue is full.
+
+        Args:
+            records (List[Dict[str, Any]]): The parsed records.
+
+        Returns:
+            bool: True if every record queued so far is durable.
+        """
+        self._put(records)
+        self.queued += 1
+        return self.durable == self.queued
+
+    def durable_upto(self) -> int:
+        """
+        Get how many of the pages queued so far the inner writer has made
+        durable; they are the first ones, in queueing order.
+
+        Returns:
+            int: The number of durable pages.
+        """
+        return self.durable
+
+    def flush(self) -> None:
+        """
+        Do nothing; the writer thread writes as soon as records are queued.
+
+        Returns:
+            None
+        """
+
+    def close(self) -> None:
+        """
+        Wait until the inner writer has written and closed everything queued.
+
+        Returns:
+            None
+        """
+        if self.thread is None:
+            return
+        thread, self.thread = self.thread, None
+        if self.error is None:
+            self._put(self._END)
+        thread.join()
+        if self.error is not None:
+            raise self.error